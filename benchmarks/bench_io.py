@@ -0,0 +1,23 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmarks: image decoding and gray conversion
+"""
+import pylapsy as ply
+
+from common import benchmark, sequence, SIZES
+
+@benchmark(size=list(SIZES), quick=dict(size=['1MP']))
+def imread(size):
+    file = sequence(size, 1)[0]
+    return lambda : ply.utils.imread(file)
+
+@benchmark(size=list(SIZES), pyrlevel=[1, 2], 
+           quick=dict(size=['1MP'], pyrlevel=[2]))
+def imread_reduced_gray(size, pyrlevel):
+    file = sequence(size, 1)[0]
+    return lambda : ply.utils.imread_reduced_gray(file, pyrlevel)
+
+@benchmark(size=list(SIZES), quick=dict(size=['1MP']))
+def to_gray(size):
+    img = ply.utils.imread(sequence(size, 1)[0])
+    return lambda : ply.utils.to_gray(img)
@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmarks: crop computation and rendering of deshaked images
+"""
+import numpy as np
+
+import pylapsy as ply
+from pylapsy import speedup_helpers
+
+from common import (benchmark, sequence, outdir, base_image, SIZES, LENGTHS,
+                    BACKENDS)
+
+def _matrices(num, seed=0):
+    rng = np.random.default_rng(seed)
+    m = np.tile(np.eye(3)[:2], (num, 1, 1))
+    m[:, :, 2] = rng.normal(0, 10, (num, 2))
+    return m
+
+@benchmark(size=list(SIZES), quick=dict(size=['1MP']))
+def shift_image(size):
+    img = base_image(size)
+    m = _matrices(1)[0]
+    return lambda : ply.utils.shift_image(img, m)
+
+@benchmark(size=list(SIZES), quick=dict(size=['1MP']))
+def shift_crop_image(size):
+    img = base_image(size)
+    h, w = img.shape[:2]
+    m = _matrices(1)[0]
+    crop = (20, w - 20, 20, h - 20)
+    return lambda : ply.utils.shift_crop_image(img, m, crop)
+
+@benchmark(num=[100, 1000, 10000], quick=dict(num=[1000]))
+def get_crop(num):
+    m = _matrices(num)
+    dx, dy = -m[:, 0, 2], -m[:, 1, 2]
+    return lambda : ply.utils.get_crop(dx, dy, 6000, 4000)
+
+@benchmark(num=[100, 1000, 10000], quick=dict(num=[1000]))
+def get_crop_matrices(num):
+    m = _matrices(num)
+    return lambda : ply.utils.get_crop_matrices(m, 6000, 4000)
+
+@benchmark(num=LENGTHS, backend=BACKENDS, size=['1MP'], repeat=3,
+           quick=dict(num=[10], backend=['serial', 'thread']))
+def shift_crop_list(num, backend, size):
+    files = sequence(size, num)
+    w, h = SIZES[size]
+    m = _matrices(num)
+    crop = ply.utils.get_crop_matrices(m, w, h)
+    out = outdir('shift_crop_list')
+    return lambda : speedup_helpers.shift_crop_list(files, m, crop, out, 
+                                                    executor=backend)
@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmarks: shift estimation
+"""
+import pylapsy as ply
+from pylapsy import speedup_helpers
+
+from common import benchmark, sequence, SIZES, LENGTHS, BACKENDS
+
+def _grays(size, num):
+    return [ply.utils.to_gray(ply.utils.imread(f)) 
+            for f in sequence(size, num)]
+
+@benchmark(size=list(SIZES), quick=dict(size=['1MP']))
+def find_shift(size):
+    ref, gray = _grays(size, 2)
+    return lambda : ply.utils.find_shift(ref, gray)
+
+@benchmark(size=list(SIZES), pyrlevel=[0, 2], method=['lk', 'phase'],
+           quick=dict(size=['1MP'], pyrlevel=[2]))
+def find_shift_ref(size, pyrlevel, method):
+    ref_gray, gray = _grays(size, 2)
+    ref = ply.utils.prepare_shift_reference(ref_gray, pyrlevel, 
+                                            method=method)
+    return lambda : ply.utils.find_shift_ref(ref, gray)
+
+@benchmark(num=LENGTHS, backend=BACKENDS, size=['1MP'], repeat=3,
+           quick=dict(num=[10], backend=['serial', 'thread']))
+def find_shifts_fast(num, backend, size):
+    files = sequence(size, num)
+    ref = ply.utils.to_gray(ply.utils.imread(files[0]))
+    return lambda : speedup_helpers.find_shifts_fast(files, ref, pyrlevel=0,
+                                                     executor=backend)
+
+@benchmark(size=['12MP', '45MP'], backend=['thread', 'process'], repeat=3,
+           quick=dict(size=['12MP'], backend=['thread']))
+def find_shifts_fast_large(size, backend):
+    files = sequence(size, 10)
+    ref = ply.utils.to_gray(ply.utils.imread(files[0]))
+    return lambda : speedup_helpers.find_shifts_fast(files, ref, pyrlevel=2,
+                                                     executor=backend)
@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark registry, timing and benchmark data (synthetic shaky sequences)
+
+Benchmark functions are registered via :func:`benchmark`. They perform the 
+setup (e.g. creating test data) and return the callable that is timed. 
+Parameter grids are defined as keyword args of the decorator, every 
+combination is run.
+"""
+import os
+import statistics
+from itertools import product
+from time import perf_counter
+
+import cv2
+
+import pylapsy as ply
+
+#: frame sizes (width, height)
+SIZES = {'1MP' : (1224, 816),
+         '12MP' : (4240, 2832),
+         '24MP' : (6016, 4016),
+         '45MP' : (8256, 5504)}
+#: sequence lengths
+LENGTHS = [10, 100, 1000, 2000]
+#: execution backends
+BACKENDS = ['serial', 'thread', 'process']
+
+#: registered benchmarks
+BENCHMARKS = []
+#: directory for benchmark data, set by runner
+DATADIR = None
+
+class Benchmark(object):
+    """Registered benchmark function with parameter grid"""
+    def __init__(self, func, params, quick, repeat):
+        self.func = func
+        self.name = '{}.{}'.format(func.__module__.replace('bench_', ''),
+                                   func.__name__)
+        self.params = params
+        self.quick = quick
+        self.repeat = repeat
+        
+    def grid(self, quick=False):
+        """All parameter combinations"""
+        params = dict(self.params)
+        if quick:
+            params.update(self.quick)
+        keys = list(params)
+        for vals in product(*[params[k] for k in keys]):
+            yield dict(zip(keys, vals))
+
+def benchmark(quick=None, repeat=5, **params):
+    """Register benchmark function
+    
+    Parameters
+    ----------
+    quick : dict, optional
+        reduced parameter grid used in quick mode
+    repeat : int
+        number of timed calls
+    **params
+        parameter grid (name: list of values)
+    """
+    def decorator(func):
+        BENCHMARKS.append(Benchmark(func, params, quick or {}, repeat))
+        return func
+    return decorator
+
+def timeit(func, repeat=5, warmup=True):
+    """Time callable
+    
+    Returns
+    -------
+    dict
+        min, median, mean and standard deviation of runtime (s)
+    """
+    if warmup:
+        func()
+    times = []
+    for _ in range(repeat):
+        t0 = perf_counter()
+        func()
+        times.append(perf_counter() - t0)
+    return dict(min=min(times), median=statistics.median(times),
+                mean=statistics.mean(times), 
+                std=statistics.stdev(times) if repeat > 1 else 0.0,
+                repeat=repeat)
+
+def base_image(size):
+    """Test image resized to frame size"""
+    img = ply.utils.imread(ply.io.get_test_img(1))
+    return cv2.resize(img, SIZES[size], interpolation=cv2.INTER_CUBIC)
+
+def sequence(size, num):
+    """Shaky JPEG sequence of base image (frames are created on demand)
+    
+    Frames are random shifts and small rotations of :func:`base_image` 
+    (cf. :func:`pylapsy.synthetic.generate_sequence`), sequences of 
+    different length share their first frames and are reused across 
+    benchmarks (and runs, if the data directory is kept).
+    
+    Returns
+    -------
+    list
+        file paths
+    """
+    seqdir = os.path.join(DATADIR, 'seq_{}'.format(size))
+    files = [os.path.join(seqdir, 'frame_{:05d}.jpg'.format(i)) 
+             for i in range(num)]
+    if not all(os.path.exists(f) for f in files):
+        w = SIZES[size][0]
+        files, _ = ply.synthetic.generate_sequence(
+            seqdir, num, base_image(size), jitter=0.005 * w, rotation=0.1, 
+            seed=0, encode=dict(quality=90))
+    return files
+
+def outdir(name):
+    """Empty output directory in data directory"""
+    d = os.path.join(DATADIR, 'out_{}'.format(name))
+    os.makedirs(d, exist_ok=True)
+    for f in os.listdir(d):
+        os.remove(os.path.join(d, f))
+    return d
@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+"""
+Run pylapsy benchmarks and store results as JSON
+
+Examples
+--------
+Quick run (small parameter grid)::
+
+    python benchmarks/run.py --quick -o results.json
+
+Full run, only shift estimation, compare with results of other version::
+
+    python benchmarks/run.py -k shifts -o new.json --compare old.json
+
+Benchmark data (synthetic shaky JPEG sequences) is created in a temporary
+directory, use `--datadir` to keep and reuse it across runs.
+"""
+import argparse
+import datetime
+import fnmatch
+import glob
+import importlib
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+
+import cv2
+import numpy as np
+
+BASEDIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BASEDIR)
+
+import common
+import pylapsy as ply
+
+#: relative slowdown that is reported as regression
+REGRESSION_THRESHOLD = 1.1
+
+def load_benchmarks():
+    for path in sorted(glob.glob(os.path.join(BASEDIR, 'bench_*.py'))):
+        importlib.import_module(os.path.splitext(os.path.basename(path))[0])
+    return common.BENCHMARKS
+
+def git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], 
+                                       cwd=BASEDIR, 
+                                       stderr=subprocess.DEVNULL
+                                       ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def environment():
+    return dict(pylapsy=ply.__version__, 
+                git_revision=git_revision(),
+                opencv=cv2.__version__,
+                numpy=np.__version__,
+                python=platform.python_version(),
+                platform=platform.platform(),
+                cpu_count=os.cpu_count(),
+                date=datetime.datetime.now().isoformat(timespec='seconds'))
+
+def run(pattern=None, quick=False, datadir=None):
+    """Run benchmarks
+    
+    Parameters
+    ----------
+    pattern : str, optional
+        glob pattern for benchmark names (e.g. "shifts.*")
+    quick : bool
+        if True, the reduced parameter grids are used
+    datadir : str, optional
+        directory for benchmark data, temporary if None
+        
+    Returns
+    -------
+    dict
+        environment information and results
+    """
+    with tempfile.TemporaryDirectory() as tmpdir:
+        common.DATADIR = tmpdir if datadir is None else datadir
+        results = []
+        for bench in load_benchmarks():
+            if pattern is not None and not fnmatch.fnmatch(bench.name, 
+                                                           pattern):
+                continue
+            for params in bench.grid(quick):
+                func = bench.func(**params)
+                stats = common.timeit(func, bench.repeat)
+                results.append(dict(benchmark=bench.name, params=params, 
+                                    **stats))
+                print('{:<40} {:<50} {:10.6f} s'
+                      .format(bench.name, json.dumps(params), 
+                              stats['median']))
+    return dict(environment=environment(), quick=quick, results=results)
+
+def _key(result):
+    return (result['benchmark'], json.dumps(result['params'], 
+                                            sort_keys=True))
+
+def compare(new, old, threshold=REGRESSION_THRESHOLD):
+    """Print ratio of median runtimes of new and old results
+    
+    Returns
+    -------
+    list
+        results that are slower than `threshold` times the old result
+    """
+    old = {_key(r) : r for r in old['results']}
+    regressions = []
+    print('\n{:<40} {:<50} {:>10} {:>10} {:>7}'.format('benchmark', 'params',
+                                                      'old', 'new', 'ratio'))
+    for r in new['results']:
+        prev = old.get(_key(r))
+        if prev is None:
+            continue
+        ratio = r['median'] / prev['median']
+        flag = ''
+        if ratio > threshold:
+            flag = ' slower'
+            regressions.append(r)
+        elif ratio < 1 / threshold:
+            flag = ' faster'
+        print('{:<40} {:<50} {:10.6f} {:10.6f} {:7.2f}{}'
+              .format(r['benchmark'], json.dumps(r['params']), 
+                      prev['median'], r['median'], ratio, flag))
+    return regressions
+
+def main():
+    p = argparse.ArgumentParser(description='Run pylapsy benchmarks')
+    p.add_argument('-k', '--pattern', default=None,
+                   help='Only run benchmarks matching glob pattern')
+    p.add_argument('--quick', action='store_true',
+                   help='Use reduced parameter grids')
+    p.add_argument('-o', '--output', default=None,
+                   help='Output JSON file')
+    p.add_argument('--compare', default=None,
+                   help='JSON file with results to compare to')
+    p.add_argument('--datadir', default=None,
+                   help='Directory for (reusable) benchmark data')
+    args = p.parse_args()
+    pattern = args.pattern
+    if pattern is not None and not any(c in pattern for c in '*?['):
+        pattern = '*{}*'.format(pattern)
+    
+    res = run(pattern, args.quick, args.datadir)
+    if args.output is not None:
+        with open(args.output, 'w') as f:
+            json.dump(res, f, indent=1)
+    if args.compare is not None:
+        with open(args.compare) as f:
+            old = json.load(f)
+        if compare(res, old):
+            sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark: time per frame for finding shifts wrt. a reference image with
+and without precomputed reference features
+(cf. :func:`pylapsy.utils.prepare_shift_reference`)
+"""
+from time import time
+
+import cv2
+import pylapsy as ply
+
+REPEAT = 3
+UPSCALE = [1, 4, 8]
+
+def time_per_frame(func, grays):
+    t0 = time()
+    for _ in range(REPEAT):
+        for gray in grays:
+            func(gray)
+    return (time() - t0) / (REPEAT * len(grays)) * 1000
+
+if __name__=='__main__':
+    files = sorted(ply.io.get_testimg_files_deshake())[:20]
+    grays0 = [ply.utils.to_gray(ply.utils.imread(f)) for f in files]
+
+    for fac in UPSCALE:
+        grays = [cv2.resize(g, None, fx=fac, fy=fac) for g in grays0]
+        ref_gray = grays[0]
+        for pyrlevel in [0, 2]:
+            ref = ply.utils.prepare_shift_reference(ref_gray, pyrlevel)
+            t_uncached = time_per_frame(
+                lambda g: ply.utils.find_shift_pyr(ref_gray, g, pyrlevel),
+                grays)
+            t_cached = time_per_frame(
+                lambda g: ply.utils.find_shift_ref(ref, g), grays)
+            print('{}x{}, pyrlevel {}: {:.2f} ms/frame (uncached), '
+                  '{:.2f} ms/frame (cached), saved: {:.2f} ms/frame'
+                  .format(*ref_gray.shape[::-1], pyrlevel, t_uncached,
+                          t_cached, t_uncached - t_cached))
@@ -27,14 +27,25 @@ from .image import Image
 from .imagelist import ImageList
 from .image_meta_data import ImageMetaData
 from .deshaker import Deshaker
+from .speedup_helpers import ExecutorConfig
+from .transform_cache import TransformCache
+from .manifest import Manifest
+from .writers import EncodeParams, ImageWriter, VideoWriter
 
 # Modules
 from . import image
 from . import image_meta_data
 from . import io 
+from . import probe
 from . import utils
 from . import helpers
 from . import speedup_helpers
+from . import transform_cache
+from . import manifest
+from . import synthetic
+from . import timing
+from . import progress
+from . import writers
 
 # high level methods
 from .highlevel_methods import deshake
@@ -22,7 +22,47 @@ def __init__():
             lk_params = dict(winSize  = (15,15),
                              maxLevel = 2,
                              criteria = (cv2.TERM_CRITERIA_EPS | cv2.TERM_CRITERIA_COUNT, 
-                                 10, 0.03))
+                                 10, 0.03)),
+            
+            # pyrlevel: pyramid level on which shifts are estimated 
+            # refine: refine shifts on full resolution ROI (if pyrlevel > 0)
+            # refine_roi_size: size of (quadratic) ROI used for refinement
+            # pair_max_level: LK maxLevel used for shifts between neighbouring
+            # images (sequential mode), derived from pair_max_shift and the 
+            # image size if None
+            # pair_max_shift: maximum expected shift between neighbouring 
+            # images (fraction of image width)
+            # decode: full (decode full image and downscale) or reduced 
+            # (decode downscaled gray image directly, if pyrlevel > 0)
+            # method: lk (feature tracking, translation and rotation) or 
+            # phase (phase correlation, translation only)
+            # phase_pyrlevel: pyramid level used for phase correlation if 
+            # pyrlevel is unspecified
+            shift_params = dict(pyrlevel = 0,
+                                refine = False,
+                                refine_roi_size = 512,
+                                pair_max_level = None,
+                                pair_max_shift = 0.1,
+                                decode = 'full',
+                                method = 'lk',
+                                phase_pyrlevel = 2),
+            
+            # method: trajectory smoothing method (moving_average, gaussian 
+            # or savgol)
+            # window: length of smoothing window in number of images (odd)
+            # polyorder: polynomial order (only savgol)
+            smooth_params = dict(method = 'gaussian',
+                                 window = 31,
+                                 polyorder = 2),
+            
+            # interpolation and border mode used when warping images (cf. 
+            # cv2.warpAffine)
+            render_params = dict(interpolation = cv2.INTER_LINEAR,
+                                 border_mode = cv2.BORDER_CONSTANT),
+            
+            # cache_bytes: maximum memory (bytes) of decoded images kept in 
+            # the frame cache of an ImageList (0: no caching)
+            imagelist_params = dict(cache_bytes = 512 * 2**20)
 )
    
 
@@ -9,17 +9,30 @@
 # Email: jonasgliss@gmail.com 
 
 import cv2
+import json
 import numpy as np
 import os
 
-from pylapsy import utils, ImageList, logger, print_log
+from pylapsy import utils, ImageList, logger, print_log, defaults, timing
+from pylapsy.transform_cache import TransformCache, make_param_key, file_key
+from pylapsy.manifest import Manifest
+from pylapsy.writers import EncodeParams, VideoWriter
+from pylapsy.progress import ProgressTracker, ProgressLog
 from functools import partial
-from pylapsy.speedup_helpers import find_shifts_fast, shift_crop_list
+from pylapsy.speedup_helpers import (ExecutorConfig, find_shifts_fast, 
+                                     find_shifts_sequential, shift_crop_list, 
+                                     deshake_stream, shift_crop_video)
+
+#: file name of render state (stored in output directory in incremental mode)
+RENDER_STATE_FILENAME = '.pylapsy_render_state.json'
 
 class Deshaker(object):
     """Interface for deshaking a series of images
     
     """
+    #: available modes for shift estimation (cf. :func:`find_shifts`)
+    MODES = ['reference', 'sequential']
+    
     def __init__(self, imglist=None, outdir=None):
     
         self._imglist = None
@@ -34,7 +47,8 @@ class Deshaker(object):
         self.results = dict(
                 dx=None,
                 dy=None,
-                matrices=None)
+                matrices=None,
+                corrections=None)
         
     @property 
     def imglist(self):
@@ -48,7 +62,10 @@ class Deshaker(object):
         
         self._imglist = val
         
-    def find_shifts(self, ref_index=None, parallel=True):
+    def find_shifts(self, ref_index=None, parallel=True, pyrlevel=None, 
+                    refine=None, multiproc=False, executor=None, 
+                    cache=None, mode=None, keyframe_every=None, decode=None,
+                    progress=None, method=None):
         """Find shifts for all images in :attr:`imglist`
         
         Parameters
@@ -56,6 +73,62 @@ class Deshaker(object):
         ref_index : int
             index of reference image in image list (shifts are computed wrt 
             that image)
+        parallel : bool
+            if True, shifts are computed in parallel
+        pyrlevel : int, optional
+            pyramid level on which shifts are estimated (cf. 
+            :func:`utils.find_shift_pyr`). Defaults to `pyrlevel` in 
+            `shift_params` in :mod:`defaults`.
+        refine : bool, optional
+            if True, shifts estimated on a pyramid level > 0 are refined in a
+            full resolution ROI.
+        multiproc : bool
+            if True (and `parallel` is True), shifts are computed using a 
+            process pool rather than a thread pool.
+        executor : ExecutorConfig or str or dict, optional
+            parallel execution settings (backend, number of workers, etc., 
+            cf. :class:`ExecutorConfig`). Overrides `parallel` and 
+            `multiproc` if specified.
+        cache : bool or str or TransformCache or Manifest, optional
+            if specified, results are looked up in and added to an on-disk 
+            cache (cf. :class:`TransformCache`), such that only shifts of 
+            new or modified images are estimated. If True, the cache is 
+            stored in the image directory, if str, it is interpreted as 
+            path of cache file. If None and the image list was loaded from
+            a manifest file (cf. :func:`ImageList.from_manifest`), the 
+            results are stored in the manifest.
+        mode : str, optional
+            "reference" (default): the shift of each image is estimated wrt. 
+            the reference image. "sequential": shifts are estimated between 
+            neighbouring images and chained into shifts wrt. the reference 
+            image (cf. :func:`utils.chain_transforms`), which is more robust
+            if the scene changes throughout the sequence.
+        keyframe_every : int, optional
+            only relevant for sequential mode. If specified, every n-th image
+            (counted from the reference image) is directly aligned to the 
+            reference image, which bounds the drift of the chained shifts.
+        decode : str, optional
+            "full": images are decoded in full resolution and downscaled to 
+            `pyrlevel`. "reduced": images are decoded directly as downscaled
+            gray images (DCT domain scaling for JPEG files, cf. 
+            :func:`utils.imread_reduced_gray`), which is several times 
+            faster, but not combinable with `refine`. Only relevant if 
+            `pyrlevel` > 0. Defaults to `decode` in `shift_params` in 
+            :mod:`defaults`.
+        progress : callable or bool, optional
+            called with progress events (:class:`pylapsy.progress.
+            ProgressEvent`, stage "estimate"), e.g. 
+            :class:`pylapsy.progress.ProgressBar`. If None, progress is 
+            logged (cf. :class:`pylapsy.progress.ProgressLog`), if False, 
+            no progress is reported.
+        method : str, optional
+            "lk" (default): features of the reference image are tracked 
+            using Lucas-Kanade optical flow and a partial affine transform 
+            (shift, rotation, scale) is fitted. "phase": pure translation 
+            from phase correlation with the precomputed spectrum of the 
+            reference image (cf. :func:`utils.find_shift_phase`), which 
+            does not rely on trackable features, but ignores rotation.
+            Defaults to `method` in `shift_params` in :mod:`defaults`.
             
         Returns
         -------
@@ -65,47 +138,345 @@ class Deshaker(object):
         """
         if ref_index is None:
             ref_index = 0
-        imglist = self.imglist
+        if mode is None:
+            mode = 'reference'
+        if not mode in self.MODES:
+            raise ValueError('Invalid mode {}. Choose from {}'
+                             .format(mode, self.MODES))
+        if method is None:
+            method = defaults['shift_params']['method']
+        if not method in utils.SHIFT_METHODS:
+            raise ValueError('Invalid method {}. Choose from {}'
+                             .format(method, utils.SHIFT_METHODS))
+        executor = self._get_executor(executor, parallel, multiproc)
+        cache = self._get_cache(cache)
+        progress = self._get_progress(progress, len(self.imglist), 'estimate')
         
-        ref = imglist[ref_index].to_gray(inplace=False).img
+        with timing.stage('estimate'):
+            if mode == 'sequential':
+                results = self._find_shifts_sequential(ref_index, pyrlevel, 
+                                                       refine, executor, 
+                                                       cache, keyframe_every,
+                                                       decode, progress, 
+                                                       method)
+            else:
+                indices = list(range(len(self.imglist)))
+                results = self._find_shifts_reference(indices, ref_index, 
+                                                      pyrlevel, refine, 
+                                                      executor, cache, decode,
+                                                      progress, method)
+        self._set_results([r[2] for r in results])
+        return self.results
+    
+    def smooth_trajectory(self, window=None, method=None):
+        """Smooth camera trajectory and compute image corrections
         
-        if parallel:
-            res = find_shifts_fast(imglist.files, ref)
-            dx, dy, matrices = list(zip(*res))
-        else:
-            dx, dy, matrices = self._find_shifts(imglist, ref)
+        Instead of locking all images to the reference image, only the high 
+        frequency shake is removed (cf. :func:`utils.smooth_trajectory` and 
+        :func:`utils.trajectory_corrections`). The corrections are stored 
+        in :attr:`results` (`corrections`).
+        
+        Parameters
+        ----------
+        window : int, optional
+            length of smoothing window in number of images (odd)
+        method : str, optional
+            smoothing method (moving_average, gaussian or savgol)
+            
+        Raises
+        ------
+        AttributeError
+            if shifts have not yet been computed (cf. :func:`find_shifts`)
+            
+        Returns
+        -------
+        ndarray
+            correction matrices, shape `(N, 2, 3)`
+        """
+        matrices = self.results['matrices']
+        if matrices is None:
+            raise AttributeError('Shifts have not yet been computed')
+        smoothed = utils.smooth_trajectory(matrices, window, method)
+        corrections = utils.trajectory_corrections(matrices, smoothed)
+        self.results['corrections'] = corrections
+        return corrections
+    
+    def _set_results(self, matrices):
+        """Store transformation matrices and corresponding shifts
         
-        self.results['dx'] = dx
-        self.results['dy'] = dy
+        Matrices are stored as one array of shape `(N, 2, 3)`, shifts `dx` 
+        and `dy` as arrays of shape `(N,)`.
+        """
+        matrices = np.reshape(np.asarray(matrices, dtype=np.float64), 
+                              (-1, 2, 3))
         self.results['matrices'] = matrices
-        return self.results
+        self.results['corrections'] = None
+        self.results['dx'] = -matrices[:, 0, 2]
+        self.results['dy'] = -matrices[:, 1, 2]
+        
+    def transform_stats(self):
+        """Summary statistics of estimated transformations
+        
+        See :func:`utils.transform_stats` for details.
+        
+        Raises
+        ------
+        AttributeError
+            if shifts have not yet been computed (cf. :func:`find_shifts`)
+        
+        Returns
+        -------
+        dict
+            maximum shift and rotation and jitter RMS of image sequence
+        """
+        if self.results['matrices'] is None:
+            raise AttributeError('Shifts have not yet been computed')
+        return utils.transform_stats(self.results['matrices'])
+    
+    def _find_shifts_reference(self, indices, ref_index, pyrlevel, refine, 
+                               executor, cache, decode=None, progress=None,
+                               method=None):
+        """Find shifts of images at input indices wrt. reference image"""
+        imglist = self.imglist
+        files = [imglist.files[i] for i in indices]
+        
+        results = [None] * len(files)
+        if cache is not None:
+            param_key = self._get_param_key(ref_index, pyrlevel, refine, 
+                                            decode, method)
+            results = cache.lookup(files, param_key)
+        todo = [i for i, res in enumerate(results) if res is None]
+        if progress is not None and len(todo) < len(files):
+            progress.update(len(files) - len(todo))
+        
+        if len(todo) > 0:
+            # reference features are computed only once
+            ref = self._prepare_reference(ref_index, pyrlevel, refine, decode,
+                                          method)
+            
+            todo_files = [files[i] for i in todo]
+            if executor.backend == 'serial':
+                todo_imgs = ImageList(todo_files, ref['decode'], 
+                                      ref['pyrlevel'])
+                res = list(zip(*self._find_shifts(todo_imgs, ref, progress)))
+            else:
+                res = find_shifts_fast(todo_files, ref, executor=executor,
+                                       progress=progress)
+            for i, r in zip(todo, res):
+                results[i] = r
+            if cache is not None:
+                cache.update(todo_files, param_key, res)
+                cache.save()
+        elif cache is not None and len(files) > 0:
+            print_log.info('Loaded shifts for all {} images from cache {}'
+                           .format(len(files), cache.path))
+        return results
+    
+    def _find_shifts_sequential(self, ref_index, pyrlevel, refine, executor,
+                                cache, keyframe_every, decode=None, 
+                                progress=None, method=None):
+        """Find shifts wrt. reference image by chaining neighbour shifts"""
+        files = self.imglist.files
+        num = len(files)
+        keyframes = []
+        if keyframe_every is not None:
+            keyframes = [k for k in range(num) if not k == ref_index 
+                         and (k - ref_index) % keyframe_every == 0]
+        if progress is not None:
+            # pairs and keyframes
+            progress.total = max(num - 1, 0) + len(keyframes)
+        
+        pairs = [None] * (num - 1)
+        if cache is not None:
+            # pair shifts are cached wrt. previous image
+            params = defaults['shift_params']
+            keys = [self._get_param_key(
+                        k - 1, pyrlevel, refine, decode, method, mode='pair',
+                        pair_max_level=params['pair_max_level'],
+                        pair_max_shift=params['pair_max_shift']) 
+                    for k in range(1, num)]
+            pairs = [cache.get(files[k], keys[k - 1]) for k in range(1, num)]
+        todo = [k for k in range(1, num) if pairs[k - 1] is None]
+        if progress is not None and len(todo) < num - 1:
+            progress.update(num - 1 - len(todo))
+        
+        res = find_shifts_sequential(files, pyrlevel, refine, executor, todo,
+                                     decode, progress, method)
+        for k, r in zip(todo, res):
+            pairs[k - 1] = r
+            if cache is not None:
+                cache.update([files[k]], keys[k - 1], [r])
+        if cache is not None and len(todo) > 0:
+            cache.save()
+        
+        anchors = {}
+        if keyframe_every is not None:
+            keyres = self._find_shifts_reference(keyframes, ref_index, 
+                                                 pyrlevel, refine, executor, 
+                                                 cache, decode, progress, 
+                                                 method)
+            anchors = {k : r[2] for k, r in zip(keyframes, keyres)}
+        
+        cum = utils.chain_transforms([p[2] for p in pairs], ref_index, 
+                                     anchors)
+        return [(-m[0,2], -m[1,2], m) for m in cum]
+    
+    def _get_cache(self, cache):
+        manifest = self.imglist.manifest
+        if cache is None and manifest is not None and manifest.path:
+            # transforms are stored in the manifest the list was loaded from
+            return manifest
+        elif cache is None or cache is False:
+            return None
+        elif isinstance(cache, (TransformCache, Manifest)):
+            return cache
+        elif isinstance(cache, str):
+            return TransformCache(cache)
+        return TransformCache.for_files(self.imglist.files)
+    
+    def _prepare_reference(self, ref_index, pyrlevel, refine, decode, 
+                           method=None):
+        """Load and prepare reference image for shift estimation"""
+        with timing.stage('reference'):
+            return self._load_reference(ref_index, pyrlevel, refine, decode,
+                                        method)
+    
+    def _load_reference(self, ref_index, pyrlevel, refine, decode, 
+                        method=None):
+        params = defaults['shift_params']
+        if decode is None:
+            decode = params['decode']
+        if decode == 'reduced':
+            return utils.load_shift_reference(self.imglist.files[ref_index],
+                                              pyrlevel, refine, 
+                                              decode=decode, method=method)
+        ref = self.imglist[ref_index].to_gray(inplace=False).img
+        return utils.prepare_shift_reference(ref, pyrlevel, refine, 
+                                             method=method)
+    
+    def _get_param_key(self, ref_index, pyrlevel, refine, decode=None, 
+                       method=None, **extra):
+        """Hash of all settings that define the estimated shifts"""
+        params = defaults['shift_params']
+        if method is None:
+            method = params['method']
+        if pyrlevel is None:
+            pyrlevel = utils.default_pyrlevel(method)
+        if refine is None:
+            refine = params['refine']
+        if decode is None:
+            decode = params['decode']
+        refine = bool(refine and pyrlevel > 0)
+        if decode == 'reduced' and pyrlevel > 0:
+            # keys of full resolution decoding are unchanged
+            extra['decode'] = decode
+        if method != 'lk':
+            # keys of Lucas-Kanade estimates are unchanged
+            extra['method'] = method
+        return make_param_key(ref_file=file_key(self.imglist.files[ref_index]),
+                              pyrlevel=pyrlevel,
+                              refine=refine,
+                              refine_roi_size=(params['refine_roi_size'] 
+                                               if refine else None),
+                              **extra)
     
     @staticmethod
-    def _find_shifts(imglist, ref):
+    def _get_executor(executor, parallel, multiproc):
+        if executor is None:
+            if not parallel:
+                executor = 'serial'
+            else:
+                executor = 'process' if multiproc else 'thread'
+        return ExecutorConfig.from_input(executor)
+    
+    @staticmethod
+    def _get_progress(progress, total, stage):
+        """Progress tracker for input callback (cf. :func:`find_shifts`)"""
+        if progress is False:
+            return None
+        elif progress is None or progress is True:
+            progress = ProgressLog()
+        return ProgressTracker.from_input(progress, total, stage)
+    
+    @staticmethod
+    def _find_shifts(imglist, ref, progress=None):
         
         dx, dy, matrices = [],[],[]
         totnum = len(imglist)
-        
-        disp_each = int(totnum/4)
        
         print_log.info('Finding image shifts for {} images'.format(totnum))
         
-        for i, img in enumerate(imglist):
-            if totnum > 10 and i%disp_each == 0:
-                print_log.info("{} %".format(i/totnum*100))
-            gray = img.to_gray(inplace=False)
-            (_dx, _dy), da, M = utils.find_shift(ref, gray.img)
+        for i, img in enumerate(imglist.prefetch()):
+            with timing.frame(img.file_path):
+                gray = img.to_gray(inplace=False)
+                (_dx, _dy), da, M = utils.find_shift_ref(ref, gray.img, 
+                                                         gray.pyrlevel > 0)
             
             matrices.append(M)
             dx.append(_dx)
             dy.append(_dy)
+            if progress is not None:
+                progress.update()
             
             logger.info('Image {}, dx={:.3f} dy={:.3f}'.format(i, _dx, _dy))    
         
         return (dx, dy, matrices)
 
+    def find_crop_lowres(self, ref_index=None, pyrlevel=2, executor=None):
+        """Estimate output crop from a fast pass over downscaled images
+        
+        The shifts are estimated from gray images decoded at reduced 
+        resolution (cf. :func:`utils.imread_reduced_gray`) and scaled back 
+        to full resolution. The resulting crop is padded by the pixel size of
+        the pyramid level to account for the reduced accuracy.
+        
+        Parameters
+        ----------
+        ref_index : int
+            index of reference image in image list
+        pyrlevel : int
+            pyramid level used for shift estimation (1, 2 or 3)
+        executor : ExecutorConfig or str or dict, optional
+            parallel execution settings (cf. :class:`ExecutorConfig`), 
+            defaults to thread backend
+            
+        Returns
+        -------
+        tuple
+            4-element tuple containing ROI: (x0, x1, y0, y1), x1 and y1 are
+            exclusive (cf. :func:`utils.get_crop_matrices`)
+        """
+        if ref_index is None:
+            ref_index = 0
+        files = self.imglist.files
+        h, w = self.imglist[ref_index].shape[:2]
+        ref = utils.imread_reduced_gray(files[ref_index], pyrlevel)
+        ref = utils.prepare_shift_reference(ref, pyrlevel=0)
+        
+        func = partial(self._find_shift_lowres, ref_gray=ref, 
+                       pyrlevel=pyrlevel)
+        executor = ExecutorConfig.from_input(executor)
+        fac = 2**pyrlevel
+        matrices = [utils.scale_affine(m, fac) 
+                    for m in executor.map(func, files)]
+        x0, x1, y0, y1 = utils.get_crop_matrices(matrices, w, h)
+        return (min(x0 + fac, x1), max(x1 - fac, x0),
+                min(y0 + fac, y1), max(y1 - fac, y0))
+    
+    @staticmethod
+    def _find_shift_lowres(file, ref_gray, pyrlevel):
+        gray = utils.imread_reduced_gray(file, pyrlevel)
+        _, _, m = utils.find_shift_ref(ref_gray, gray)
+        return m
+    
     def deshake(self, outdir=None, ref_index=None, sequence_id=None, 
-                save_preview_video=False, parallel=True):
+                save_preview_video=False, parallel=True, streaming=False,
+                crop_margin=None, pyrlevel=None, refine=None, executor=None,
+                cache=None, incremental=False, mode=None, 
+                keyframe_every=None, smooth=None, smooth_method=None,
+                interpolation=None, border_mode=None, decode=None, 
+                encode=None, writers=None, video=None, save_images=True,
+                progress=None, method=None):
         """Method that deshakes images sequence and saves result
         
         Parameters
@@ -119,9 +490,106 @@ class Deshaker(object):
         sequence_id : str, optional
             name of the sequence (for output directory)
         save_preview_video : bool
-            if True, a preview video is saved (currently not working)
+            if True, the deshaked images are encoded into a video (cf. 
+            :class:`pylapsy.writers.VideoWriter`), by default 
+            `<sequence_id>.mp4` in the output directory. Frames are rendered
+            in parallel and reordered before encoding. Not combinable with
+            `streaming` and `incremental`.
+        parallel : bool
+            if True, shifts are computed and images are processed in parallel
+        streaming : bool
+            if True and shifts have not yet been computed, each image is 
+            decoded only once and shift estimation, correction and saving is
+            done in a single pass (cf. :func:`deshake_stream`). Requires the
+            output crop to be known in advance, which is either defined via
+            `crop_margin` or estimated from downscaled images (cf. 
+            :func:`find_crop_lowres`).
+        crop_margin : float, optional
+            fixed crop margin for streaming mode, either as fraction of image
+            size or in pixels (cf. :func:`utils.get_crop_margin`).
+        pyrlevel : int, optional
+            pyramid level used for shift estimation (cf. :func:`find_shifts`)
+        refine : bool, optional
+            if True, shifts are refined in full resolution ROI (cf. 
+            :func:`find_shifts`)
+        executor : ExecutorConfig or str or dict, optional
+            parallel execution settings used for shift estimation and image 
+            processing (cf. :class:`ExecutorConfig`). Overrides `parallel` if
+            specified. By default, shifts are computed using threads and 
+            images are processed using processes.
+        cache : bool or str or TransformCache, optional
+            on-disk cache for shifts (cf. :func:`find_shifts`)
+        incremental : bool
+            if True, only images that have not yet been processed in a 
+            previous run (e.g. new images of a sequence that is still being 
+            shot) are estimated and saved. Already processed images are only 
+            processed again if the required crop grows, or if the reference 
+            or the estimation settings change. Uses the shift cache (cf. 
+            `cache`) and a state file in the output directory. Not 
+            combinable with `streaming`.
+        mode : str, optional
+            shift estimation mode, "reference" (default) or "sequential" 
+            (cf. :func:`find_shifts`). Sequential mode is not combinable with
+            `streaming`.
+        keyframe_every : int, optional
+            keyframe interval in sequential mode (cf. :func:`find_shifts`)
+        smooth : bool or int, optional
+            if True or int, images are not locked to the reference image, 
+            but the camera trajectory is smoothed and only the high 
+            frequency shake is removed (cf. :func:`smooth_trajectory`), 
+            which results in larger output images. An int specifies the 
+            smoothing window (number of images). Not combinable with 
+            `streaming` and `incremental`.
+        smooth_method : str, optional
+            trajectory smoothing method (cf. :func:`smooth_trajectory`)
+        interpolation : int, optional
+            OpenCV interpolation flag used for shifting the images (cf. 
+            :func:`utils.shift_image`)
+        border_mode : int, optional
+            OpenCV border mode used for shifting the images (cf. 
+            :func:`utils.shift_image`)
+        decode : str, optional
+            decode mode for shift estimation (cf. :func:`find_shifts`), not 
+            relevant in streaming mode, where full images are decoded anyway
+        encode : EncodeParams or dict or str, optional
+            encoding settings for output images, e.g. JPEG quality or PNG 
+            compression level (cf. :class:`pylapsy.writers.EncodeParams`). 
+            "fast" writes fast, low compression PNG files (e.g. as 
+            intermediate files for a video encoder).
+        writers : int, optional
+            number of dedicated writer threads (cf. 
+            :class:`pylapsy.writers.ImageWriter`). If specified, output 
+            images are encoded concurrently with the processing of the next 
+            images (not available for the process backend and in streaming 
+            mode).
+        video : dict, optional
+            video settings, e.g. `path`, `fps`, `codec`, `size` or `backend`
+            (cf. :class:`pylapsy.writers.VideoWriter`). Only relevant if 
+            `save_preview_video` is True.
+        save_images : bool
+            if False, no output images are saved, that is, only the video is 
+            written (requires `save_preview_video`)
+        progress : callable or bool, optional
+            called with progress events of shift estimation (stage 
+            "estimate") and rendering (stage "render"), cf. 
+            :func:`find_shifts`
+        method : str, optional
+            shift estimation method ("lk" or "phase", cf. 
+            :func:`find_shifts`)
 
         """
+        if streaming and mode == 'sequential':
+            raise ValueError('Sequential mode is not available in streaming '
+                             'mode')
+        if smooth and (streaming or incremental):
+            raise ValueError('Trajectory smoothing is not available in '
+                             'streaming or incremental mode')
+        if save_preview_video and (streaming or incremental):
+            raise ValueError('Video output is not available in streaming or '
+                             'incremental mode')
+        if not save_images and not save_preview_video:
+            raise ValueError('Nothing to save, need save_images or '
+                             'save_preview_video')
         if sequence_id is None:
             sequence_id = 'pylapsy'
         if outdir is None:
@@ -133,32 +601,241 @@ class Deshaker(object):
         imglist = self.imglist
         
         # get image width and height
-        h,w = imglist.current_img.shape[:2]
+        h,w = imglist.shape[:2]
+        
+        if incremental:
+            self._deshake_incremental(outdir, ref_index, w, h, parallel, 
+                                      pyrlevel, refine, executor, cache, 
+                                      mode, keyframe_every, interpolation, 
+                                      border_mode, decode, encode, writers,
+                                      progress, method)
+            print_log.info('Results are stored at {}'.format(outdir))
+            return
         
         # Find dx and dy shifts for all images
         results = self.results
-        if results['dx'] is None:
+        if streaming and results['dx'] is None and not self._all_cached(
+                cache, ref_index, pyrlevel, refine, method):
+            self._deshake_stream(outdir, ref_index, crop_margin, w, h, 
+                                 pyrlevel, refine, 
+                                 self._get_executor(executor, parallel, 
+                                                    False), 
+                                 cache, interpolation, border_mode, encode,
+                                 progress, method)
+            print_log.info('Results are stored at {}'.format(outdir))
+            return
+        elif results['dx'] is None:
             results = self.find_shifts(ref_index=ref_index, 
-                                       parallel=parallel)
+                                       parallel=parallel,
+                                       pyrlevel=pyrlevel,
+                                       refine=refine,
+                                       executor=executor,
+                                       cache=cache,
+                                       mode=mode,
+                                       keyframe_every=keyframe_every,
+                                       decode=decode,
+                                       progress=progress,
+                                       method=method)
         
-        dx, dy = results['dx'], results['dy']
         matrices = results['matrices']
+        self._log_stats()
+        if smooth:
+            window = None if smooth is True else smooth
+            matrices = self.smooth_trajectory(window, smooth_method)
         # determine image crop for output images in order to avoid black 
-        # borders (based on maximum and minimum shifts)
-        crop = utils.get_crop(dx, dy, w, h)
+        # borders (based on transformed image corners)
+        crop = utils.get_crop_matrices(matrices, w, h)
+        render_progress = self._get_progress(progress, len(imglist), 'render')
         
-        shift_crop_list(imglist.files, 
+        if save_preview_video:
+            video = dict(video or {})
+            if not 'path' in video:
+                video['path'] = os.path.join(outdir, 
+                                             '{}.mp4'.format(sequence_id))
+            with timing.stage('render'), VideoWriter(**video) as writer:
+                shift_crop_video(imglist.files, 
                                  matrices, 
                                  crop, 
-                                 outdir,
-                                 multiproc=parallel,
-                                 multithread=False)
-          
-        if save_preview_video:
-            raise NotImplementedError  
+                                 writer,
+                                 executor=self._get_executor(executor, 
+                                                             parallel, True),
+                                 outdir=outdir if save_images else None,
+                                 interpolation=interpolation,
+                                 border_mode=border_mode,
+                                 encode=encode,
+                                 progress=render_progress)
+        else:
+            with timing.stage('render'):
+                shift_crop_list(imglist.files, 
+                                matrices, 
+                                crop, 
+                                outdir,
+                                multiproc=parallel,
+                                multithread=False,
+                                executor=executor,
+                                interpolation=interpolation,
+                                border_mode=border_mode,
+                                encode=encode,
+                                writers=writers,
+                                progress=render_progress)
         
         print_log.info('Results are stored at {}'.format(outdir))
         
+    def _deshake_incremental(self, outdir, ref_index, w, h, parallel, 
+                             pyrlevel, refine, executor, cache, mode=None,
+                             keyframe_every=None, interpolation=None, 
+                             border_mode=None, decode=None, encode=None, 
+                             writers=None, progress=None, method=None):
+        if ref_index is None:
+            ref_index = 0
+        if mode is None:
+            mode = 'reference'
+        if cache is False or (cache is None and 
+                              self._get_cache(None) is None):
+            cache = True
+        results = self.find_shifts(ref_index=ref_index, 
+                                   parallel=parallel,
+                                   pyrlevel=pyrlevel,
+                                   refine=refine,
+                                   executor=executor,
+                                   cache=cache,
+                                   mode=mode,
+                                   keyframe_every=keyframe_every,
+                                   decode=decode,
+                                   progress=progress,
+                                   method=method)
+        files = self.imglist.files
+        matrices = results['matrices']
+        required = utils.get_crop_matrices(matrices, w, h)
+        encode = EncodeParams.from_input(encode)
+        param_key = self._get_param_key(ref_index, pyrlevel, refine, decode,
+                                        method, mode=mode, 
+                                        keyframe_every=keyframe_every,
+                                        interpolation=interpolation,
+                                        border_mode=border_mode,
+                                        encode=repr(encode))
+        
+        state = self._load_render_state(outdir)
+        if (state is not None and state['param_key'] == param_key and 
+            self._crop_within(state['crop'], required)):
+            # previous crop is still valid for all images
+            crop = tuple(state['crop'])
+            rendered = state['rendered']
+        else:
+            if state is not None:
+                print_log.info('Crop or settings changed, re-processing all '
+                               'images')
+            crop = required
+            rendered = {}
+        
+        todo = []
+        for i, file in enumerate(files):
+            name = os.path.basename(file)
+            _, size, mtime = file_key(file)
+            outfile = encode.output_path(os.path.join(outdir, name))
+            if (rendered.get(name) != [size, mtime] or 
+                not os.path.exists(outfile)):
+                todo.append(i)
+        print_log.info('Processing {} of {} images'
+                       .format(len(todo), len(files)))
+        
+        with timing.stage('render'):
+            shift_crop_list([files[i] for i in todo], 
+                            [matrices[i] for i in todo], 
+                            crop, 
+                            outdir,
+                            multiproc=parallel,
+                            multithread=False,
+                            executor=executor,
+                            interpolation=interpolation,
+                            border_mode=border_mode,
+                            encode=encode,
+                            writers=writers,
+                            progress=self._get_progress(progress, len(todo), 
+                                                        'render'))
+        for i in todo:
+            _, size, mtime = file_key(files[i])
+            rendered[os.path.basename(files[i])] = [size, mtime]
+        self._save_render_state(outdir, dict(param_key=param_key,
+                                             crop=[int(x) for x in crop],
+                                             rendered=rendered))
+    
+    def _log_stats(self):
+        stats = self.transform_stats()
+        print_log.info('Max. shift: {:.1f} px, max. rotation: {:.2f} deg, '
+                       'jitter RMS: {:.2f} px'
+                       .format(stats['max_shift'], stats['max_rotation'], 
+                               stats['jitter_rms']))
+    
+    @staticmethod
+    def _crop_within(crop, other):
+        """Check if crop ROI is located within other crop ROI"""
+        x0, x1, y0, y1 = crop
+        ox0, ox1, oy0, oy1 = other
+        return x0 >= ox0 and x1 <= ox1 and y0 >= oy0 and y1 <= oy1
+    
+    @staticmethod
+    def _load_render_state(outdir):
+        fp = os.path.join(outdir, RENDER_STATE_FILENAME)
+        if not os.path.exists(fp):
+            return None
+        with open(fp) as f:
+            return json.load(f)
+    
+    @staticmethod
+    def _save_render_state(outdir, state):
+        fp = os.path.join(outdir, RENDER_STATE_FILENAME)
+        with open(fp, 'w') as f:
+            json.dump(state, f)
+    
+    def _all_cached(self, cache, ref_index, pyrlevel, refine, method=None):
+        cache = self._get_cache(cache)
+        if cache is None:
+            return False
+        if ref_index is None:
+            ref_index = 0
+        # streaming mode always decodes full images
+        param_key = self._get_param_key(ref_index, pyrlevel, refine, 'full',
+                                        method)
+        files = self.imglist.files
+        return all([x is not None for x in cache.lookup(files, param_key)])
+    
+    def _deshake_stream(self, outdir, ref_index, crop_margin, w, h, 
+                        pyrlevel, refine, executor, cache=None, 
+                        interpolation=None, border_mode=None, encode=None,
+                        progress=None, method=None):
+        if ref_index is None:
+            ref_index = 0
+        if crop_margin is not None:
+            crop = utils.get_crop_margin(w, h, crop_margin)
+        else:
+            crop = self.find_crop_lowres(ref_index, executor=executor)
+        
+        with timing.stage('reference'):
+            ref = self.imglist[ref_index].to_gray(inplace=False).img
+            ref = utils.prepare_shift_reference(ref, pyrlevel, refine, 
+                                                method=method)
+        with timing.stage('render'):
+            res = deshake_stream(self.imglist.files, ref, crop, outdir, 
+                                 executor, interpolation=interpolation, 
+                                 border_mode=border_mode, encode=encode,
+                                 progress=self._get_progress(
+                                     progress, len(self.imglist), 'render'))
+        self._set_results([r[2] for r in res])
+        cache = self._get_cache(cache)
+        if cache is not None:
+            param_key = self._get_param_key(ref_index, pyrlevel, refine, 
+                                            'full', method)
+            cache.update(self.imglist.files, param_key, res)
+            cache.save()
+        
+        x0, x1, y0, y1 = utils.get_crop_matrices(self.results['matrices'], 
+                                                 w, h)
+        if x0 > crop[0] or x1 < crop[1] or y0 > crop[2] or y1 < crop[3]:
+            print_log.warning('Shifts exceed streaming crop {}, some output '
+                              'images may contain black borders (required '
+                              'crop: {})'.format(crop, (x0, x1, y0, y1)))
+        
     def deshake_v0(self, outdir=None, ref_index=None, sequence_id=None, 
                 save_images=True, save_preview_video=True,
                 preview_fps=24):
@@ -194,7 +871,7 @@ class Deshaker(object):
         imglist = self.imglist
         
         # get image width and height
-        h,w = imglist.current_img.shape[:2]
+        h,w = imglist.shape[:2]
         
         # Find dx and dy shifts for all images
         results = self.results
@@ -228,12 +905,11 @@ class Deshaker(object):
         
         print_log.info('Shifting {} images'.format(totnum))
         
-        for i, img in enumerate(imglist):
+        for i, img in enumerate(imglist.prefetch()):
             if totnum > 10  and i%disp_each == 0:
                 print_log.info("{} %".format(i/totnum*100))
-            shifted = utils.shift_image(img.img, matrices[i])
-            
-            shifted_crop = shifted[y0:y1, x0:x1]
+            shifted_crop = utils.shift_crop_image(img.img, matrices[i], 
+                                                  (x0, x1, y0, y1))
             
             if save_preview_video:
                 clip.write(shifted_crop)
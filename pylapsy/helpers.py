@@ -27,6 +27,26 @@ def isnumeric(val):
     return False
 
 def load_exif_from_image_file(file_path):
-    """Try load EXIF meta information from image file"""
-    raise NotImplementedError('Coming soon...')
+    """Try load EXIF meta information from image file
+    
+    Only the file header is read (cf. :func:`pylapsy.probe.probe_header`).
+    
+    Parameters
+    ----------
+    file_path : str
+        image file (JPEG, PNG or TIFF)
+        
+    Returns
+    -------
+    dict
+        available meta information, e.g. acquisition time (`acq_time`), 
+        exposure time or ISO (cf. :func:`pylapsy.probe.image_meta`). Empty,
+        if the file header cannot be read.
+    """
+    from pylapsy import probe
+    try:
+        info = probe.probe_header(file_path)
+    except (ValueError, OSError):
+        return {}
+    return probe.image_meta(info)
 
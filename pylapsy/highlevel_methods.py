@@ -8,10 +8,15 @@
 # GitHub: jgliss
 # Email: jonasgliss@gmail.com 
 
-from pylapsy.io import find_image_files
-from pylapsy import ImageList, Deshaker
+import os
 
-def deshake(dir_name=None, file_pattern=None, outdir=None, **deshake_args):
+from pylapsy.io import scan_image_files
+from pylapsy.manifest import MANIFEST_FILENAME
+from pylapsy import ImageList, Deshaker, print_log, timing
+
+def deshake(dir_name=None, file_pattern=None, outdir=None, sort='natural', 
+            manifest=False, frame_range=None, timing_report=None, 
+            **deshake_args):
     """Deshake image sequence
     
     Applies deshaking to all images (which should be part of a timelapse 
@@ -22,19 +27,67 @@ def deshake(dir_name=None, file_pattern=None, outdir=None, **deshake_args):
     Parameters
     ----------
     dir_name : str, optional
-        Image directory. If None, the current directory is used. 
-        The default is None.
+        Image directory or sequence manifest file (cf. 
+        :class:`pylapsy.manifest.Manifest`). If None, the current directory
+        is used. The default is None.
     file_pattern : str, optional
         Pattern used to identify images in the input directory 
         (e.g. *.jpg). The default is None.
     outdir : str, optional
         Output. The default is None.
+    sort : str
+        order of images, "natural" (file names, default), "name" or "time" 
+        (EXIF capture time), cf. :func:`pylapsy.io.scan_image_files`
+    manifest : bool or str
+        if True or file path, the directory scan is stored in a manifest 
+        file and reused in later runs (cf. 
+        :func:`pylapsy.io.scan_image_files`). Estimated shifts are also 
+        stored in the manifest.
+    frame_range : tuple, optional
+        (start, stop) index range of images that are processed (e.g. from
+        :func:`pylapsy.manifest.Manifest.split`)
+    timing_report : bool or str, optional
+        if True or file path, the durations of all processing stages are 
+        recorded (cf. :mod:`pylapsy.timing`) and a summary is logged at the 
+        end. If file path, the report is also saved (JSON or CSV, cf. 
+        :func:`pylapsy.timing.StageTimer.save`)
     **deshake_args 
-        Additional keyword args passed to :func:`Deshaker.deshake`
+        Additional keyword args passed to :func:`Deshaker.deshake` (e.g. 
+        `executor`, to specify parallel execution settings, cf. 
+        :class:`ExecutorConfig`)
         
+    Returns
+    -------
+    StageTimer or None
+        recorded stage durations, if `timing_report` is specified
     """
-    files = find_image_files(dir_name, file_pattern)
-    imglist = ImageList(files)
+    if not timing_report:
+        _deshake(dir_name, file_pattern, outdir, sort, manifest, frame_range, 
+                 **deshake_args)
+        return None
+    with timing.measure() as timer:
+        _deshake(dir_name, file_pattern, outdir, sort, manifest, frame_range, 
+                 **deshake_args)
+    print_log.info('Timing: {}'.format(timer.summary_line()))
+    if isinstance(timing_report, str):
+        timer.save(timing_report)
+        print_log.info('Saved timing report {}'.format(timing_report))
+    return timer
+
+def _deshake(dir_name, file_pattern, outdir, sort, manifest, frame_range, 
+             **deshake_args):
+    start, stop = (None, None) if frame_range is None else frame_range
+    if dir_name is not None and os.path.isfile(dir_name):
+        imglist = ImageList.from_manifest(str(dir_name), start, stop)
+    else:
+        files = scan_image_files(dir_name, file_pattern, sort=sort, 
+                                 manifest=manifest)
+        if manifest:
+            path = manifest if isinstance(manifest, str) else os.path.join(
+                '.' if dir_name is None else str(dir_name), MANIFEST_FILENAME)
+            imglist = ImageList.from_manifest(path, start, stop)
+        else:
+            imglist = ImageList(files[start:stop])
     deshaker = Deshaker(imglist)
     
     deshaker.deshake(outdir=outdir, **deshake_args)
@@ -93,13 +93,30 @@ class Image(object):
         """Update meta information"""
         self.meta.update(**meta)
         
-    def load_input(self, input, dtype=None):
-        """Load input image data"""
+    def load_input(self, input, dtype=None, pyrlevel=0):
+        """Load input image data
+        
+        Parameters
+        ----------
+        input 
+            input image data (e.g. file path or numpy array)
+        dtype
+            currently not used
+        pyrlevel : int
+            if > 0 and input is a file path, the image is decoded directly as
+            downscaled gray image on that pyramid level (cf. 
+            :func:`utils.imread_reduced_gray`)
+        """
         if isinstance(input, str):
             if not os.path.exists(input):
                 raise ValueError('Need valid file path ...')
-            img = cv2.imread(input)
+            if pyrlevel > 0:
+                img = utils.imread_reduced_gray(input, pyrlevel)
+                self.edit_log['pyrlevel'] = pyrlevel
+            else:
+                img = cv2.imread(input)
             self.meta['file_path'] = input
+            self.meta.load(input)
         elif isinstance(input, np.ndarray):
             img = input 
         else:
@@ -139,7 +156,31 @@ class Image(object):
             img = self.duplicate()
         else:
             img = self
-        img._img = utils.to_gray(img.img)
+        if not img.is_gray:
+            img._img = utils.to_gray(img.img)
+        return img
+    
+    def pyr_down(self, steps=1, inplace=True):
+        """Downscale image using Gaussian pyramid
+        
+        Parameters
+        ----------
+        steps : int
+            number of pyramid steps (cf. :func:`utils.pyr_down`)
+        inplace : bool
+            if False, a downscaled copy of this image is returned
+            
+        Returns
+        -------
+        Image
+            downscaled image
+        """
+        if not inplace:
+            img = self.duplicate()
+        else:
+            img = self
+        img._img = utils.pyr_down(img.img, steps)
+        img.edit_log['pyrlevel'] += steps
         return img
     
     def load_test_img(self):
@@ -5,24 +5,202 @@ Created on Sun Sep  1 12:14:02 2019
 @author: Jonas
 """
 import os
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
 
 from pylapsy.image import Image
-from pylapsy import print_log
+from pylapsy.manifest import Manifest
+from pylapsy import print_log, utils, defaults, probe, timing
+
+class FrameCache(object):
+    """Thread-safe LRU cache of decoded image arrays, bounded in bytes
+    
+    Parameters
+    ----------
+    max_bytes : int
+        maximum total size of cached arrays. Arrays larger than that are not
+        cached. 0 disables caching.
+    """
+    def __init__(self, max_bytes):
+        if max_bytes < 0:
+            raise ValueError('Cache size needs to be >= 0')
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        
+    def __len__(self):
+        return len(self._entries)
+    
+    def __contains__(self, key):
+        return key in self._entries
+    
+    def get(self, key):
+        """Get cached array (marks it as most recently used)
+        
+        Returns
+        -------
+        ndarray or None
+            None, if key is not in cache
+        """
+        with self._lock:
+            arr = self._entries.get(key)
+            if arr is not None:
+                self._entries.move_to_end(key)
+            return arr
+        
+    def put(self, key, arr):
+        """Add array to cache (least recently used entries are evicted)"""
+        if arr.nbytes > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.nbytes -= old.nbytes
+            self._entries[key] = arr
+            self.nbytes += arr.nbytes
+            while self.nbytes > self.max_bytes:
+                _, old = self._entries.popitem(last=False)
+                self.nbytes -= old.nbytes
+                
+    def clear(self):
+        """Remove all entries"""
+        with self._lock:
+            self._entries.clear()
+            self.nbytes = 0
 
 class ImageList(object):
-    """Object representing a list of images"""
-    def __init__(self, input):
-        self._images = None
+    """Object representing a list of images
+    
+    Images are decoded lazily on access. Decoded images are kept in a 
+    least recently used cache (cf. :class:`FrameCache`) whose size is 
+    bounded in bytes, so repeated access of the same images (e.g. the 
+    reference image) does not decode the file again. Cached image arrays 
+    are read-only, copy them before modifying them in place.
+    
+    Iterating over the list creates an independent iterator (multiple 
+    threads may iterate concurrently) and slicing returns a view of the 
+    list that shares the files and the cache with this list.
+    
+    Parameters
+    ----------
+    input : list or str
+        image files
+    decode : str
+        how image files are decoded: "full" (default) or "reduced" (as 
+        downscaled gray images on pyramid level `pyrlevel`, which is much 
+        faster for JPEG files, cf. :func:`utils.imread_reduced_gray`)
+    pyrlevel : int
+        pyramid level of images in decode mode "reduced"
+    cache_bytes : int, optional
+        size of frame cache in bytes (0 disables caching), defaults to 
+        setting in :mod:`defaults`
+    """
+    def __init__(self, input, decode='full', pyrlevel=0, cache_bytes=None):
+        self._files = None
         self._index = -1
+        if not decode in utils.DECODE_MODES:
+            raise ValueError('Invalid decode mode {}. Choose from {}'
+                             .format(decode, utils.DECODE_MODES))
+        self.decode = decode
+        self.pyrlevel = pyrlevel
+        if cache_bytes is None:
+            cache_bytes = defaults['imagelist_params']['cache_bytes']
+        self.cache = FrameCache(cache_bytes)
+        #: manifest the list was created from (cf. :func:`from_manifest`)
+        self.manifest = None
         
         self.load_input(input)
     
+    @classmethod
+    def from_manifest(cls, manifest, start=None, stop=None, **kwargs):
+        """Create image list from sequence manifest
+        
+        File dimensions and capture times are taken from the manifest (if 
+        available), that is, the image files are not accessed.
+        
+        Parameters
+        ----------
+        manifest : str or Manifest
+            manifest file or object (cf. :class:`pylapsy.manifest.Manifest`)
+        start : int, optional
+            index of first frame (e.g. to process a range of the sequence, 
+            cf. :func:`pylapsy.manifest.Manifest.split`)
+        stop : int, optional
+            index after last frame
+        **kwargs
+            additional input args for :class:`ImageList` (e.g. `decode`)
+            
+        Returns
+        -------
+        ImageList
+        """
+        if isinstance(manifest, str):
+            if start is None and stop is None:
+                manifest = Manifest.load(manifest)
+            else:
+                manifest = Manifest.load(manifest, start, stop)
+        elif start is not None or stop is not None:
+            manifest = manifest[start:stop]
+        lst = cls(manifest.files, **kwargs)
+        lst.manifest = manifest
+        for i, entry in enumerate(manifest.entries):
+            if entry.get('header') is not None:
+                lst._headers[i] = entry['header']
+        return lst
+    
+    def to_manifest(self, probe_headers=True, workers=None):
+        """Create sequence manifest of images in this list
+        
+        Information of unchanged files in the manifest this list was 
+        created from (e.g. transforms) is kept.
+        
+        Parameters
+        ----------
+        probe_headers : bool
+            if True, file dimensions and capture times are stored
+        workers : int, optional
+            number of threads used for reading the file headers
+            
+        Returns
+        -------
+        Manifest
+        """
+        manifest = Manifest.from_files(self.files, probe_headers, workers)
+        if self.manifest is not None:
+            manifest.reuse(self.manifest)
+        return manifest
+    
+    def save_manifest(self, path, probe_headers=True, workers=None):
+        """Save sequence manifest of images in this list (cf. 
+        :func:`to_manifest`)
+        
+        Parameters
+        ----------
+        path : str
+            output file
+        probe_headers : bool
+            if True, file dimensions and capture times are stored
+        workers : int, optional
+            number of threads used for reading the file headers
+            
+        Returns
+        -------
+        Manifest
+        """
+        manifest = self.to_manifest(probe_headers, workers)
+        manifest.save(path)
+        return manifest
+    
     @property
     def files(self):
         """List with image file paths"""
-        if self._images is None:
+        if self._files is None:
             raise AttributeError('No image files are assigned to list')
-        return self._images
+        if self._indices == range(len(self._files)):
+            return self._files
+        return [self._files[i] for i in self._indices]
     
     @files.setter
     def files(self, val):
@@ -30,12 +208,12 @@ class ImageList(object):
         
     @property
     def filenames(self):
-        return [os.path.basename(x) for x in self._images]
+        return [os.path.basename(x) for x in self.files]
         
     @property
     def totnum(self):
         """Number of files in this list"""
-        return len(self._images)
+        return len(self._indices)
     
     @property 
     def index(self):
@@ -52,8 +230,18 @@ class ImageList(object):
         """Next image in list"""
         return self.get_image(self._index + 1)
     
+    @property
+    def shape(self):
+        """Shape of first image (from file header, cf. :func:`probe`)"""
+        return self.probe(0)[0]
+    
+    @property
+    def dtype(self):
+        """Data type of first image (cf. :func:`probe`)"""
+        return self.probe(0)[1]
+    
     def load_input(self, input):
-        if self._images is not None:
+        if self._files is not None:
             print_log.warning('Overwriting existing files in ImageList')
         if input is None:
             input = []
@@ -64,32 +252,172 @@ class ImageList(object):
         if not isinstance(input, list):
             raise ValueError('Invalid input: {}. Need list (or tuple), str '
                              'or None'.format(type(input)))
-        self._images = input
+        self._files = input
+        self._indices = range(len(input))
+        self._headers = {}
+        self.cache.clear()
         
     def valid_index(self, index):
         """Check if input index is within range of images in the list"""
         return True if -1 < index < self.totnum else False
     
+    def probe(self, index):
+        """Get shape and dtype of decoded image without decoding it
+        
+        The dimensions are read from the file header (cf. 
+        :func:`probe.probe_header`). Files whose header cannot be parsed 
+        are decoded.
+        
+        Parameters
+        ----------
+        index : int
+            image index
+            
+        Returns
+        -------
+        tuple
+            shape and dtype of image
+        """
+        base = self._indices[index]
+        info = None
+        if not isinstance(self._files[base], Image) and not base in self.cache:
+            info = self._get_header(base)
+        if info is None:
+            img = self.get_image(index)
+            return (img.shape, img.dtype)
+        pyrlevel = self.pyrlevel if self.decode == 'reduced' else 0
+        return (probe.decoded_shape(info, pyrlevel), 
+                probe.decoded_dtype(info))
+    
+    def get_meta(self, index):
+        """Get meta information of image from file header (no decoding)
+        
+        Parameters
+        ----------
+        index : int
+            image index
+            
+        Returns
+        -------
+        dict
+            available meta information, e.g. acquisition time (`acq_time`),
+            exposure time or ISO (cf. :func:`probe.image_meta`). Empty if 
+            the file header cannot be read or if the list entry is an 
+            :class:`Image` object.
+        """
+        base = self._indices[index]
+        if isinstance(self._files[base], Image):
+            return {}
+        info = self._get_header(base)
+        return {} if info is None else probe.image_meta(info)
+    
+    @property
+    def acq_times(self):
+        """Acquisition times of all images (from EXIF, None if unavailable)
+        
+        Only the file headers are read (cf. :func:`get_meta`).
+        """
+        return [self.get_meta(i).get('acq_time') for i in range(self.totnum)]
+    
+    def _get_header(self, base):
+        """Header information of file (None if header cannot be parsed)"""
+        info = self._headers.get(base)
+        if info is None:
+            try:
+                info = probe.probe_header(self._files[base])
+            except (ValueError, OSError):
+                info = False
+            self._headers[base] = info
+        return info if info else None
+    
     def get_image(self, index):
         """Get image data"""
-        img = self._images[index]
-        if not isinstance(img, Image):
-            img = Image(img)
+        base = self._indices[index]
+        file = self._files[base]
+        if isinstance(file, Image):
+            return file
+        reduced = self.decode == 'reduced' and self.pyrlevel > 0
+        arr = self.cache.get(base)
+        if arr is None:
+            with timing.frame(file):
+                if reduced:
+                    arr = utils.imread_reduced_gray(file, self.pyrlevel)
+                else:
+                    arr = utils.imread(file)
+            if arr is None:
+                raise IOError('Failed to read image file {}'.format(file))
+            if self.cache.max_bytes > 0:
+                arr.flags.writeable = False
+                self.cache.put(base, arr)
+        if not arr.flags.writeable:
+            # cached array is protected, callers may modify their image
+            arr = arr.copy()
+        img = Image(arr, file_path=file, **self.get_meta(index))
+        if reduced:
+            img.edit_log['pyrlevel'] = self.pyrlevel
         return img
     
+    def prefetch(self, n=4, workers=2):
+        """Iterate over images while decoding the next images in background
+        
+        Decoding runs in background threads (OpenCV releases the GIL while 
+        decoding), such that it overlaps with the processing of the 
+        current image by the consumer.
+        
+        Parameters
+        ----------
+        n : int
+            maximum number of images decoded ahead
+        workers : int
+            number of decoding threads
+            
+        Returns
+        -------
+        generator
+            yields the images in list order
+        """
+        if n < 1 or workers < 1:
+            raise ValueError('Need n >= 1 and workers >= 1')
+        return self._prefetch(n, workers)
+    
+    def _prefetch(self, n, workers):
+        pending = deque()
+        with ThreadPoolExecutor(workers) as executor:
+            try:
+                for i in range(self.totnum):
+                    if len(pending) >= n:
+                        yield pending.popleft().result()
+                    pending.append(executor.submit(self.get_image, i))
+                while pending:
+                    yield pending.popleft().result()
+            finally:
+                # e.g. consumer stopped early, skip remaining images
+                for future in pending:
+                    future.cancel()
+    
+    def _view(self, indices):
+        view = ImageList.__new__(ImageList)
+        view.__dict__.update(self.__dict__)
+        view._indices = indices
+        view._index = -1
+        return view
+    
     def __len__(self):
         return self.totnum
     
     def __getitem__(self, val):
-        """Get image at input index"""
+        """Get image at input index or view of list (input slice)"""
+        if isinstance(val, slice):
+            return self._view(self._indices[val])
         return self.get_image(val)
     
     def __iter__(self):
-        return self
+        for i in range(self.totnum):
+            yield self.get_image(i)
     
     def __next__(self):
         self._index += 1
-        if self._index == len(self._images):
+        if self._index == self.totnum:
             self._index = -1
             raise StopIteration
         return self[self._index]
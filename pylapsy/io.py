@@ -8,10 +8,19 @@
 # GitHub: jgliss
 # Email: jonasgliss@gmail.com 
 
+import fnmatch
 import glob
 import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
 
-import numpy as np
+#: file extensions considered by :func:`scan_image_files`
+IMAGE_EXTENSIONS = ['.jpg', '.jpeg', '.png', '.tif', '.tiff', '.bmp']
+#: sort modes of :func:`scan_image_files`
+SORT_MODES = ['natural', 'name', 'time']
+
+_DIGITS = re.compile(r'(\d+)')
 
 def data_dir():
     """Basic data directory of pylapsy (containing example images)"""
@@ -65,7 +74,25 @@ def get_test_img(which=1):
                                 .format(len(files)))
     return files[idx]
 
-def find_image_files(dir_name=None, file_pattern=None, req_same_type=True):
+def natural_sort_key(file_path):
+    """Sort key for natural order of file names (e.g. img2 before img10)
+    
+    Parameters
+    ----------
+    file_path : str
+        file path (only the file name is considered)
+        
+    Returns
+    -------
+    tuple
+        alternating text and integer parts of lower case file name
+    """
+    parts = _DIGITS.split(os.path.basename(file_path).lower())
+    parts[1::2] = map(int, parts[1::2])
+    return tuple(parts)
+
+def find_image_files(dir_name=None, file_pattern=None, req_same_type=True,
+                     sort='natural'):
     """Find image files in input directory
     
     Parameters
@@ -78,19 +105,152 @@ def find_image_files(dir_name=None, file_pattern=None, req_same_type=True):
     req_same_type : bool
         if True and multiple file endings are found, then an exception is 
         raised
+    sort : str, optional
+        "natural" (default) or "name" sorts by file name (cf. 
+        :func:`natural_sort_key`), None returns the files in file system 
+        order
         
     Returns
     -------
     list
         list with file paths
     """
+    if dir_name is None:
+        dir_name = '.'
     if file_pattern is None:
         file_pattern = '*.*'
-    files = glob.glob('{}/{}'.format(dir_name, file_pattern))
+    files = glob.glob(os.path.join(glob.escape(str(dir_name)), file_pattern))
     if req_same_type:
-        exts = np.unique([os.path.splitext(x)[1] for x in files])
+        exts = sorted(set(os.path.splitext(x)[1] for x in files))
         if len(exts) > 1:
             raise ValueError('Found multiple file types: {}'.format(exts))
+    if sort == 'natural':
+        files.sort(key=natural_sort_key)
+    elif sort == 'name':
+        files.sort()
+    elif sort is not None:
+        raise ValueError('Invalid sort mode {}'.format(sort))
     return files
+
+def _acq_time(file_path):
+    from pylapsy.helpers import load_exif_from_image_file
+    return load_exif_from_image_file(file_path).get('acq_time')
+
+def scan_image_files(dir_name=None, file_pattern=None, extensions=None, 
+                     sort='natural', workers=None, manifest=False):
+    """Scan directory for image files (fast for large directories)
+    
+    Uses :func:`os.scandir`, which retrieves the file type and status 
+    without additional system calls on most platforms.
+    
+    Parameters
+    ----------
+    dir_name : str, optional
+        input directory, if None, current directory is used
+    file_pattern : str, optional
+        additional glob style pattern for file names (e.g. DSC_*)
+    extensions : list, optional
+        file extensions that are considered (case insensitive), defaults to 
+        :attr:`IMAGE_EXTENSIONS`
+    sort : str
+        "natural" (natural file name order, cf. :func:`natural_sort_key`), 
+        "name" (lexicographic) or "time" (EXIF capture time, file 
+        modification time for files without EXIF information, read in 
+        parallel from the file headers, cf. 
+        :func:`pylapsy.probe.probe_header`)
+    workers : int, optional
+        number of threads used to read the capture times
+    manifest : bool or str
+        if True or a file path, the scan result is stored in a manifest file
+        (cf. :class:`pylapsy.manifest.Manifest`, by default located in the 
+        image directory) and reused in later scans as long as the directory 
+        and the scan settings are unchanged. Information about unchanged 
+        files (e.g. capture times or transforms) is also kept if the 
+        directory has changed.
+        
+    Returns
+    -------
+    list
+        list with file paths
+    """
+    from pylapsy.manifest import Manifest, MANIFEST_FILENAME
+    if dir_name is None:
+        dir_name = '.'
+    dir_name = str(dir_name)
+    if extensions is None:
+        extensions = IMAGE_EXTENSIONS
+    if not sort in SORT_MODES:
+        raise ValueError('Invalid sort mode {}. Choose from {}'
+                         .format(sort, SORT_MODES))
+    extensions = sorted(set(ext.lower() for ext in extensions))
+    settings = dict(file_pattern=file_pattern, extensions=extensions, 
+                    sort=sort)
+    
+    previous = None
+    if manifest:
+        path = manifest if isinstance(manifest, str) else os.path.join(
+            dir_name, MANIFEST_FILENAME)
+        if os.path.exists(path):
+            try:
+                m = Manifest.load(path)
+            except ValueError:
+                m = Manifest()
+            if (m.info.get('scan') == settings and m.info.get('dir_mtime_ns')
+                == os.stat(dir_name).st_mtime_ns):
+                return m.files
+            previous = m
+    
+    if manifest and not os.path.exists(path):
+        # create manifest file before scanning, such that the directory 
+        # modification time stored in the manifest stays valid
+        open(path, 'a').close()
+    basedir = os.path.abspath(dir_name)
+    items = []
+    it = os.scandir(dir_name)
+    try:
+        for item in it:
+            name = item.name
+            if not os.path.splitext(name)[1].lower() in extensions:
+                continue
+            elif file_pattern is not None and not fnmatch.fnmatch(
+                    name, file_pattern):
+                continue
+            elif not item.is_file():
+                continue
+            items.append(item)
+    finally:
+        # scandir iterator has no close method before Python 3.6
+        if hasattr(it, 'close'):
+            it.close()
+    
+    if not manifest and sort != 'time':
+        # no file status required
+        names = [item.name for item in items]
+        names.sort(key=natural_sort_key if sort == 'natural' else None)
+        return [os.path.join(basedir, name) for name in names]
+    
+    entries = [Manifest.file_entry(os.path.join(basedir, item.name), 
+                                   item.stat()) for item in items]
+    if previous is not None:
+        # e.g. capture times, headers or transforms of unchanged files
+        Manifest(entries).reuse(previous)
+    if sort == 'time':
+        todo = [e for e in entries if not 'acq_time' in e]
+        with ThreadPoolExecutor(workers) as executor:
+            times = executor.map(_acq_time, [e['path'] for e in todo])
+            for entry, acq_time in zip(todo, times):
+                entry['acq_time'] = acq_time
+        entries.sort(key=lambda e : (
+            e['acq_time'] or datetime.fromtimestamp(e['mtime_ns'] / 1e9), 
+            natural_sort_key(e['path'])))
+    elif sort == 'natural':
+        entries.sort(key=lambda e : natural_sort_key(e['path']))
+    else:
+        entries.sort(key=lambda e : os.path.basename(e['path']))
+    
+    if manifest:
+        Manifest(entries, scan=settings, 
+                 dir_mtime_ns=os.stat(dir_name).st_mtime_ns).save(path)
+    return [e['path'] for e in entries]
     
     
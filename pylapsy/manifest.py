@@ -0,0 +1,340 @@
+# -*- coding: utf-8 -*-
+#
+# This module is part of pylapsy.
+# It is licensed under a GPL-3.0 license, for details see LICENSE file.
+#
+# Author: Jonas Gliß
+# Copyright (C) 2019 Jonas Gliss (jonasgliss@gmail.com)
+# GitHub: jgliss
+# Email: jonasgliss@gmail.com
+"""
+Sequence manifest: persistent, ordered list of the frames of a sequence
+"""
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from itertools import islice
+
+import numpy as np
+
+from pylapsy import probe
+from pylapsy.transform_cache import file_key
+
+#: default file name of manifest (stored in image directory)
+MANIFEST_FILENAME = '.pylapsy_manifest.jsonl'
+#: version of manifest format
+MANIFEST_VERSION = 1
+#: format of capture times in manifest file (ISO 8601)
+ACQ_TIME_FORMAT = '%Y-%m-%dT%H:%M:%S.%f'
+
+class Manifest(object):
+    """Ordered list of frames with file information
+
+    The manifest is stored as JSON lines file: the first line contains
+    general information (e.g. scan settings), each following line one frame.
+    File paths are stored relative to the location of the manifest file.
+    
+    Besides file size and modification time, each frame may contain the 
+    file header information (`header`, cf. 
+    :func:`pylapsy.probe.probe_header`), the capture time (`acq_time`) and
+    estimated transforms (`transforms`, keyed by the hash of the estimator 
+    settings, cf. :func:`pylapsy.transform_cache.make_param_key`). An 
+    :class:`pylapsy.ImageList` can be created from a manifest (or a range 
+    of it, e.g. to distribute work across machines) without accessing the 
+    image files, and the manifest can be used as transform cache in 
+    :func:`pylapsy.Deshaker.find_shifts` (same interface as 
+    :class:`pylapsy.TransformCache`).
+
+    Parameters
+    ----------
+    entries : list, optional
+        one dict per frame, containing at least the file path (`path`).
+        Further keys are `size` (bytes), `mtime_ns` (modification time),
+        `header`, `acq_time` (datetime or None) and `transforms`.
+    **info
+        general information (JSON serialisable)
+    
+    Attributes
+    ----------
+    path : str
+        location of manifest file (set when loading or saving)
+    """
+    def __init__(self, entries=None, **info):
+        self.entries = [] if entries is None else list(entries)
+        self.info = info
+        self.path = None
+        self._index = None
+
+    @property
+    def files(self):
+        """List with image file paths"""
+        return [e['path'] for e in self.entries]
+
+    def __len__(self):
+        return len(self.entries)
+    
+    def __getitem__(self, val):
+        """Frame entry at input index or manifest of range (input slice)"""
+        if isinstance(val, slice):
+            return Manifest(self.entries[val], **self.info)
+        return self.entries[val]
+    
+    def split(self, num):
+        """Split frames into contiguous ranges of about equal size
+        
+        Parameters
+        ----------
+        num : int
+            number of ranges (e.g. number of machines)
+            
+        Returns
+        -------
+        list
+            (start, stop) index of each range
+        """
+        if num < 1:
+            raise ValueError('Need at least one range')
+        bounds = np.arange(num + 1) * len(self) // num
+        return [(int(a), int(b)) for a, b in zip(bounds[:-1], bounds[1:])]
+    
+    @classmethod
+    def from_files(cls, files, probe_headers=True, workers=None, **info):
+        """Create manifest for list of image files
+        
+        Parameters
+        ----------
+        files : list
+            image files
+        probe_headers : bool
+            if True, file headers (dimensions and capture time) are read
+            (in parallel threads)
+        workers : int, optional
+            number of threads
+        **info
+            general information
+            
+        Returns
+        -------
+        Manifest
+        """
+        func = _probe_entry if probe_headers else cls.file_entry
+        with ThreadPoolExecutor(workers) as executor:
+            entries = list(executor.map(func, files))
+        return cls(entries, **info)
+    
+    @staticmethod
+    def file_entry(file_path, stat=None):
+        """Create frame entry from file status
+
+        Parameters
+        ----------
+        file_path : str
+            image file
+        stat : os.stat_result, optional
+            file status (e.g. from :func:`os.scandir`), retrieved if None
+
+        Returns
+        -------
+        dict
+            path, size and mtime_ns of file
+        """
+        if stat is None:
+            stat = os.stat(file_path)
+        return dict(path=file_path, size=stat.st_size,
+                    mtime_ns=stat.st_mtime_ns)
+
+    def save(self, path=None):
+        """Save manifest file
+
+        Parameters
+        ----------
+        path : str, optional
+            output file path, defaults to :attr:`path`
+            
+        Returns
+        -------
+        bool
+            True (same interface as :func:`pylapsy.TransformCache.save`)
+        """
+        if path is None:
+            path = self.path
+        if path is None:
+            raise ValueError('Need output file path')
+        self.path = path
+        basedir = os.path.dirname(os.path.abspath(path))
+        with open(path, 'w') as f:
+            f.write(json.dumps(dict(pylapsy_manifest=MANIFEST_VERSION,
+                                    **self.info)) + '\n')
+            for entry in self.entries:
+                f.write(json.dumps(self._encode(entry, basedir)) + '\n')
+        return True
+
+    @classmethod
+    def load(cls, path, start=None, stop=None):
+        """Load manifest file
+
+        Parameters
+        ----------
+        path : str
+            manifest file
+        start : int, optional
+            index of first frame that is loaded
+        stop : int, optional
+            index after last frame that is loaded (e.g. from :func:`split`)
+
+        Returns
+        -------
+        Manifest
+
+        Raises
+        ------
+        ValueError
+            if the file is not a (supported) manifest file
+        """
+        basedir = os.path.dirname(os.path.abspath(path))
+        with open(path) as f:
+            try:
+                info = json.loads(f.readline())
+            except ValueError:
+                info = None
+            if not isinstance(info, dict) or not 'pylapsy_manifest' in info:
+                raise ValueError('{} is not a pylapsy manifest file'
+                                 .format(path))
+            version = info.pop('pylapsy_manifest')
+            if version > MANIFEST_VERSION:
+                raise ValueError('Unsupported manifest version {}'
+                                 .format(version))
+            lines = islice(f, start, stop)
+            entries = [cls._decode(json.loads(line), basedir) 
+                       for line in lines if line.strip()]
+        manifest = cls(entries, **info)
+        if start is None and stop is None:
+            manifest.path = path
+        return manifest
+    
+    def get(self, file_path, param_key):
+        """Get stored transform of image file
+        
+        Parameters
+        ----------
+        file_path : str
+            image file
+        param_key : str
+            estimator parameter hash
+            
+        Returns
+        -------
+        tuple or None
+            (dx, dy, M) or None, if not available or if the file was 
+            modified
+        """
+        path, size, mtime = file_key(file_path)
+        entry = self._get_index().get(path)
+        if (entry is None or entry.get('size') != size or 
+            entry.get('mtime_ns') != mtime):
+            return None
+        val = entry.get('transforms', {}).get(param_key)
+        if val is None:
+            return None
+        return (val[0], val[1], np.asarray(val[2], dtype=np.float64))
+    
+    def lookup(self, files, param_key):
+        """Get stored transforms for list of image files (cf. :func:`get`)"""
+        return [self.get(f, param_key) for f in files]
+    
+    def update(self, files, param_key, results):
+        """Store transforms of image files
+        
+        Files that are not part of the manifest are appended.
+        
+        Parameters
+        ----------
+        files : list
+            image files
+        param_key : str
+            estimator parameter hash
+        results : list
+            (dx, dy, M) for each file
+        """
+        index = self._get_index()
+        for file, (dx, dy, m) in zip(files, results):
+            path = os.path.abspath(file)
+            entry = index.get(path)
+            if entry is None:
+                entry = self.file_entry(path)
+                self.entries.append(entry)
+                index[path] = entry
+            else:
+                # transforms of previous file version are invalid
+                stat = os.stat(path)
+                if (entry.get('size') != stat.st_size or 
+                    entry.get('mtime_ns') != stat.st_mtime_ns):
+                    entry.update(self.file_entry(path, stat))
+                    entry.pop('transforms', None)
+            transforms = entry.setdefault('transforms', {})
+            transforms[param_key] = [float(dx), float(dy), 
+                                     np.asarray(m, dtype=float).tolist()]
+
+    def reuse(self, other):
+        """Copy information of unchanged frames from other manifest
+        
+        Entries of frames whose file size and modification time match are
+        complemented with the information of the other manifest (e.g. 
+        capture time, header or transforms), existing keys are kept.
+        
+        Parameters
+        ----------
+        other : Manifest
+            e.g. previous version of this manifest
+        """
+        index = other._get_index()
+        for entry in self.entries:
+            prev = index.get(os.path.abspath(entry['path']))
+            if (prev is None or prev.get('size') != entry.get('size') or
+                prev.get('mtime_ns') != entry.get('mtime_ns')):
+                continue
+            for key, val in prev.items():
+                entry.setdefault(key, val)
+    
+    def _get_index(self):
+        """Frame entries by absolute file path"""
+        if self._index is None or len(self._index) != len(self.entries):
+            self._index = {os.path.abspath(e['path']) : e 
+                           for e in self.entries}
+        return self._index
+
+    @staticmethod
+    def _encode(entry, basedir):
+        entry = dict(entry)
+        path = os.path.abspath(entry['path'])
+        if path.startswith(basedir + os.sep): # fast path, file in basedir
+            entry['path'] = path[len(basedir) + 1:]
+        else:
+            try:
+                entry['path'] = os.path.relpath(path, basedir)
+            except ValueError: # e.g. different drive on Windows
+                entry['path'] = path
+        if isinstance(entry.get('acq_time'), datetime):
+            entry['acq_time'] = entry['acq_time'].strftime(ACQ_TIME_FORMAT)
+        return entry
+
+    @staticmethod
+    def _decode(entry, basedir):
+        entry['path'] = os.path.normpath(os.path.join(basedir, entry['path']))
+        val = entry.get('acq_time')
+        if val is not None:
+            # fractional seconds may be missing in older manifest files
+            fmt = ACQ_TIME_FORMAT if '.' in val else ACQ_TIME_FORMAT[:-3]
+            entry['acq_time'] = datetime.strptime(val, fmt)
+        return entry
+
+def _probe_entry(file_path):
+    entry = Manifest.file_entry(file_path)
+    try:
+        header = probe.probe_header(file_path)
+    except (ValueError, OSError):
+        return entry
+    entry['header'] = header
+    entry['acq_time'] = probe.image_meta(header).get('acq_time')
+    return entry
@@ -0,0 +1,321 @@
+# -*- coding: utf-8 -*-
+#
+# This module is part of pylapsy.
+# It is licensed under a GPL-3.0 license, for details see LICENSE file.
+#
+# Author: Jonas Gliß
+# Copyright (C) 2019 Jonas Gliss (jonasgliss@gmail.com)
+# GitHub: jgliss
+# Email: jonasgliss@gmail.com
+"""
+Cheap probing of image dimensions and EXIF information from file headers 
+(without decoding)
+"""
+import io
+import struct
+from datetime import datetime, timedelta
+
+import numpy as np
+
+#: PNG file signature
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+#: number of channels for PNG colour types
+PNG_CHANNELS = {0 : 1, 2 : 3, 3 : 3, 4 : 2, 6 : 4}
+#: JPEG start of frame markers (all except DHT, JPG and DAC)
+JPEG_SOF_MARKERS = set(range(0xC0, 0xD0)) - {0xC4, 0xC8, 0xCC}
+#: JPEG markers without payload
+JPEG_STANDALONE_MARKERS = set(range(0xD0, 0xD8)) | {0x01}
+#: TIFF tags describing the image structure (only read from TIFF files)
+TIFF_IMAGE_TAGS = {0x0100 : 'width',
+                   0x0101 : 'height',
+                   0x0102 : 'bits_per_sample',
+                   0x0115 : 'samples_per_pixel'}
+#: EXIF tags that are read (IFD0 and EXIF IFD)
+EXIF_TAGS = {0x010F : 'make',
+             0x0110 : 'model',
+             0x0112 : 'orientation',
+             0x0132 : 'date_time',
+             0x829A : 'exposure_time',
+             0x829D : 'f_number',
+             0x8827 : 'iso',
+             0x9003 : 'date_time_original',
+             0x9011 : 'offset_time_original',
+             0x9291 : 'subsec_time_original',
+             0x920A : 'focal_length'}
+#: pointer to EXIF IFD
+EXIF_IFD_POINTER = 0x8769
+#: struct format for TIFF field types (rationals are 2 values)
+TIFF_TYPES = {1 : 'B', 2 : 's', 3 : 'H', 4 : 'I', 5 : 'II', 6 : 'b', 7 : 'B',
+              8 : 'h', 9 : 'i', 10 : 'ii', 11 : 'f', 12 : 'd'}
+#: maximum number of entries in an IFD (protection against corrupt files)
+MAX_IFD_ENTRIES = 1024
+#: format of EXIF date and time strings
+EXIF_DATETIME_FORMAT = '%Y:%m:%d %H:%M:%S'
+
+def probe_header(file_path):
+    """Read image dimensions and EXIF information from header of image file
+
+    Supports JPEG (start of frame segment and EXIF segment), PNG (IHDR 
+    chunk) and TIFF (first IFD and EXIF IFD) files. Only the file headers 
+    are read, not the image data.
+
+    Parameters
+    ----------
+    file_path : str
+        image file path
+
+    Returns
+    -------
+    dict
+        format ("jpeg", "png" or "tiff"), width, height, channels, bitdepth 
+        and orientation (EXIF orientation, 1 if not available) as stored in 
+        the file and available EXIF fields (key "exif", names of fields are
+        the values of :attr:`EXIF_TAGS`)
+
+    Raises
+    ------
+    ValueError
+        if the file format is not supported or the header is invalid
+    """
+    with open(file_path, 'rb') as f:
+        start = f.read(8)
+        if start[:2] == b'\xff\xd8':
+            f.seek(2)
+            return _probe_jpeg(f)
+        elif start == PNG_SIGNATURE:
+            return _probe_png(f)
+        elif start[:4] in (b'II*\x00', b'MM\x00*'):
+            f.seek(0)
+            return _probe_tiff(f)
+    raise ValueError('Unsupported or invalid image file: {}'
+                     .format(file_path))
+
+def decoded_shape(info, pyrlevel=0):
+    """Shape of image array as decoded by pylapsy
+
+    Full images are decoded as 3 channel color images (cf.
+    :func:`pylapsy.utils.imread`), downscaled images as gray images (cf.
+    :func:`pylapsy.utils.imread_reduced_gray`). EXIF orientation is applied
+    by OpenCV while decoding.
+
+    Parameters
+    ----------
+    info : dict
+        header information (cf. :func:`probe_header`)
+    pyrlevel : int
+        pyramid level of reduced decoding (0: full image)
+
+    Returns
+    -------
+    tuple
+        shape of decoded image array
+    """
+    w, h = info['width'], info['height']
+    if info['orientation'] in (5, 6, 7, 8):
+        w, h = h, w
+    if pyrlevel == 0:
+        return (h, w, 3)
+    scale = 2 ** min(pyrlevel, 3)
+    if info['format'] == 'jpeg':
+        # libjpeg scales in DCT domain and rounds up
+        w, h = -(-w // scale), -(-h // scale)
+    else:
+        w, h = w // scale, h // scale
+    for _ in range(pyrlevel - 3):
+        w, h = (w + 1) // 2, (h + 1) // 2
+    return (h, w)
+
+def image_meta(info):
+    """Image meta information from EXIF fields in header information
+
+    Parameters
+    ----------
+    info : dict
+        header information (cf. :func:`probe_header`)
+
+    Returns
+    -------
+    dict
+        acquisition time (`acq_time`, datetime, from DateTimeOriginal or 
+        DateTime) and available EXIF fields exposure_time (s), f_number, 
+        iso, focal_length (mm), make and model (cf. 
+        :class:`pylapsy.ImageMetaData`)
+    """
+    exif = info.get('exif', {})
+    meta = {}
+    acq_time = parse_exif_datetime(exif.get('date_time_original'),
+                                   exif.get('subsec_time_original'))
+    if acq_time is None:
+        acq_time = parse_exif_datetime(exif.get('date_time'))
+    if acq_time is not None:
+        meta['acq_time'] = acq_time
+    for key in ['exposure_time', 'f_number', 'iso', 'focal_length', 'make',
+                'model']:
+        if key in exif:
+            meta[key] = exif[key]
+    return meta
+
+def parse_exif_datetime(val, subsec=None):
+    """Convert EXIF date and time string to datetime
+
+    Parameters
+    ----------
+    val : str, optional
+        date and time (e.g. "2019:09:01 12:14:02")
+    subsec : str, optional
+        fractional seconds (digits, e.g. "25" for 0.25 s)
+
+    Returns
+    -------
+    datetime or None
+        None, if input is None or invalid
+    """
+    if not isinstance(val, str):
+        return None
+    try:
+        dt = datetime.strptime(val.strip(), EXIF_DATETIME_FORMAT)
+    except ValueError:
+        return None
+    if isinstance(subsec, str) and subsec.strip().isdigit():
+        subsec = subsec.strip()
+        dt += timedelta(seconds=int(subsec) / 10**len(subsec))
+    return dt
+
+def decoded_dtype(info):
+    """Data type of image array as decoded by pylapsy
+
+    Parameters
+    ----------
+    info : dict
+        header information (cf. :func:`probe_header`)
+
+    Returns
+    -------
+    numpy.dtype
+        always uint8, since images are decoded with 8 bit depth
+    """
+    return np.dtype(np.uint8)
+
+def _read_exact(f, num):
+    data = f.read(num)
+    if len(data) != num:
+        raise ValueError('Unexpected end of file')
+    return data
+
+def _probe_png(f):
+    length, chunk = struct.unpack('>I4s', _read_exact(f, 8))
+    if chunk != b'IHDR' or length < 13:
+        raise ValueError('Invalid PNG file, IHDR chunk missing')
+    w, h, bitdepth, colortype = struct.unpack('>IIBB', _read_exact(f, 10))
+    if not colortype in PNG_CHANNELS:
+        raise ValueError('Invalid PNG colour type {}'.format(colortype))
+    return dict(format='png', width=w, height=h,
+                channels=PNG_CHANNELS[colortype], bitdepth=bitdepth,
+                orientation=1, exif={})
+
+def _probe_tiff(f):
+    try:
+        tags = _read_tiff(f, {**TIFF_IMAGE_TAGS, **EXIF_TAGS})
+    except struct.error:
+        raise ValueError('Invalid TIFF file')
+    if not 'width' in tags or not 'height' in tags:
+        raise ValueError('Invalid TIFF file, image dimensions missing')
+    bitdepth = tags.get('bits_per_sample', 1)
+    if isinstance(bitdepth, tuple):
+        bitdepth = bitdepth[0]
+    exif = {k : v for k, v in tags.items() if k in EXIF_TAGS.values()}
+    return dict(format='tiff', width=tags['width'], height=tags['height'],
+                channels=tags.get('samples_per_pixel', 1), bitdepth=bitdepth,
+                orientation=exif.get('orientation', 1), exif=exif)
+
+def _probe_jpeg(f):
+    exif = {}
+    while True:
+        byte = _read_exact(f, 1)
+        if byte != b'\xff':
+            raise ValueError('Invalid JPEG file, expected marker')
+        marker = _read_exact(f, 1)[0]
+        while marker == 0xFF: # fill bytes
+            marker = _read_exact(f, 1)[0]
+        if marker in JPEG_STANDALONE_MARKERS:
+            continue
+        length = struct.unpack('>H', _read_exact(f, 2))[0] - 2
+        if length < 0:
+            raise ValueError('Invalid JPEG segment length')
+        if marker in JPEG_SOF_MARKERS:
+            bitdepth, h, w, channels = struct.unpack('>BHHB',
+                                                     _read_exact(f, 6))
+            return dict(format='jpeg', width=w, height=h, channels=channels,
+                        bitdepth=bitdepth, 
+                        orientation=exif.get('orientation', 1), exif=exif)
+        elif marker == 0xDA: # start of scan, no frame header found
+            raise ValueError('Invalid JPEG file, no frame header')
+        data = _read_exact(f, length)
+        if marker == 0xE1 and data[:6] == b'Exif\x00\x00' and not exif:
+            try:
+                exif = _read_tiff(io.BytesIO(data[6:]), EXIF_TAGS)
+            except (ValueError, struct.error):
+                exif = {} # corrupt EXIF data is ignored
+
+def _read_tiff(f, tags):
+    """Read tags from first IFD and EXIF IFD of TIFF structure
+    
+    Parameters
+    ----------
+    f : file-like
+        TIFF structure, starting at current position
+    tags : dict
+        tags to be read (tag number: name)
+        
+    Returns
+    -------
+    dict
+        values of available tags (name: value)
+    """
+    base = f.tell()
+    order = _read_exact(f, 2)
+    if not order in (b'II', b'MM'):
+        raise ValueError('Invalid TIFF byte order')
+    endian = '<' if order == b'II' else '>'
+    magic, offs = struct.unpack(endian + 'HI', _read_exact(f, 6))
+    if magic != 42:
+        raise ValueError('Unsupported TIFF format (e.g. BigTIFF)')
+    result = {}
+    exif_offs = _read_ifd(f, base, offs, endian, tags, result)
+    if exif_offs is not None:
+        _read_ifd(f, base, exif_offs, endian, tags, result)
+    return result
+
+def _read_ifd(f, base, offs, endian, tags, result):
+    f.seek(base + offs)
+    num = struct.unpack(endian + 'H', _read_exact(f, 2))[0]
+    if num > MAX_IFD_ENTRIES:
+        raise ValueError('Invalid TIFF IFD')
+    entries = _read_exact(f, 12 * num)
+    exif_offs = None
+    for i in range(num):
+        tag, typ, count = struct.unpack(endian + 'HHI', 
+                                        entries[12 * i:12 * i + 8])
+        raw = entries[12 * i + 8:12 * i + 12]
+        if tag == EXIF_IFD_POINTER:
+            exif_offs = struct.unpack(endian + 'I', raw)[0]
+            continue
+        elif not tag in tags or not typ in TIFF_TYPES:
+            continue
+        fmt = TIFF_TYPES[typ]
+        size = struct.calcsize(endian + fmt) * count
+        if size > 4:
+            pos = f.tell()
+            f.seek(base + struct.unpack(endian + 'I', raw)[0])
+            raw = _read_exact(f, size)
+            f.seek(pos)
+        if typ == 2: # ASCII
+            val = raw[:count].split(b'\x00')[0].decode('ascii', 'replace')
+        else:
+            vals = struct.unpack(endian + fmt * count, raw[:size])
+            if len(fmt) == 2: # rational
+                vals = [n / d if d != 0 else np.nan 
+                        for n, d in zip(vals[::2], vals[1::2])]
+            val = vals[0] if count == 1 else tuple(vals)
+        result[tags[tag]] = val
+    return exif_offs
@@ -0,0 +1,205 @@
+# -*- coding: utf-8 -*-
+#
+# This module is part of pylapsy.
+# It is licensed under a GPL-3.0 license, for details see LICENSE file.
+#
+# Author: Jonas Gliß
+# Copyright (C) 2019 Jonas Gliss (jonasgliss@gmail.com)
+# GitHub: jgliss
+# Email: jonasgliss@gmail.com
+"""
+Progress events of long running tasks (shift estimation and rendering)
+
+Progress is reported by calling a callback with a :class:`ProgressEvent`.
+Results of parallel workers are counted as they are collected in the main 
+thread (cf. :func:`pylapsy.ExecutorConfig.imap`), independent of the 
+backend.
+"""
+import sys
+import threading
+from collections import namedtuple
+from datetime import timedelta
+from time import perf_counter
+
+from pylapsy import print_log
+
+#: progress information passed to callbacks. `stage` is the name of the task
+#: (e.g. "estimate" or "render"), `completed` and `total` the number of
+#: processed and all frames (total is None if unknown), `elapsed` the time
+#: since start (s), `fps` the throughput (frames/s) and `eta` the estimated
+#: remaining time (s, None if unknown)
+ProgressEvent = namedtuple('ProgressEvent', ['stage', 'completed', 'total',
+                                             'elapsed', 'fps', 'eta'])
+
+class ProgressTracker(object):
+    """Counts completed frames and emits progress events
+
+    Parameters
+    ----------
+    callback : callable
+        called with a :class:`ProgressEvent`
+    total : int, optional
+        total number of frames
+    stage : str
+        name of task
+    min_interval : float
+        minimum time between two events (s), the first and the final event
+        are always emitted
+    """
+    def __init__(self, callback, total=None, stage='', min_interval=0.2):
+        self.callback = callback
+        self.total = total
+        self.stage = stage
+        self.min_interval = min_interval
+        self.completed = 0
+        self._start = None
+        self._last = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_input(cls, val, total=None, stage=''):
+        """Create tracker from flexible input
+
+        Parameters
+        ----------
+        val : ProgressTracker or callable, optional
+            existing tracker (returned as is) or callback. None returns None.
+        total : int, optional
+            total number of frames (only used for new tracker)
+        stage : str
+            name of task (only used for new tracker)
+
+        Returns
+        -------
+        ProgressTracker or None
+        """
+        if val is None or isinstance(val, ProgressTracker):
+            return val
+        elif callable(val):
+            return cls(val, total, stage)
+        raise ValueError('Invalid input for progress: {}'.format(val))
+
+    @property
+    def started(self):
+        """True if :func:`start` was called"""
+        return self._start is not None
+
+    def start(self):
+        """Start timer and emit initial event (only on first call)"""
+        with self._lock:
+            if self._start is None:
+                self._start = perf_counter()
+                self._emit(self._start)
+
+    def update(self, num=1):
+        """Add completed frames
+
+        Parameters
+        ----------
+        num : int
+            number of frames completed since last update
+        """
+        if not self.started:
+            self.start()
+        with self._lock:
+            self.completed += num
+            now = perf_counter()
+            done = self.total is not None and self.completed >= self.total
+            if (done or self._last is None or
+                now - self._last >= self.min_interval):
+                self._emit(now)
+
+    def event(self, now=None):
+        """Current progress
+
+        Returns
+        -------
+        ProgressEvent
+        """
+        if now is None:
+            now = perf_counter()
+        elapsed = 0.0 if self._start is None else now - self._start
+        fps = self.completed / elapsed if elapsed > 0 else None
+        eta = None
+        if self.total is not None and fps:
+            eta = max(self.total - self.completed, 0) / fps
+        elif self.total is not None and self.completed >= self.total:
+            eta = 0.0
+        return ProgressEvent(self.stage, self.completed, self.total, elapsed,
+                             fps, eta)
+
+    def _emit(self, now):
+        self._last = now
+        self.callback(self.event(now))
+
+class ProgressBar(object):
+    """Callback that displays progress events as text progress bar
+
+    Parameters
+    ----------
+    width : int
+        number of characters of bar
+    stream : file-like, optional
+        output stream, defaults to :attr:`sys.stderr`
+    """
+    def __init__(self, width=30, stream=None):
+        self.width = width
+        self.stream = stream
+
+    def __call__(self, event):
+        stream = sys.stderr if self.stream is None else self.stream
+        stream.write('\r' + format_event(event, self.width))
+        if event.total is not None and event.completed >= event.total:
+            stream.write('\n')
+        stream.flush()
+
+class ProgressLog(object):
+    """Callback that logs progress events in steps of percent
+
+    Parameters
+    ----------
+    step : float
+        logging interval in percent of the total number of frames
+    """
+    def __init__(self, step=10):
+        self.step = step
+        self._next = {}
+
+    def __call__(self, event):
+        if event.total is None or event.total == 0:
+            return
+        percent = 100 * event.completed / event.total
+        if percent >= self._next.get(event.stage, 0):
+            print_log.info(format_event(event))
+            self._next[event.stage] = (percent // self.step + 1) * self.step
+
+def format_event(event, width=None):
+    """Format progress event as text
+
+    Parameters
+    ----------
+    event : ProgressEvent
+        progress information
+    width : int, optional
+        if specified, a progress bar of that width is included
+
+    Returns
+    -------
+    str
+        e.g. "estimate 40/100 (40%) 12.3 frames/s ETA 0:00:05"
+    """
+    items = [event.stage] if event.stage else []
+    if event.total:
+        frac = min(event.completed / event.total, 1)
+        if width:
+            num = int(round(frac * width))
+            items.append('[{}{}]'.format('#' * num, '.' * (width - num)))
+        items.append('{}/{} ({:.0f}%)'.format(event.completed, event.total,
+                                              100 * frac))
+    else:
+        items.append(str(event.completed))
+    if event.fps:
+        items.append('{:.1f} frames/s'.format(event.fps))
+    if event.eta is not None:
+        items.append('ETA {}'.format(timedelta(seconds=round(event.eta))))
+    return ' '.join(items)
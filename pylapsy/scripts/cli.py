@@ -66,8 +66,9 @@ def make_parser():
                    help=('Processing task that is supposed to be performed. '
                          'Choose from: {}'.format(TASKS_AVAIL)))
     p.add_argument('-d', '--dir', default='.', 
-                   help=('Input directory containing timelapse sequence. '
-                         'Uses "." if unspecified'))
+                   help=('Input directory containing timelapse sequence '
+                         'or sequence manifest file. Uses "." if '
+                         'unspecified'))
     p.add_argument('-o', '--outdir',  
                    help=('Output directory for processed data. If unspecified '
                          'a subdirectory "pylapsy_out" is created in current '
@@ -75,8 +76,209 @@ def make_parser():
     p.add_argument('--file_pattern', default='*', 
                    help=('Filename pattern used to identify image files '
                          '(e.g. *.jpg)'))
+    p.add_argument('--sort', default='natural', 
+                   choices=['natural', 'name', 'time'],
+                   help=('Order of images: natural file name order, '
+                         'lexicographic or EXIF capture time'))
+    p.add_argument('--manifest', action='store_true',
+                   help=('Store directory scan and estimated shifts in a '
+                         'manifest file in the image directory and reuse it '
+                         'in later runs'))
+    p.add_argument('--range', type=int, nargs=2, default=None, 
+                   metavar=('START', 'STOP'),
+                   help=('Only process images START to STOP-1 (e.g. to '
+                         'distribute a sequence manifest across machines)'))
+    p.add_argument('--pyrlevel', type=int, default=None,
+                   help=('Pyramid level on which image shifts are estimated '
+                         '(0: full resolution, 1: half resolution, etc.). '
+                         'Uses pylapsy default if unspecified'))
+    p.add_argument('--refine', action='store_true',
+                   help=('Refine shifts estimated on pyramid level > 0 in a '
+                         'full resolution region of interest'))
+    p.add_argument('--backend', default=None, 
+                   choices=['serial', 'thread', 'process'],
+                   help=('Parallelisation backend. If unspecified, threads '
+                         'are used for shift estimation and processes for '
+                         'image processing'))
+    p.add_argument('--workers', type=int, default=None,
+                   help=('Number of parallel workers. Uses number of CPUs if '
+                         'unspecified'))
+    p.add_argument('--chunksize', type=int, default=None,
+                   help='Number of images submitted per parallel task')
+    p.add_argument('--maxinflight', type=int, default=None,
+                   help=('Maximum number of pending parallel tasks (limits '
+                         'memory usage)'))
+    p.add_argument('--cache', action='store_true',
+                   help=('Store estimated image shifts in a cache file in the '
+                         'input directory and reuse them in later runs'))
+    p.add_argument('--incremental', action='store_true',
+                   help=('Only process images that have not yet been '
+                         'processed in a previous run (e.g. for sequences '
+                         'that are still being shot)'))
+    p.add_argument('--mode', default=None, 
+                   choices=['reference', 'sequential'],
+                   help=('Shift estimation mode: align each image to the '
+                         'reference image (default) or align neighbouring '
+                         'images and chain the shifts'))
+    p.add_argument('--method', default=None, choices=['lk', 'phase'],
+                   help=('Shift estimation method: Lucas-Kanade feature '
+                         'tracking (default, shift and rotation) or phase '
+                         'correlation (faster, shift only)'))
+    p.add_argument('--keyframe_every', type=int, default=None,
+                   help=('Sequential mode: align every n-th image directly '
+                         'to the reference image to limit drift'))
+    p.add_argument('--smooth', type=int, default=None, metavar='WINDOW',
+                   help=('Smooth camera trajectory over WINDOW images '
+                         '(odd) instead of locking all images to the '
+                         'reference image'))
+    p.add_argument('--smooth_method', default=None, 
+                   choices=['moving_average', 'gaussian', 'savgol'],
+                   help='Trajectory smoothing method (default: gaussian)')
+    p.add_argument('--decode', default=None, choices=['full', 'reduced'],
+                   help=('Decode images for shift estimation in full '
+                         'resolution (default) or directly downscaled to '
+                         'PYRLEVEL (faster, JPEG only, no --refine)'))
+    p.add_argument('--quality', type=int, default=None,
+                   help='JPEG quality of output images (0-100)')
+    p.add_argument('--png_compression', type=int, default=None,
+                   help='PNG compression level of output images (0-9)')
+    p.add_argument('--fast_output', action='store_true',
+                   help=('Write fast, low compression PNG files (e.g. as '
+                         'input for a video encoder)'))
+    p.add_argument('--writers', type=int, default=None,
+                   help=('Number of dedicated threads for encoding and '
+                         'writing output images'))
+    p.add_argument('--video', default=None, metavar='PATH', nargs='?',
+                   const='',
+                   help=('Encode deshaked images into a video (default: '
+                         'pylapsy.mp4 in output directory)'))
+    p.add_argument('--fps', type=float, default=24,
+                   help='Frame rate of output video')
+    p.add_argument('--codec', default=None,
+                   help=('Video codec, FourCC for OpenCV (e.g. mp4v, MJPG) '
+                         'or ffmpeg encoder (e.g. libx264)'))
+    p.add_argument('--video_size', type=int, nargs=2, default=None,
+                   metavar=('WIDTH', 'HEIGHT'),
+                   help='Resize video frames')
+    p.add_argument('--video_backend', default='auto', 
+                   choices=['auto', 'opencv', 'ffmpeg'],
+                   help='Video encoder (auto: ffmpeg if available)')
+    p.add_argument('--video_only', action='store_true',
+                   help='Only write the video, no output images')
+    p.add_argument('--progress', action='store_true',
+                   help=('Show progress bar with throughput and ETA of '
+                         'shift estimation and rendering (instead of '
+                         'logging progress)'))
+    p.add_argument('--timing', default=None, metavar='PATH', nargs='?',
+                   const='',
+                   help=('Record durations of processing stages (decode, '
+                         'features, tracking, warping, encoding, ...) and '
+                         'print a summary. If PATH is given, a per frame '
+                         'report is saved (JSON, or CSV for .csv files)'))
     return p
 
+def get_video_params(args):
+    """Get video settings from parsed CLI arguments
+    
+    Parameters
+    ----------
+    args : Namespace
+        parsed arguments (cf. :func:`make_parser`)
+        
+    Returns
+    -------
+    dict or None
+        None, if no video is requested
+    """
+    if args.video is None and not args.video_only:
+        return None
+    params = dict(fps=args.fps, codec=args.codec, backend=args.video_backend)
+    if args.video:
+        params['path'] = args.video
+    if args.video_size is not None:
+        params['size'] = tuple(args.video_size)
+    return params
+
+def get_progress(args):
+    """Get progress callback from parsed CLI arguments
+    
+    Parameters
+    ----------
+    args : Namespace
+        parsed arguments (cf. :func:`make_parser`)
+        
+    Returns
+    -------
+    ProgressBar or None
+        None, if progress is logged (default)
+    """
+    from pylapsy.progress import ProgressBar
+    return ProgressBar() if args.progress else None
+
+def get_timing_report(args):
+    """Get timing report setting from parsed CLI arguments
+    
+    Parameters
+    ----------
+    args : Namespace
+        parsed arguments (cf. :func:`make_parser`)
+        
+    Returns
+    -------
+    bool or str
+        report file path, True (only summary) or False (no timing)
+    """
+    if args.timing is None:
+        return False
+    return args.timing or True
+
+def get_encode_params(args):
+    """Get encoding settings for output images from parsed CLI arguments
+    
+    Parameters
+    ----------
+    args : Namespace
+        parsed arguments (cf. :func:`make_parser`)
+        
+    Returns
+    -------
+    EncodeParams or None
+        None, if no encoding settings were provided
+    """
+    from pylapsy import EncodeParams
+    if args.fast_output:
+        params = dict(png_compression=1, ext='.png')
+    else:
+        params = {}
+    if args.quality is not None:
+        params['quality'] = args.quality
+    if args.png_compression is not None:
+        params['png_compression'] = args.png_compression
+    if len(params) == 0:
+        return None
+    return EncodeParams(**params)
+
+def get_executor(args):
+    """Get parallel execution settings from parsed CLI arguments
+    
+    Parameters
+    ----------
+    args : Namespace
+        parsed arguments (cf. :func:`make_parser`)
+        
+    Returns
+    -------
+    ExecutorConfig or None
+        None, if no parallelisation settings were provided
+    """
+    from pylapsy import ExecutorConfig
+    opts = [args.backend, args.workers, args.chunksize, args.maxinflight]
+    if all([x is None for x in opts]):
+        return None
+    backend = 'thread' if args.backend is None else args.backend
+    return ExecutorConfig(backend, args.workers, args.chunksize, 
+                          args.maxinflight)
+
 def cli():
     from pylapsy.highlevel_methods import deshake
     
@@ -102,7 +304,21 @@ def cli():
         if not imgdir.exists():
             raise FileNotFoundError('Input directory does not exist: {}'
                                     .format(imgdir))
-        deshake(imgdir,outdir=outdir)
+        video = get_video_params(args)
+        deshake(imgdir, file_pattern=args.file_pattern, sort=args.sort, 
+                manifest=args.manifest, frame_range=args.range, 
+                outdir=outdir, pyrlevel=args.pyrlevel, 
+                refine=args.refine or None, executor=get_executor(args),
+                cache=args.cache or None, incremental=args.incremental,
+                mode=args.mode, method=args.method, 
+                keyframe_every=args.keyframe_every,
+                smooth=args.smooth, smooth_method=args.smooth_method,
+                decode=args.decode, encode=get_encode_params(args), 
+                writers=args.writers, 
+                save_preview_video=video is not None, video=video, 
+                save_images=not args.video_only, 
+                timing_report=get_timing_report(args),
+                progress=get_progress(args))
         sys.exit()
         
 if __name__ == '__main__':
@@ -5,13 +5,258 @@ Created on Sat Feb 22 12:46:21 2020
 @author: Jonas
 """
 from functools import partial
-from concurrent.futures import ThreadPoolExecutor
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 from multiprocessing.pool import ThreadPool, Pool
-from pylapsy import utils
-from itertools import repeat
+from pylapsy import utils, defaults, timing
+from pylapsy.writers import EncodeParams, ImageWriter
+from pylapsy.progress import ProgressTracker
+from itertools import repeat, islice
+import numpy as np
 import os
+import threading
+try:
+    from multiprocessing import shared_memory
+except ImportError: # Python < 3.8
+    shared_memory = None
 
-def apply_concurrent_threadpool(func, iterable, numworkers=4):
+# reference used by worker processes in apply_shared_ref, assigned in 
+# _init_shared_ref_worker
+_WORKER_REF = None
+_WORKER_SHM = None
+# output buffers for rendering, one per worker thread (and process)
+_WORKER_BUFFERS = threading.local()
+
+class ExecutorConfig(object):
+    """Configuration of parallel execution
+    
+    Used by the methods in this module and accepted by 
+    :func:`pylapsy.Deshaker.find_shifts`, :func:`pylapsy.Deshaker.deshake`,
+    :func:`pylapsy.deshake` and the `ply` CLI.
+    
+    Parameters
+    ----------
+    backend : str
+        one of "serial", "thread" or "process"
+    numworkers : int, optional
+        number of threads / processes. Defaults to :func:`os.cpu_count`.
+    chunksize : int, optional
+        number of items submitted per task. Defaults to 1 for the thread 
+        backend and to a value that results in about 4 tasks per process 
+        for the process backend.
+    maxinflight : int, optional
+        maximum number of submitted tasks whose results have not yet been 
+        collected (bounds memory usage). Defaults to 2 * `numworkers`.
+    """
+    BACKENDS = ['serial', 'thread', 'process']
+    def __init__(self, backend='thread', numworkers=None, chunksize=None, 
+                 maxinflight=None):
+        if not backend in self.BACKENDS:
+            raise ValueError('Invalid backend {}. Choose from {}'
+                             .format(backend, self.BACKENDS))
+        for name, val in zip(['numworkers', 'chunksize', 'maxinflight'],
+                             [numworkers, chunksize, maxinflight]):
+            if val is not None and val < 1:
+                raise ValueError('Invalid input for {}: {}'.format(name, val))
+        self.backend = backend
+        self.numworkers = numworkers
+        self.chunksize = chunksize
+        self.maxinflight = maxinflight
+        
+    @classmethod
+    def from_input(cls, val=None):
+        """Create configuration from flexible input
+        
+        Parameters
+        ----------
+        val : ExecutorConfig, str, dict or bool, optional
+            existing configuration (returned as is), name of backend, dict 
+            with input args for this class, or bool (True: thread backend, 
+            False: serial backend). None returns the default configuration.
+            
+        Returns
+        -------
+        ExecutorConfig
+        """
+        if isinstance(val, ExecutorConfig):
+            return val
+        elif val is None or val is True:
+            return cls()
+        elif val is False:
+            return cls('serial')
+        elif isinstance(val, str):
+            return cls(val)
+        elif isinstance(val, dict):
+            return cls(**val)
+        raise ValueError('Invalid input for ExecutorConfig: {}'.format(val))
+    
+    @property
+    def workers(self):
+        """Number of workers that are used"""
+        if self.backend == 'serial':
+            return 1
+        elif self.numworkers is None:
+            return os.cpu_count() or 1
+        return self.numworkers
+    
+    @property
+    def max_inflight(self):
+        """Maximum number of pending tasks"""
+        if self.maxinflight is None:
+            return 2 * self.workers
+        return self.maxinflight
+    
+    def get_chunksize(self, numitems=None):
+        """Number of items per submitted task
+        
+        Parameters
+        ----------
+        numitems : int, optional
+            total number of items
+            
+        Returns
+        -------
+        int
+        """
+        if self.chunksize is not None:
+            return self.chunksize
+        elif self.backend == 'process' and numitems:
+            return max(1, int(np.ceil(numitems / (4 * self.workers))))
+        return 1
+    
+    def imap(self, func, iterable, initializer=None, initargs=(), 
+             progress=None):
+        """Apply function to all items of iterable
+        
+        Items are submitted lazily in chunks, such that at most 
+        :attr:`max_inflight` chunks are pending at a time.
+        
+        Parameters
+        ----------
+        func : callable
+            first argument is iterated over, provided via input `iterable`.
+            Needs to be picklable for the process backend.
+        iterable : iterable
+            list or similar containing first input arg for `func`
+        initializer : callable, optional
+            called at start of each worker (thread or process). If 
+            specified, a :class:`multiprocessing.pool.Pool` (or 
+            :class:`multiprocessing.pool.ThreadPool`) is used instead of 
+            the :mod:`concurrent.futures` executors, which only support 
+            initializers as of Python 3.7.
+        initargs : tuple
+            input arguments for `initializer`
+        progress : ProgressTracker or callable, optional
+            progress tracker or callback (cf. 
+            :class:`pylapsy.progress.ProgressTracker`), updated whenever 
+            results are collected
+            
+        Yields
+        ------
+        object
+            return value of `func` for each item in `iterable` (in input 
+            order)
+            
+        Note
+        ----
+        If a :class:`pylapsy.timing.StageTimer` is active, stage durations 
+        recorded in worker processes are added to it.
+        """
+        numitems = len(iterable) if hasattr(iterable, '__len__') else None
+        progress = ProgressTracker.from_input(progress, numitems)
+        if progress is not None:
+            progress.start()
+        if self.backend == 'serial':
+            if initializer is not None:
+                initializer(*initargs)
+            for item in iterable:
+                result = func(item)
+                if progress is not None:
+                    progress.update()
+                yield result
+            return
+        chunksize = self.get_chunksize(numitems)
+        maxinflight = self.max_inflight
+        
+        thread = self.backend == 'thread'
+        if initializer is None:
+            pool = (ThreadPoolExecutor if thread else 
+                    ProcessPoolExecutor)(self.workers)
+            submit = pool.submit
+        else:
+            pool = (ThreadPool if thread else Pool)(self.workers, initializer,
+                                                    initargs)
+            submit = lambda fn, *args: pool.apply_async(fn, args)
+        
+        # stage durations of worker processes are returned with the results
+        timer = timing.get_active()
+        timed = timer is not None and self.backend == 'process'
+        apply = (partial(timing.run_with_timer, _apply_chunk) if timed 
+                 else _apply_chunk)
+        
+        def collect(future):
+            # Future (concurrent.futures) or AsyncResult (multiprocessing)
+            result = (future.result() if hasattr(future, 'result') 
+                      else future.get())
+            if timed:
+                result, records = result
+                timer.extend(records)
+            if progress is not None:
+                progress.update(len(result))
+            return result
+        
+        pending = deque()
+        with pool:
+            for chunk in _iter_chunks(iterable, chunksize):
+                if len(pending) >= maxinflight:
+                    yield from collect(pending.popleft())
+                pending.append(submit(apply, func, chunk))
+            while pending:
+                yield from collect(pending.popleft())
+    
+    def map(self, func, iterable, initializer=None, initargs=(), 
+            progress=None):
+        """Apply function to all items of iterable (cf. :func:`imap`)
+        
+        Returns
+        -------
+        list
+            return values of `func` for each item in `iterable`
+        """
+        return list(self.imap(func, iterable, initializer, initargs, 
+                              progress))
+    
+    def starmap(self, func, iterable, progress=None):
+        """Like :func:`map` but items of iterable are unpacked into `func`
+        
+        Returns
+        -------
+        list
+            return values of `func` for each item in `iterable`
+        """
+        return self.map(partial(_apply_star, func), iterable, 
+                        progress=progress)
+    
+    def __repr__(self):
+        return ('ExecutorConfig(backend={}, numworkers={}, chunksize={}, '
+                'maxinflight={})'.format(self.backend, self.numworkers,
+                                         self.chunksize, self.maxinflight))
+
+def _iter_chunks(iterable, chunksize):
+    it = iter(iterable)
+    while True:
+        chunk = list(islice(it, chunksize))
+        if not chunk:
+            return
+        yield chunk
+        
+def _apply_chunk(func, chunk):
+    return [func(item) for item in chunk]
+
+def _apply_star(func, args):
+    return func(*args)
+
+def apply_concurrent_threadpool(func, iterable, numworkers=None):
     """
     Use ThreadPoolExecutor to speed up multiple calls of input function
 
@@ -21,8 +266,8 @@ def apply_concurrent_threadpool(func, iterable, numworkers=4):
         first argument is iterated over, provided via input `iterable`.
     iterable : iterable
         list or similar containing first input arg for `func`
-    numworkers : TYPE, optional
-        Number of threads. The default is 4.
+    numworkers : int, optional
+        Number of threads. Defaults to :func:`os.cpu_count`.
 
     Returns
     -------
@@ -31,14 +276,39 @@ def apply_concurrent_threadpool(func, iterable, numworkers=4):
         args in `iterable`
 
     """
-    result = []
+    return ExecutorConfig('thread', numworkers).map(func, iterable)
+
+def apply_bounded_threadpool(func, iterable, numworkers=None, 
+                             maxinflight=None):
+    """
+    Use ThreadPoolExecutor with a bounded number of pending tasks
     
-    with ThreadPoolExecutor(max_workers=numworkers) as executor:
-        for res in executor.map(func, iterable):
-            result.append(res)
-    return result
+    In contrast to :func:`apply_concurrent_threadpool`, tasks are submitted 
+    lazily, such that at most `maxinflight` tasks (and their results) are 
+    held in memory at a time. Results are yielded in input order.
+
+    Parameters
+    ----------
+    func : callable
+        first argument is iterated over, provided via input `iterable`.
+    iterable : iterable
+        list or similar containing first input arg for `func`
+    numworkers : int, optional
+        Number of threads. Defaults to :func:`os.cpu_count`.
+    maxinflight : int, optional
+        Maximum number of submitted tasks that have not yet been yielded. 
+        Defaults to 2 * `numworkers`.
+
+    Yields
+    ------
+    object
+        return value of `func` for each item in `iterable`
 
-def find_shift_lowlevel(imgfile, ref_gray):
+    """
+    config = ExecutorConfig('thread', numworkers, maxinflight=maxinflight)
+    return config.imap(func, iterable)
+
+def find_shift_lowlevel(imgfile, ref_gray, pyrlevel=None, refine=None):
     """
     Find shift between two images
 
@@ -46,8 +316,18 @@ def find_shift_lowlevel(imgfile, ref_gray):
     ----------
     imgfile : str
         image file read via :func:`pylapsy.utils.imread`
-    ref_gray : ndarray
-        reference image wrt to which shift of imgfile is retrieved
+    ref_gray : ndarray or dict
+        reference image wrt to which shift of imgfile is retrieved, or 
+        precomputed reference (output of 
+        :func:`pylapsy.utils.prepare_shift_reference` or 
+        :func:`pylapsy.utils.load_shift_reference`, then `pyrlevel` and
+        `refine` are ignored and imgfile is decoded according to the decode
+        mode of the reference, cf. :func:`pylapsy.utils.imread_shift_gray`)
+    pyrlevel : int, optional
+        pyramid level used for shift estimation (cf. 
+        :func:`pylapsy.utils.find_shift_pyr`)
+    refine : bool, optional
+        if True, shift is refined in full resolution ROI
 
     Returns
     -------
@@ -58,21 +338,54 @@ def find_shift_lowlevel(imgfile, ref_gray):
     M : ndarray
         affine transformation matrix
     """
-    img = utils.imread(imgfile)
-    gray = utils.to_gray(img)
-    (dx, dy), da, M = utils.find_shift(ref_gray, gray)
-    return (dx, dy, M)
+    with timing.frame(imgfile):
+        if isinstance(ref_gray, dict):
+            gray, prescaled = utils.imread_shift_gray(imgfile, ref_gray)
+            (dx, dy), da, M = utils.find_shift_ref(ref_gray, gray, prescaled)
+            return (dx, dy, M)
+        gray = utils.to_gray(utils.imread(imgfile))
+        (dx, dy), da, M = _find_shift(ref_gray, gray, pyrlevel, refine)
+        return (dx, dy, M)
+
+def _find_shift(ref, gray, pyrlevel, refine):
+    if isinstance(ref, dict):
+        return utils.find_shift_ref(ref, gray)
+    return utils.find_shift_pyr(ref, gray, pyrlevel, refine)
+
+def _prepare_reference(ref, pyrlevel, refine, method=None):
+    if isinstance(ref, dict):
+        return ref
+    return utils.prepare_shift_reference(ref, pyrlevel, refine, 
+                                         method=method)
 
-def find_shifts_fast(imgfiles, ref_gray):
+def find_shifts_fast(imgfiles, ref_gray, pyrlevel=None, refine=None, 
+                     executor=None, progress=None, method=None):
     """
-    Use ThreadPool to find shifts for list of images
+    Use ThreadPool (or other executor) to find shifts for list of images
 
     Parameters
     ----------
     imgfiles : list
         list containing file locations of images
-    ref_gray : ndarray
-        reference gray image wrt to which shifts are computed
+    ref_gray : ndarray or dict
+        reference gray image wrt to which shifts are computed, or 
+        precomputed reference (cf. :func:`find_shift_lowlevel`). Reference 
+        feature points are computed only once and shared by all workers.
+    pyrlevel : int, optional
+        pyramid level used for shift estimation
+    refine : bool, optional
+        if True, shifts are refined in full resolution ROI
+    executor : ExecutorConfig, optional
+        parallel execution settings (cf. :func:`ExecutorConfig.from_input`),
+        defaults to thread backend. For the process backend, the reference 
+        image is shared via shared memory (cf. :func:`apply_shared_ref`).
+    progress : ProgressTracker or callable, optional
+        progress tracker or callback (cf. 
+        :class:`pylapsy.progress.ProgressTracker`, stage "estimate")
+    method : str, optional
+        shift estimation method, "lk" or "phase" (cf. 
+        :func:`pylapsy.utils.prepare_shift_reference`), ignored for 
+        precomputed reference
 
     Returns
     -------
@@ -81,32 +394,405 @@ def find_shifts_fast(imgfiles, ref_gray):
         input file list, where dx, dy denote the image shift and M is the 
         affine transformation matrix
     """
-    func = partial(find_shift_lowlevel, ref_gray=ref_gray)
-    return apply_concurrent_threadpool(func, imgfiles)
+    ref = _prepare_reference(ref_gray, pyrlevel, refine, method)
+    executor = ExecutorConfig.from_input(executor)
+    progress = ProgressTracker.from_input(progress, len(imgfiles), 'estimate')
+    return apply_shared_ref(find_shift_lowlevel, imgfiles, ref, executor,
+                            progress)
+
+def find_shifts_chain_lowlevel(imgfiles, pyrlevel=None, refine=None,
+                               decode=None, method=None):
+    """
+    Find shifts between consecutive images of a list of image files
+    
+    Each image is read only once. The number of LK pyramid levels is 
+    adapted to the expected shift between neighbouring images (cf. 
+    `pair_max_level` and `pair_max_shift` in `shift_params` in 
+    :mod:`pylapsy.defaults` and :func:`pylapsy.utils.lk_max_level`).
+
+    Parameters
+    ----------
+    imgfiles : list
+        list containing file locations of consecutive images
+    pyrlevel : int, optional
+        pyramid level used for shift estimation
+    refine : bool, optional
+        if True, shifts are refined in full resolution ROI
+    decode : str, optional
+        decode mode (cf. :func:`pylapsy.utils.load_shift_reference`)
+    method : str, optional
+        shift estimation method (cf. 
+        :func:`pylapsy.utils.prepare_shift_reference`)
+
+    Returns
+    -------
+    list
+        list of `len(imgfiles) - 1` 3-element tuples containing (dx, dy, M), 
+        where element k denotes the shift from image k to image k+1
+    """
+    params = defaults['shift_params']
+    if pyrlevel is None:
+        pyrlevel = utils.default_pyrlevel(method)
+    if decode is None:
+        decode = params['decode']
+    reduced = decode == 'reduced' and pyrlevel > 0
+    max_level = params['pair_max_level']
+    result = []
+    prev = None
+    for imgfile in imgfiles:
+        with timing.frame(imgfile):
+            if reduced:
+                gray = utils.imread_reduced_gray(imgfile, pyrlevel)
+            else:
+                gray = utils.to_gray(utils.imread(imgfile))
+            if prev is not None:
+                ref = utils.prepare_shift_reference(prev, pyrlevel, refine, 
+                                                    prescaled=reduced,
+                                                    method=method)
+                if max_level is None:
+                    shape = ref['img'].shape
+                    max_level = utils.lk_max_level(
+                        shape, params['pair_max_shift'] * shape[1])
+                (dx, dy), da, M = utils.find_shift_ref(ref, gray, reduced,
+                                                       maxLevel=max_level)
+                result.append((dx, dy, M))
+        prev = gray
+    return result
+
+def find_shifts_sequential(imgfiles, pyrlevel=None, refine=None, 
+                           executor=None, pairs=None, decode=None, 
+                           progress=None, method=None):
+    """
+    Find shifts between consecutive images in parallel
+    
+    The image pairs are split into chunks of consecutive pairs that are 
+    processed independently (cf. :func:`find_shifts_chain_lowlevel`), such 
+    that each image is read only once per chunk. The resulting shifts can be
+    converted into shifts wrt. a reference image using 
+    :func:`pylapsy.utils.chain_transforms`.
+
+    Parameters
+    ----------
+    imgfiles : list
+        list containing file locations of images
+    pyrlevel : int, optional
+        pyramid level used for shift estimation
+    refine : bool, optional
+        if True, shifts are refined in full resolution ROI
+    executor : ExecutorConfig, optional
+        parallel execution settings, defaults to thread backend. The 
+        `chunksize` setting specifies the number of pairs per chunk.
+    pairs : list, optional
+        indices k of the pairs (k-1, k) that are supposed to be computed, 
+        defaults to all pairs.
+    decode : str, optional
+        decode mode (cf. :func:`pylapsy.utils.load_shift_reference`)
+    progress : ProgressTracker or callable, optional
+        progress tracker or callback (cf. 
+        :class:`pylapsy.progress.ProgressTracker`, stage "estimate"), 
+        counts pairs
+    method : str, optional
+        shift estimation method (cf. 
+        :func:`pylapsy.utils.prepare_shift_reference`)
+
+    Returns
+    -------
+    list
+        3-element tuples containing (dx, dy, M) for each requested pair
+    """
+    executor = ExecutorConfig.from_input(executor)
+    if pairs is None:
+        pairs = range(1, len(imgfiles))
+    pairs = sorted(pairs)
+    progress = ProgressTracker.from_input(progress, len(pairs), 'estimate')
+    if len(pairs) == 0:
+        return []
+    chunksize = executor.chunksize
+    if chunksize is None:
+        chunksize = max(1, int(np.ceil(len(pairs) / (4 * executor.workers))))
+    
+    # split into chunks of consecutive pairs
+    chunks = [[pairs[0]]]
+    for k in pairs[1:]:
+        if k == chunks[-1][-1] + 1 and len(chunks[-1]) < chunksize:
+            chunks[-1].append(k)
+        else:
+            chunks.append([k])
+    tasks = [imgfiles[chunk[0] - 1 : chunk[-1] + 1] for chunk in chunks]
+    
+    # one chunk per task
+    executor = ExecutorConfig(executor.backend, executor.numworkers, 1, 
+                              executor.maxinflight)
+    func = partial(find_shifts_chain_lowlevel, pyrlevel=pyrlevel, 
+                   refine=refine, decode=decode, method=method)
+    if progress is not None:
+        progress.start()
+    result = []
+    for res in executor.imap(func, tasks):
+        result.extend(res)
+        if progress is not None:
+            progress.update(len(res))
+    return result
+
+def deshake_single(file, ref_gray, crop, outdir, pyrlevel=None, 
+                   refine=None, interpolation=None, border_mode=None,
+                   encode=None):
+    """
+    Deshake a single image file and save the cropped result
+    
+    Combines :func:`find_shift_lowlevel` and :func:`shift_crop_single`, 
+    but decodes the image file only once.
+
+    Parameters
+    ----------
+    file : str
+        image file
+    ref_gray : ndarray or dict
+        reference gray image wrt to which shift of file is retrieved, or 
+        precomputed reference (cf. :func:`find_shift_lowlevel`)
+    crop : tuple
+        output ROI (x0, x1, y0, y1), e.g. from :func:`utils.get_crop_margin`
+    outdir : str
+        output directory
+    pyrlevel : int, optional
+        pyramid level used for shift estimation
+    refine : bool, optional
+        if True, shift is refined in full resolution ROI
+    interpolation : int, optional
+        OpenCV interpolation flag (cf. :func:`utils.shift_image`)
+    border_mode : int, optional
+        OpenCV border mode (cf. :func:`utils.shift_image`)
+    encode : EncodeParams or dict or str, optional
+        encoding settings for output image (cf. 
+        :func:`EncodeParams.from_input`)
+
+    Returns
+    -------
+    dx : float
+        x shift
+    dy : float
+        y shift
+    M : ndarray
+        affine transformation matrix
+    """
+    with timing.frame(file):
+        img = utils.imread(file)
+        gray = utils.to_gray(img)
+        (dx, dy), da, M = _find_shift(ref_gray, gray, pyrlevel, refine)
+        encode = EncodeParams.from_input(encode)
+        fp = encode.output_path(os.path.join(outdir, os.path.basename(file)))
+        dst = _get_worker_buffer(img, crop)
+        utils.imsave(utils.shift_crop_image(img, M, crop, dst, interpolation, 
+                                            border_mode), fp, encode)
+    return (dx, dy, M)
+
+def deshake_stream(files, ref_gray, crop, outdir, executor=None,
+                   pyrlevel=None, refine=None, interpolation=None, 
+                   border_mode=None, encode=None, progress=None):
+    """
+    Deshake list of image files in a single pass
+    
+    Each file is decoded only once and passed through the whole chain
+    (decode, gray, shift estimate, warp, encode) by one of several workers.
+    The number of frames in memory is bounded by the `maxinflight` setting 
+    of the executor. Since the shifts are not known in advance, the output 
+    crop needs to be provided.
+
+    Parameters
+    ----------
+    files : list
+        list containing file locations of images
+    ref_gray : ndarray or dict
+        reference gray image wrt to which shifts are computed, or 
+        precomputed reference (cf. :func:`find_shift_lowlevel`)
+    crop : tuple
+        output ROI (x0, x1, y0, y1)
+    outdir : str
+        output directory
+    executor : ExecutorConfig, optional
+        parallel execution settings, defaults to thread backend
+    pyrlevel : int, optional
+        pyramid level used for shift estimation
+    refine : bool, optional
+        if True, shifts are refined in full resolution ROI
+    interpolation : int, optional
+        OpenCV interpolation flag (cf. :func:`utils.shift_image`)
+    border_mode : int, optional
+        OpenCV border mode (cf. :func:`utils.shift_image`)
+    encode : EncodeParams or dict or str, optional
+        encoding settings for output images (cf. 
+        :func:`EncodeParams.from_input`)
+    progress : ProgressTracker or callable, optional
+        progress tracker or callback (cf. 
+        :class:`pylapsy.progress.ProgressTracker`, stage "render")
+
+    Returns
+    -------
+    list
+        list of 3-element tuples containing (dx, dy, M) for each image in 
+        input file list (cf. :func:`find_shifts_fast`)
+    """
+    ref = _prepare_reference(ref_gray, pyrlevel, refine)
+    progress = ProgressTracker.from_input(progress, len(files), 'render')
+    executor = ExecutorConfig.from_input(executor)
+    func = partial(deshake_single, crop=crop, outdir=outdir, 
+                   interpolation=interpolation, border_mode=border_mode,
+                   encode=encode)
+    return apply_shared_ref(func, files, ref, executor, progress)
+
+def _init_shared_ref_worker(shm_name, shape, dtype, ref_meta, ref_img):
+    """Attach reference from shared memory in worker process"""
+    global _WORKER_REF, _WORKER_SHM
+    _WORKER_SHM = shared_memory.SharedMemory(name=shm_name)
+    gray = np.ndarray(shape, dtype=dtype, buffer=_WORKER_SHM.buf)
+    ref = dict(ref_meta)
+    ref['gray'] = gray
+    ref['img'] = gray if ref_img is None else ref_img
+    _WORKER_REF = ref
+    
+def _call_with_worker_ref(func, item):
+    return func(item, ref_gray=_WORKER_REF)
+
+def apply_shared_ref(func, iterable, ref, executor=None, progress=None):
+    """
+    Apply function that requires precomputed reference image to iterable
+    
+    Calls `func(item, ref_gray=ref)` for each item in iterable. For the 
+    process backend, the full resolution reference image is placed into 
+    shared memory (:class:`multiprocessing.shared_memory.SharedMemory`), so 
+    it is not pickled for every task. Reference features and the (small) 
+    downscaled reference image are sent only once to each worker process.
+    If shared memory is not available (Python < 3.8), the reference is 
+    sent with each task (chunk of items, cf. :func:`ExecutorConfig.imap`).
+
+    Parameters
+    ----------
+    func : callable
+        function to be applied, needs to be picklable for process backend
+    iterable : iterable
+        list or similar containing first input arg for `func`
+    ref : dict
+        precomputed reference (cf. 
+        :func:`pylapsy.utils.prepare_shift_reference`)
+    executor : ExecutorConfig, optional
+        parallel execution settings, defaults to thread backend
+    progress : ProgressTracker or callable, optional
+        progress tracker or callback (cf. :func:`ExecutorConfig.imap`)
+
+    Returns
+    -------
+    list
+        return values of `func` for each item in `iterable`
+    """
+    executor = ExecutorConfig.from_input(executor)
+    if not executor.backend == 'process' or shared_memory is None:
+        return executor.map(partial(func, ref_gray=ref), iterable, 
+                            progress=progress)
+    
+    gray = np.ascontiguousarray(ref['gray'])
+    ref_meta = {k : v for k, v in ref.items() if not k in ('gray', 'img')}
+    ref_img = None if ref['img'] is ref['gray'] else ref['img']
+    
+    shm = shared_memory.SharedMemory(create=True, size=max(gray.nbytes, 1))
+    try:
+        shared = np.ndarray(gray.shape, dtype=gray.dtype, buffer=shm.buf)
+        shared[:] = gray
+        initargs = (shm.name, gray.shape, gray.dtype.str, ref_meta, ref_img)
+        result = executor.map(partial(_call_with_worker_ref, func), iterable,
+                              initializer=_init_shared_ref_worker, 
+                              initargs=initargs, progress=progress)
+        del shared
+    finally:
+        shm.close()
+        shm.unlink()
+    return result
+
+def find_shifts_procpool(imgfiles, ref_gray, pyrlevel=None, refine=None,
+                         numworkers=None, chunksize=None):
+    """
+    Use process pool to find shifts for list of images
+    
+    The reference image is shared with the worker processes via shared 
+    memory (cf. :func:`apply_shared_ref`). Image files are submitted in 
+    chunks to reduce the communication overhead.
+
+    Parameters
+    ----------
+    imgfiles : list
+        list containing file locations of images
+    ref_gray : ndarray or dict
+        reference gray image wrt to which shifts are computed, or 
+        precomputed reference (cf. :func:`find_shift_lowlevel`)
+    pyrlevel : int, optional
+        pyramid level used for shift estimation
+    refine : bool, optional
+        if True, shifts are refined in full resolution ROI
+    numworkers : int, optional
+        number of processes, defaults to :func:`os.cpu_count`
+    chunksize : int, optional
+        number of files submitted per task. Defaults to a value that results
+        in about 4 tasks per process.
 
-def apply_pool_starmap(func, fargs, numworkers=4):
+    Returns
+    -------
+    list
+        list of 3-element tuples containing (dx, dy, M) for each image in 
+        input file list (cf. :func:`find_shifts_fast`)
+    """
+    executor = ExecutorConfig('process', numworkers, chunksize)
+    return find_shifts_fast(imgfiles, ref_gray, pyrlevel, refine, executor)
+
+def apply_pool_starmap(func, fargs, numworkers=None, chunksize=None):
     
     with Pool(numworkers) as p:
-        result = p.starmap(func, fargs)
+        result = p.starmap(func, fargs, chunksize)
     p.close()
     p.join()
     return result
 
-def apply_threadpool_starmap(func, fargs, numworkers=4):
+def apply_threadpool_starmap(func, fargs, numworkers=None, chunksize=None):
     
     with ThreadPool(numworkers) as p:
-        result = p.starmap(func, fargs)
+        result = p.starmap(func, fargs, chunksize)
     p.close()
     p.join()
     return result 
 
-def shift_crop_single(file, matrix, crop, outdir):
-    x0,x1,y0,y1 = crop
+def _get_worker_buffer(img, crop):
+    """Get output buffer for cropped image, reused within a worker
+    
+    The buffer is reallocated only if crop size, number of channels or 
+    dtype change.
+    """
+    x0, x1, y0, y1 = crop
+    shape = (y1 - y0, x1 - x0) + img.shape[2:]
+    buf = getattr(_WORKER_BUFFERS, 'buf', None)
+    if buf is None or buf.shape != shape or buf.dtype != img.dtype:
+        buf = np.empty(shape, dtype=img.dtype)
+        _WORKER_BUFFERS.buf = buf
+    return buf
+
+def shift_crop_single(file, matrix, crop, outdir, interpolation=None, 
+                      border_mode=None, encode=None, writer=None):
+    with timing.frame(file):
+        _shift_crop_single(file, matrix, crop, outdir, interpolation, 
+                           border_mode, encode, writer)
+
+def _shift_crop_single(file, matrix, crop, outdir, interpolation, 
+                       border_mode, encode, writer):
     img = utils.imread(file)
-    shifted = utils.shift_image(img, matrix)
-    shifted_crop = shifted[y0:y1, x0:x1]
     fp = os.path.join(outdir, os.path.basename(file))
-    utils.imsave(shifted_crop, fp)
+    if writer is not None:
+        # image is handed over to writer thread, so no reused buffer
+        shifted_crop = utils.shift_crop_image(img, matrix, crop, None,
+                                              interpolation, border_mode)
+        writer.write(shifted_crop, writer.params.output_path(fp))
+        return
+    encode = EncodeParams.from_input(encode)
+    shifted_crop = utils.shift_crop_image(img, matrix, crop, 
+                                          _get_worker_buffer(img, crop),
+                                          interpolation, border_mode)
+    utils.imsave(shifted_crop, encode.output_path(fp), encode)
 
 def shift_crop_list_fast(files, matrices, crop, outdir,
                          multithread=False):
@@ -115,16 +801,139 @@ def shift_crop_list_fast(files, matrices, crop, outdir,
     func(shift_crop_single, smargs)
     
 def shift_crop_list(files, matrices, crop, outdir, multiproc=True, 
-                    multithread=False):
-    if multiproc:
-        shift_crop_list_fast(files, matrices, crop, outdir,
-                                    multithread=False)
-    elif multithread:
-        shift_crop_list_fast(files, matrices, crop, outdir,
-                                    multithread=True)
-    else:
-        for file, matrix in zip(files, matrices):
-            shift_crop_single(file, matrix, crop, outdir)
+                    multithread=False, executor=None, interpolation=None, 
+                    border_mode=None, encode=None, writers=None, 
+                    progress=None):
+    """
+    Shift and crop list of image files and save the results
+
+    Parameters
+    ----------
+    files : list
+        list containing file locations of images
+    matrices : list
+        affine transformation matrices for each file
+    crop : tuple
+        output ROI (x0, x1, y0, y1)
+    outdir : str
+        output directory
+    multiproc : bool
+        if True, a process pool is used (ignored if `executor` is specified)
+    multithread : bool
+        if True (and `multiproc` is False), a thread pool is used (ignored if 
+        `executor` is specified)
+    executor : ExecutorConfig, optional
+        parallel execution settings
+    interpolation : int, optional
+        OpenCV interpolation flag (cf. :func:`utils.shift_image`)
+    border_mode : int, optional
+        OpenCV border mode (cf. :func:`utils.shift_image`)
+    encode : EncodeParams or dict or str, optional
+        encoding settings for output images (cf. 
+        :func:`EncodeParams.from_input`)
+    writers : int, optional
+        if specified, output images are encoded and written by that number
+        of dedicated writer threads (cf. :class:`ImageWriter`), concurrently
+        with shifting the next images. Not available for the process 
+        backend (there, each worker process encodes its own images).
+    progress : ProgressTracker or callable, optional
+        progress tracker or callback (cf. 
+        :class:`pylapsy.progress.ProgressTracker`, stage "render")
+    """
+    if executor is None:
+        if multiproc:
+            executor = 'process'
+        elif multithread:
+            executor = 'thread'
+        else:
+            executor = 'serial'
+    executor = ExecutorConfig.from_input(executor)
+    progress = ProgressTracker.from_input(progress, len(files), 'render')
+    func = partial(shift_crop_single, crop=crop, outdir=outdir, 
+                   interpolation=interpolation, border_mode=border_mode, 
+                   encode=encode)
+    if not writers or executor.backend == 'process':
+        executor.starmap(func, list(zip(files, matrices)), progress)
+        return
+    with ImageWriter(writers, params=encode) as writer:
+        executor.starmap(partial(func, writer=writer), 
+                         list(zip(files, matrices)), progress)
+
+def shift_crop_frame(index, file, matrix, crop, outdir=None, 
+                     interpolation=None, border_mode=None, encode=None, 
+                     video=None):
+    """Shift and crop image file and pass result to video writer
+    
+    Returns the shifted and cropped image if `video` is None (e.g. if the 
+    frame is produced in a worker process).
+    """
+    try:
+        with timing.frame(file):
+            img = utils.imread(file)
+            shifted_crop = utils.shift_crop_image(img, matrix, crop, None, 
+                                                  interpolation, border_mode)
+            if outdir is not None:
+                encode = EncodeParams.from_input(encode)
+                fp = os.path.join(outdir, os.path.basename(file))
+                utils.imsave(shifted_crop, encode.output_path(fp), encode)
+    except Exception:
+        if video is not None:
+            # frame will never arrive, release workers waiting for it
+            video.close()
+        raise
+    if video is None:
+        return shifted_crop
+    video.write(index, shifted_crop)
+
+def shift_crop_video(files, matrices, crop, video, executor=None, 
+                     outdir=None, interpolation=None, border_mode=None, 
+                     encode=None, progress=None):
+    """
+    Shift and crop list of image files and encode the results into a video
+    
+    For serial and thread backends, the workers pass their frames directly 
+    to the video writer, which reorders them (cf. 
+    :class:`pylapsy.writers.VideoWriter`). For the process backend, frames 
+    are returned to the main process in input order.
+
+    Parameters
+    ----------
+    files : list
+        list containing file locations of images
+    matrices : list
+        affine transformation matrices for each file
+    crop : tuple
+        output ROI (x0, x1, y0, y1)
+    video : VideoWriter
+        video writer (is not closed by this function)
+    executor : ExecutorConfig, optional
+        parallel execution settings
+    outdir : str, optional
+        if specified, the output images are also saved in this directory
+    interpolation : int, optional
+        OpenCV interpolation flag (cf. :func:`utils.shift_image`)
+    border_mode : int, optional
+        OpenCV border mode (cf. :func:`utils.shift_image`)
+    encode : EncodeParams or dict or str, optional
+        encoding settings for output images (cf. 
+        :func:`EncodeParams.from_input`)
+    progress : ProgressTracker or callable, optional
+        progress tracker or callback (cf. 
+        :class:`pylapsy.progress.ProgressTracker`, stage "render")
+    """
+    executor = ExecutorConfig.from_input(executor)
+    progress = ProgressTracker.from_input(progress, len(files), 'render')
+    func = partial(shift_crop_frame, crop=crop, outdir=outdir, 
+                   interpolation=interpolation, border_mode=border_mode, 
+                   encode=encode)
+    args = list(zip(range(len(files)), files, matrices))
+    if executor.backend != 'process':
+        executor.starmap(partial(func, video=video), args, progress)
+        return
+    frames = executor.imap(partial(_apply_star, func), args, 
+                           progress=progress)
+    for index, frame in enumerate(frames):
+        video.write(index, frame)
 
 if __name__=='__main__':
     import numpy as np
@@ -0,0 +1,191 @@
+# -*- coding: utf-8 -*-
+#
+# This module is part of pylapsy.
+# It is licensed under a GPL-3.0 license, for details see LICENSE file.
+#
+# Author: Jonas Gliß
+# Copyright (C) 2019 Jonas Gliss (jonasgliss@gmail.com)
+# GitHub: jgliss
+# Email: jonasgliss@gmail.com
+"""
+Synthetic shaky image sequences with known (ground truth) transforms
+"""
+import os
+from functools import partial
+
+import cv2
+import numpy as np
+
+from pylapsy import utils
+from pylapsy.io import get_test_img
+from pylapsy.speedup_helpers import ExecutorConfig
+from pylapsy.writers import EncodeParams
+
+def camera_transforms(num, size, jitter=2.0, drift=(0.0, 0.0), rotation=0.0,
+                      seed=None):
+    """Random camera motion of a sequence
+
+    Parameters
+    ----------
+    num : int
+        number of frames
+    size : tuple
+        frame size (width, height), rotations are around the frame centre
+    jitter : float
+        standard deviation of random shift in x and y (pixels)
+    drift : tuple
+        linear drift in x and y (pixels per frame)
+    rotation : float
+        standard deviation of random rotation (degrees)
+    seed : int, optional
+        random seed
+
+    Returns
+    -------
+    ndarray
+        (N, 2, 3) affine transforms that map pixel coordinates of the base
+        image to pixel coordinates of each frame
+    """
+    # one draw per frame, such that sequences with same seed share frames
+    rnd = np.random.default_rng(seed).standard_normal((num, 3))
+    shifts = (rnd[:, :2] * jitter +
+              np.arange(num)[:, None] * np.asarray(drift, dtype=float))
+    angles = rnd[:, 2] * rotation
+    centre = ((size[0] - 1) / 2, (size[1] - 1) / 2)
+    matrices = np.empty((num, 2, 3))
+    for i in range(num):
+        matrices[i] = cv2.getRotationMatrix2D(centre, angles[i], 1.0)
+        matrices[i, :, 2] += shifts[i]
+    return matrices
+
+def ground_truth(transforms, ref_index=0):
+    """Expected shift estimates wrt. reference frame
+
+    Parameters
+    ----------
+    transforms : ndarray
+        (N, 2, 3) camera transforms (cf. :func:`camera_transforms`)
+    ref_index : int
+        index of reference frame
+
+    Returns
+    -------
+    ndarray
+        (N, 2, 3) transforms that map pixel coordinates of the reference
+        frame to pixel coordinates of each frame, that is, the matrices
+        estimated by :func:`pylapsy.utils.find_shift` (and returned by
+        :func:`pylapsy.Deshaker.find_shifts`)
+    """
+    h = utils.to_homogeneous(transforms)
+    return (h @ np.linalg.inv(h[ref_index]))[:, :2]
+
+def render_frame(base, m, noise=0.0, gain=1.0, seed=None):
+    """Render frame of synthetic sequence
+
+    Parameters
+    ----------
+    base : ndarray
+        base image
+    m : ndarray
+        2x3 camera transform (cf. :func:`camera_transforms`)
+    noise : float
+        standard deviation of additive Gaussian noise (digital numbers)
+    gain : float
+        brightness factor
+    seed : int, optional
+        random seed for noise
+
+    Returns
+    -------
+    ndarray
+        frame (same dtype as base image)
+    """
+    h, w = base.shape[:2]
+    frame = cv2.warpAffine(base, m, (w, h), flags=cv2.INTER_LINEAR,
+                           borderMode=cv2.BORDER_REFLECT)
+    if noise == 0 and gain == 1:
+        return frame
+    out = frame.astype(np.float32) * gain
+    if noise > 0:
+        rng = np.random.default_rng(seed)
+        out += rng.normal(0, noise, out.shape).astype(np.float32)
+    if np.issubdtype(base.dtype, np.integer):
+        info = np.iinfo(base.dtype)
+        out = np.clip(np.round(out), info.min, info.max)
+    return out.astype(base.dtype)
+
+def _write_frame(item, base, noise, encode):
+    index, path, m, gain, seed = item
+    frame = render_frame(base, m, noise, gain, seed)
+    if not utils.imsave(frame, path, encode):
+        raise IOError('Failed to write {}'.format(path))
+    return path
+
+def generate_sequence(outdir, num, base=None, size=None, jitter=2.0,
+                      drift=(0.0, 0.0), rotation=0.0, noise=0.0,
+                      brightness=(1.0, 1.0), ref_index=0, seed=None,
+                      ext='.jpg', encode=None, executor=None):
+    """Create synthetic shaky sequence from base image
+
+    Parameters
+    ----------
+    outdir : str
+        output directory (is created if it does not exist)
+    num : int
+        number of frames
+    base : ndarray or str, optional
+        base image or image file, defaults to the first test image (cf.
+        :func:`pylapsy.io.get_test_img`)
+    size : tuple, optional
+        frame size (width, height), the base image is resized if specified
+    jitter : float
+        standard deviation of random shift in x and y (pixels)
+    drift : tuple
+        linear drift in x and y (pixels per frame)
+    rotation : float
+        standard deviation of random rotation (degrees)
+    noise : float
+        standard deviation of additive Gaussian noise (digital numbers)
+    brightness : tuple
+        brightness factor of first and last frame (linear ramp)
+    ref_index : int
+        reference frame of ground truth transforms (cf.
+        :func:`ground_truth`)
+    seed : int, optional
+        random seed
+    ext : str
+        output file format
+    encode : EncodeParams or dict or str, optional
+        encoding settings for output images (cf.
+        :class:`pylapsy.writers.EncodeParams`)
+    executor : ExecutorConfig or str or dict, optional
+        parallel execution settings for rendering and writing the frames,
+        defaults to threads
+
+    Returns
+    -------
+    list
+        file paths of frames
+    ndarray
+        (N, 2, 3) ground truth transforms wrt. reference frame (cf.
+        :func:`ground_truth`)
+    """
+    if base is None:
+        base = get_test_img(1)
+    if isinstance(base, str):
+        base = utils.imread(base)
+    if size is not None:
+        base = cv2.resize(base, tuple(size), interpolation=cv2.INTER_AREA)
+    os.makedirs(outdir, exist_ok=True)
+    h, w = base.shape[:2]
+    transforms = camera_transforms(num, (w, h), jitter, drift, rotation,
+                                   seed)
+    gains = np.linspace(brightness[0], brightness[1], num)
+    seeds = np.random.default_rng(seed).integers(0, 2**31, num)
+    files = [os.path.join(outdir, 'frame_{:05d}{}'.format(i, ext))
+             for i in range(num)]
+    items = list(zip(range(num), files, transforms, gains, seeds.tolist()))
+    func = partial(_write_frame, base=base, noise=noise,
+                   encode=EncodeParams.from_input(encode))
+    ExecutorConfig.from_input(executor).map(func, items)
+    return files, ground_truth(transforms, ref_index)
@@ -0,0 +1,222 @@
+# -*- coding: utf-8 -*-
+#
+# This module is part of pylapsy.
+# It is licensed under a GPL-3.0 license, for details see LICENSE file.
+#
+# Author: Jonas Gliß
+# Copyright (C) 2019 Jonas Gliss (jonasgliss@gmail.com)
+# GitHub: jgliss
+# Email: jonasgliss@gmail.com
+
+import os
+import cv2
+import shutil
+
+import numpy as np
+import numpy.testing as npt
+import pytest
+
+from pylapsy import io, utils, synthetic, Deshaker, defaults
+from pylapsy.deshaker import RENDER_STATE_FILENAME
+
+@pytest.fixture
+def imgdir(tmpdir):
+    for file in sorted(io.get_testimg_files_deshake())[:8]:
+        shutil.copy(file, str(tmpdir))
+    return str(tmpdir)
+
+@pytest.fixture(scope='module')
+def synthfiles(tmpdir_factory):
+    outdir = str(tmpdir_factory.mktemp('synth'))
+    files, _ = synthetic.generate_sequence(outdir, 6, size=(400, 268), 
+                                           jitter=4, seed=3)
+    return files
+
+def test_deshake_incremental(imgdir, tmpdir):
+    outdir = str(tmpdir.mkdir('out'))
+    files = io.find_image_files(imgdir, '*.jpg')
+    Deshaker(files[:5]).deshake(outdir, incremental=True, parallel=False)
+    assert len(os.listdir(outdir)) == 6 # incl. state file
+    assert os.path.exists(os.path.join(outdir, RENDER_STATE_FILENAME))
+    
+    state = Deshaker._load_render_state(outdir)
+    assert len(state['rendered']) == 5
+    
+    Deshaker(files).deshake(outdir, incremental=True, parallel=False)
+    state = Deshaker._load_render_state(outdir)
+    assert len(state['rendered']) == 8
+    
+def test_deshake_incremental_rendered(tmpdir, monkeypatch):
+    import pylapsy.deshaker as mod
+    base = utils.imread(io.get_test_img(1))
+    shifts = [(0, 0), (5, -4), (-6, 3), (4, 6), (-5, -5), # first run
+              (2, 1), (-1, 2), (1, -2), # within crop of first run
+              (15, 12)] # requires larger crop
+    indir = tmpdir.mkdir('in')
+    for i, (tx, ty) in enumerate(shifts):
+        m = np.array([[1, 0, tx], [0, 1, ty]], dtype=float)
+        utils.imsave(synthetic.render_frame(base, m), 
+                     str(indir.join('frame_{:02d}.png'.format(i))))
+    files = io.find_image_files(str(indir), '*.png')
+    outdir = str(tmpdir.mkdir('out'))
+    
+    rendered = []
+    shift_crop_list = mod.shift_crop_list
+    def spy(files, *args, **kwargs):
+        rendered.append([os.path.basename(f) for f in files])
+        return shift_crop_list(files, *args, **kwargs)
+    monkeypatch.setattr(mod, 'shift_crop_list', spy)
+    names = [os.path.basename(f) for f in files]
+    
+    Deshaker(files[:5]).deshake(outdir, incremental=True, parallel=False)
+    assert rendered[-1] == names[:5]
+    mtimes = [os.stat(os.path.join(outdir, n)).st_mtime_ns for n in names[:5]]
+    # unchanged crop: only new frames are rendered
+    Deshaker(files[:8]).deshake(outdir, incremental=True, parallel=False)
+    assert rendered[-1] == names[5:8]
+    assert mtimes == [os.stat(os.path.join(outdir, n)).st_mtime_ns 
+                      for n in names[:5]]
+    # changed crop: all frames are rendered again
+    Deshaker(files).deshake(outdir, incremental=True, parallel=False)
+    assert rendered[-1] == names
+    shape = utils.imread(os.path.join(outdir, names[0])).shape
+    assert all(utils.imread(os.path.join(outdir, n)).shape == shape 
+               for n in names)
+    
+def test_find_shifts_results(imgdir):
+    files = io.find_image_files(imgdir, '*.jpg')
+    ds = Deshaker(files)
+    with pytest.raises(AttributeError):
+        ds.transform_stats()
+    res = ds.find_shifts(parallel=False)
+    assert res['matrices'].shape == (8, 2, 3)
+    npt.assert_allclose(res['dx'], -res['matrices'][:, 0, 2])
+    stats = ds.transform_stats()
+    assert stats['num'] == 8
+    assert stats['max_shift'] >= stats['max_dx']
+    
+def test_find_shifts_sequential(imgdir):
+    files = io.find_image_files(imgdir, '*.jpg')
+    res = Deshaker(files).find_shifts(parallel=False, mode='sequential')
+    assert len(res['matrices']) == 8
+    npt.assert_allclose(res['matrices'][0], [[1, 0, 0], [0, 1, 0]])
+    
+    ref = Deshaker(files).find_shifts(parallel=False)
+    keyed = Deshaker(files).find_shifts(parallel=False, mode='sequential',
+                                        keyframe_every=4)
+    npt.assert_allclose(keyed['matrices'][4], ref['matrices'][4])
+    with pytest.raises(ValueError):
+        Deshaker(files).find_shifts(mode='pairwise')
+    
+def test_find_shifts_sequential_cache(imgdir):
+    files = io.find_image_files(imgdir, '*.jpg')
+    res = Deshaker(files).find_shifts(mode='sequential', cache=True)
+    res1 = Deshaker(files).find_shifts(mode='sequential', cache=True)
+    npt.assert_allclose(res['dx'], res1['dx'])
+    
+def test_find_shifts_sequential_cache_key(imgdir, monkeypatch):
+    import pylapsy.deshaker as mod
+    files = io.find_image_files(imgdir, '*.jpg')
+    Deshaker(files).find_shifts(mode='sequential', cache=True)
+    computed = []
+    def spy(files, pyrlevel, refine, executor, todo, *args):
+        computed.extend(todo)
+        return find_shifts_sequential(files, pyrlevel, refine, executor, 
+                                      todo, *args)
+    find_shifts_sequential = mod.find_shifts_sequential
+    monkeypatch.setattr(mod, 'find_shifts_sequential', spy)
+    Deshaker(files).find_shifts(mode='sequential', cache=True)
+    assert computed == []
+    # changed pair settings invalidate cached pair shifts
+    monkeypatch.setitem(defaults['shift_params'], 'pair_max_level', 3)
+    Deshaker(files).find_shifts(mode='sequential', cache=True)
+    assert computed == list(range(1, 8))
+    
+def test_smooth_trajectory(imgdir, tmpdir):
+    files = io.find_image_files(imgdir, '*.jpg')
+    ds = Deshaker(files)
+    with pytest.raises(AttributeError):
+        ds.smooth_trajectory()
+    ds.deshake(str(tmpdir.mkdir('out')), parallel=False, smooth=3)
+    assert ds.results['corrections'].shape == (8, 2, 3)
+    with pytest.raises(ValueError):
+        ds.deshake(str(tmpdir), streaming=True, smooth=True)
+    
+@pytest.mark.parametrize('parallel', [False, True])
+def test_find_shifts_decode_reduced(imgdir, parallel):
+    files = io.find_image_files(imgdir, '*.jpg')
+    res = Deshaker(files).find_shifts(parallel=parallel, pyrlevel=1, 
+                                      decode='reduced')
+    full = Deshaker(files).find_shifts(parallel=parallel, pyrlevel=1)
+    npt.assert_allclose(res['dx'], full['dx'], atol=0.5)
+    npt.assert_allclose(res['dy'], full['dy'], atol=0.5)
+    
+def test_deshake_writers(imgdir, tmpdir):
+    files = io.find_image_files(imgdir, '*.jpg')
+    outdir = str(tmpdir.mkdir('out'))
+    Deshaker(files).deshake(outdir, executor='thread', encode='fast', 
+                            writers=2)
+    assert sorted(os.listdir(outdir)) == sorted(
+        [os.path.basename(f)[:-4] + '.png' for f in files])
+    
+@pytest.mark.parametrize('backend', ['serial', 'thread', 'process'])
+def test_deshake_video(imgdir, tmpdir, backend):
+    files = io.find_image_files(imgdir, '*.jpg')
+    outdir = str(tmpdir.mkdir('out'))
+    Deshaker(files).deshake(outdir, executor=backend, 
+                            save_preview_video=True, save_images=False,
+                            video=dict(backend='opencv', fps=5))
+    assert os.listdir(outdir) == ['pylapsy.mp4']
+    cap = cv2.VideoCapture(os.path.join(outdir, 'pylapsy.mp4'))
+    assert cap.get(cv2.CAP_PROP_FRAME_COUNT) == len(files)
+    
+def test_crop_within():
+    assert Deshaker._crop_within((2, 90, 2, 50), (1, 95, 0, 55))
+    assert not Deshaker._crop_within((0, 90, 2, 50), (1, 95, 0, 55))
+
+@pytest.mark.parametrize('executor', ['serial', 'thread', 'process'])
+def test_find_crop_lowres(synthfiles, executor):
+    ds = Deshaker(synthfiles)
+    crop = ds.find_crop_lowres(executor=executor)
+    res = ds.find_shifts(executor='serial')
+    h, w = utils.imread(synthfiles[0]).shape[:2]
+    x0, x1, y0, y1 = utils.get_crop_matrices(res['matrices'], w, h)
+    # padded by pixel size of pyramid level (2), same bound conventions
+    npt.assert_allclose(crop, (x0 + 4, x1 - 4, y0 + 4, y1 - 4), atol=1)
+    
+def test_find_crop_lowres_static(tmpdir):
+    files, _ = synthetic.generate_sequence(str(tmpdir), 3, size=(400, 268),
+                                           jitter=0, seed=3)
+    # exclusive upper bounds, like utils.get_crop_matrices
+    assert Deshaker(files).find_crop_lowres() == (4, 396, 4, 264)
+    
+@pytest.mark.parametrize('executor', ['serial', 'thread', 'process'])
+def test_deshake_streaming(synthfiles, tmpdir, executor):
+    outdir = str(tmpdir.mkdir('stream'))
+    ds = Deshaker(synthfiles)
+    ds.deshake(outdir, streaming=True, executor=executor)
+    out = sorted(io.find_image_files(outdir, '*.jpg'))
+    assert len(out) == len(synthfiles)
+    x0, x1, y0, y1 = ds.find_crop_lowres()
+    assert utils.imread(out[0]).shape == (y1 - y0, x1 - x0, 3)
+    
+    # shifts and crop agree with two pass processing
+    two_pass = Deshaker(synthfiles)
+    two_pass.deshake(str(tmpdir.mkdir('two_pass')), executor=executor)
+    npt.assert_allclose(ds.results['matrices'], 
+                        two_pass.results['matrices'], atol=1e-6)
+    ref = utils.imread(io.find_image_files(str(tmpdir.join('two_pass')), 
+                                           '*.jpg')[0])
+    npt.assert_allclose(utils.imread(out[0]).shape[:2], ref.shape[:2], 
+                        atol=12)
+    
+def test_deshake_streaming_margin(synthfiles, tmpdir):
+    outdir = str(tmpdir)
+    Deshaker(synthfiles).deshake(outdir, streaming=True, crop_margin=10,
+                                 executor='thread')
+    out = io.find_image_files(outdir, '*.jpg')
+    assert len(out) == len(synthfiles)
+    assert utils.imread(out[0]).shape == (248, 380, 3)
+    
+if __name__ == '__main__':
+    pytest.main(['test_deshaker.py'])
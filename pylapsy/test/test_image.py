@@ -26,6 +26,14 @@ def example_img():
         
 def test_meta(empty_img, example_img):
     assert 42==42
+    
+def test_load_input_reduced(example_img):
+    img = Image()
+    img.load_input(example_img.file_path, pyrlevel=1)
+    assert img.is_gray
+    assert img.pyrlevel == 1
+    assert img.shape == example_img.pyr_down(inplace=False).shape[:2]
+    assert img.to_gray(inplace=False).shape == img.shape
 
 if __name__ == '__main__':
     
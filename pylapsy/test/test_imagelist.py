@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+#
+# This module is part of pylapsy.
+# It is licensed under a GPL-3.0 license, for details see LICENSE file.
+#
+# Author: Jonas Gliß
+# Copyright (C) 2019 Jonas Gliss (jonasgliss@gmail.com)
+# GitHub: jgliss
+# Email: jonasgliss@gmail.com
+
+import numpy as np
+import pytest
+
+from pylapsy import io, ImageList
+from pylapsy.imagelist import FrameCache
+
+@pytest.fixture(scope='module')
+def files():
+    return sorted(io.get_testimg_files_deshake())[:6]
+
+def test_frame_cache():
+    cache = FrameCache(250)
+    for i in range(3):
+        cache.put(i, np.zeros(100, dtype=np.uint8))
+    assert len(cache) == 2 and cache.nbytes == 200
+    assert not 0 in cache
+    cache.get(1)
+    cache.put(3, np.zeros(100, dtype=np.uint8))
+    assert 1 in cache and not 2 in cache
+    cache.put(4, np.zeros(300, dtype=np.uint8))
+    assert not 4 in cache
+    
+def test_imagelist_cache(files):
+    img = ImageList(files, cache_bytes=0)[0]
+    lst = ImageList(files, cache_bytes=2 * img.img.nbytes)
+    arr = lst[0].img
+    assert 0 in lst.cache
+    cached = lst.cache.get(0)
+    assert not cached.flags.writeable
+    # images get a copy of the protected cached array
+    assert arr.flags.writeable and not arr is cached
+    np.testing.assert_array_equal(arr, cached)
+    assert lst[0].file_path == files[0]
+    lst[1], lst[2]
+    assert len(lst.cache) == 2
+    assert not 0 in lst.cache
+    
+def test_imagelist_cache_inplace(files):
+    lst = ImageList(files)
+    img = lst[0]
+    orig = img.img.copy()
+    img.add(lst[0])
+    np.testing.assert_array_equal(img.img, orig * 2)
+    img.img[0, 0] = 0
+    # cached frame is unchanged
+    np.testing.assert_array_equal(lst[0].img, orig)
+    
+def test_imagelist_probe(files):
+    lst = ImageList(files, cache_bytes=0)
+    assert lst.shape == lst[0].shape
+    assert lst.dtype == lst[0].dtype
+    lst = ImageList(files, decode='reduced', pyrlevel=2)
+    assert lst.probe(-1)[0] == lst[-1].shape
+    
+def test_imagelist_meta(files):
+    lst = ImageList(files)
+    times = lst.acq_times
+    assert len(times) == len(files)
+    assert all(t is not None for t in times)
+    assert lst[0].meta['acq_time'] == times[0]
+    assert lst.get_meta(1)['acq_time'] == times[1]
+    
+def test_imagelist_views(files):
+    lst = ImageList(files)
+    view = lst[1:5]
+    assert len(view) == 4
+    assert view.files == files[1:5]
+    assert view[::2].files == files[1:5:2]
+    assert view[-1].file_path == files[4]
+    view[0]
+    assert 1 in lst.cache
+    with pytest.raises(IndexError):
+        view[4]
+        
+def test_imagelist_iter(files):
+    lst = ImageList(files[:3])
+    it1, it2 = iter(lst), iter(lst)
+    next(it1)
+    assert [img.file_path for img in it2] == files[:3]
+    assert [img.file_path for img in it1] == files[1:3]
+    assert lst.index == -1
+
+def test_imagelist_prefetch(files):
+    lst = ImageList(files, cache_bytes=0)
+    assert ([img.file_path for img in lst.prefetch(2, 3)] == files)
+    it = lst.prefetch(1)
+    assert next(it).file_path == files[0]
+    it.close()
+    with pytest.raises(ValueError):
+        lst.prefetch(0)
+
+if __name__ == '__main__':
+    pytest.main(['test_imagelist.py'])
@@ -10,7 +10,9 @@
 
 import pytest
 import os
-from pylapsy import io
+import shutil
+from pylapsy import io, helpers
+from pylapsy.manifest import Manifest, MANIFEST_FILENAME
 
 def test_data_dir():
     ok = True
@@ -35,5 +37,51 @@ def test_find_image_files():
 
     #print(io.find_image_files(io.data_dir(), req_same_type=False))
 
+def test_natural_sort_key():
+    files = ['img10.jpg', 'img2.jpg', 'IMG1.jpg', 'img2b.jpg']
+    assert sorted(files, key=io.natural_sort_key) == ['IMG1.jpg', 'img2.jpg',
+                                                      'img2b.jpg', 
+                                                      'img10.jpg']
+
+@pytest.fixture
+def seqdir(tmpdir):
+    files = sorted(io.get_testimg_files_deshake())[:5]
+    for i, file in enumerate(files):
+        shutil.copy(file, str(tmpdir.join('img{}.jpg'.format(10 - i))))
+    tmpdir.join('notes.txt').write('no image')
+    tmpdir.mkdir('sub.jpg')
+    return str(tmpdir)
+
+def test_scan_image_files(seqdir):
+    files = io.scan_image_files(seqdir)
+    names = [os.path.basename(x) for x in files]
+    assert names == ['img6.jpg', 'img7.jpg', 'img8.jpg', 'img9.jpg', 
+                     'img10.jpg']
+    assert io.scan_image_files(seqdir, sort='name')[0].endswith('img10.jpg')
+    assert io.scan_image_files(seqdir, file_pattern='img1*') == files[-1:]
+    assert io.scan_image_files(seqdir, extensions=['.png']) == []
+    
+    timed = io.scan_image_files(seqdir, sort='time')
+    times = [helpers.load_exif_from_image_file(f)['acq_time'] for f in timed]
+    assert times == sorted(times)
+    assert sorted(timed) == sorted(files)
+    
+def test_scan_image_files_manifest(seqdir):
+    files = io.scan_image_files(seqdir, sort='time', manifest=True)
+    path = os.path.join(seqdir, MANIFEST_FILENAME)
+    assert os.path.exists(path)
+    m = Manifest.load(path)
+    assert m.files == files
+    assert m.entries[0]['acq_time'] is not None
+    # manifest is reused (modified entry is returned as is)
+    m.entries = m.entries[::-1]
+    m.save(path)
+    assert io.scan_image_files(seqdir, sort='time', 
+                               manifest=True) == files[::-1]
+    # new file in directory, manifest is updated
+    shutil.copy(files[0], os.path.join(seqdir, 'img1.jpg'))
+    files = io.scan_image_files(seqdir, sort='time', manifest=True)
+    assert len(files) == 6 and len(Manifest.load(path)) == 6
+
 if __name__ == '__main__':
     pytest.main(['test_io.py'])
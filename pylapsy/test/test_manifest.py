@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+#
+# This module is part of pylapsy.
+# It is licensed under a GPL-3.0 license, for details see LICENSE file.
+#
+# Author: Jonas Gliß
+# Copyright (C) 2019 Jonas Gliss (jonasgliss@gmail.com)
+# GitHub: jgliss
+# Email: jonasgliss@gmail.com
+
+import os
+import shutil
+from datetime import datetime
+
+import numpy as np
+import numpy.testing as npt
+import pytest
+
+from pylapsy import io, ImageList, Deshaker
+from pylapsy.manifest import Manifest
+
+@pytest.fixture
+def files(tmpdir):
+    for file in sorted(io.get_testimg_files_deshake())[:6]:
+        shutil.copy(file, str(tmpdir))
+    return io.find_image_files(str(tmpdir), '*.jpg')
+
+def test_manifest_io(files, tmpdir):
+    path = str(tmpdir.join('seq.jsonl'))
+    m = Manifest.from_files(files, sort='natural')
+    m.save(path)
+    loaded = Manifest.load(path)
+    assert loaded.path == path
+    assert loaded.files == files
+    assert loaded.info == dict(sort='natural')
+    assert loaded[0]['acq_time'] == m[0]['acq_time'] is not None
+    assert loaded[0]['header']['width'] == 400
+    
+    m[0]['acq_time'] = datetime(2019, 9, 1, 12, 14, 2, 250000)
+    m.save(path)
+    assert Manifest.load(path)[0]['acq_time'] == m[0]['acq_time']
+    assert Manifest._decode(dict(path='a.jpg', acq_time='2019-09-01T12:14:02'),
+                            '.')['acq_time'] == datetime(2019, 9, 1, 12, 14, 2)
+    
+    assert m.split(4) == [(0, 1), (1, 3), (3, 4), (4, 6)]
+    assert m.split(1) == [(0, 6)]
+    part = Manifest.load(path, 2, 5)
+    assert part.files == files[2:5]
+    assert part.path is None
+    assert m[2:5].files == files[2:5]
+
+def test_manifest_transforms(files, tmpdir):
+    m = Manifest.from_files(files[:2], probe_headers=False)
+    mat = np.array([[1, 0, -2], [0, 1, 3.5]])
+    m.update(files[1:3], 'key', [(2, -3.5, mat)] * 2)
+    assert len(m) == 3
+    path = str(tmpdir.join('seq.jsonl'))
+    m.save(path)
+    m = Manifest.load(path)
+    assert m.get(files[0], 'key') is None
+    assert m.get(files[1], 'other') is None
+    dx, dy, res = m.get(files[1], 'key')
+    assert (dx, dy) == (2, -3.5)
+    npt.assert_array_equal(res, mat)
+    # modified file
+    os.utime(files[1], ns=(0, 0))
+    assert m.get(files[1], 'key') is None
+    
+def test_imagelist_manifest(files, tmpdir):
+    path = str(tmpdir.join('seq.jsonl'))
+    lst = ImageList(files)
+    lst.save_manifest(path)
+    lst = ImageList.from_manifest(path, 1, 4)
+    assert lst.files == files[1:4]
+    # dimensions and capture times from manifest, no file access
+    shutil.move(files[1], files[1] + '.bak')
+    assert lst.shape == (267, 400, 3)
+    assert lst.acq_times[0] is not None
+    
+def test_deshaker_manifest(files, tmpdir):
+    path = str(tmpdir.join('seq.jsonl'))
+    ImageList(files).save_manifest(path)
+    d = Deshaker(ImageList.from_manifest(path))
+    res = d.find_shifts(parallel=False)
+    m = Manifest.load(path)
+    assert all(len(e['transforms']) == 1 for e in m.entries)
+    # results are loaded from manifest
+    d = Deshaker(ImageList.from_manifest(path))
+    npt.assert_allclose(d.find_shifts(parallel=False)['matrices'], 
+                        res['matrices'])
+    
+    # transforms are kept if manifest is rewritten
+    lst = ImageList.from_manifest(path)
+    lst.save_manifest(path)
+    assert 'transforms' in Manifest.load(path)[0]
+
+if __name__ == '__main__':
+    pytest.main(['test_manifest.py'])
@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+#
+# This module is part of pylapsy.
+# It is licensed under a GPL-3.0 license, for details see LICENSE file.
+#
+# Author: Jonas Gliß
+# Copyright (C) 2019 Jonas Gliss (jonasgliss@gmail.com)
+# GitHub: jgliss
+# Email: jonasgliss@gmail.com
+
+import struct
+from datetime import datetime
+
+import cv2
+import numpy as np
+import pytest
+
+from pylapsy import helpers, io, probe, utils
+
+def _exif_segment(orientation):
+    date = b'2019:09:01 12:14:02\x00'
+    entries = [struct.pack('>HHIHH', 0x0112, 3, 1, orientation, 0),
+               struct.pack('>HHII', 0x829A, 5, 1, 0),
+               struct.pack('>HHII', 0x9003, 2, len(date), 0),
+               struct.pack('>HHI4s', 0x9291, 2, 3, b'25\x00\x00')]
+    offs = 8 + 2 + 12 * len(entries) + 4
+    # patch offsets of exposure time and date (stored after IFD)
+    entries[1] = entries[1][:8] + struct.pack('>I', offs)
+    entries[2] = entries[2][:8] + struct.pack('>I', offs + 8)
+    tiff = (b'MM\x00\x2a' + struct.pack('>I', 8) + 
+            struct.pack('>H', len(entries)) + b''.join(entries) + 
+            struct.pack('>I', 0) + struct.pack('>II', 1, 250) + date)
+    data = b'Exif\x00\x00' + tiff
+    return b'\xff\xe1' + struct.pack('>H', len(data) + 2) + data
+
+@pytest.mark.parametrize('ext', ['.jpg', '.png', '.tif'])
+def test_probe_header(tmpdir, ext):
+    path = str(tmpdir.join('img' + ext))
+    img = np.random.randint(0, 255, (77, 101, 3), dtype=np.uint8)
+    cv2.imwrite(path, img)
+    info = probe.probe_header(path)
+    assert (info['width'], info['height']) == (101, 77)
+    assert info['channels'] == 3
+    assert info['orientation'] == 1
+    assert probe.decoded_shape(info) == utils.imread(path).shape
+    for pyrlevel in range(1, 5):
+        assert (probe.decoded_shape(info, pyrlevel) == 
+                utils.imread_reduced_gray(path, pyrlevel).shape)
+
+def test_probe_header_orientation(tmpdir):
+    path = str(tmpdir.join('img.jpg'))
+    img = np.random.randint(0, 255, (40, 64, 3), dtype=np.uint8)
+    data = cv2.imencode('.jpg', img)[1].tobytes()
+    with open(path, 'wb') as f:
+        f.write(data[:2] + _exif_segment(6) + data[2:])
+    info = probe.probe_header(path)
+    assert info['orientation'] == 6
+    assert probe.decoded_shape(info) == utils.imread(path).shape
+    assert (probe.decoded_shape(info, 1) == 
+            utils.imread_reduced_gray(path, 1).shape)
+    
+    meta = probe.image_meta(info)
+    assert meta['acq_time'] == datetime(2019, 9, 1, 12, 14, 2, 250000)
+    assert meta['exposure_time'] == 1 / 250
+
+def test_probe_header_exif():
+    file = [f for f in io.get_testimg_files_deshake() 
+            if f.endswith('DSC_5658.jpg')][0]
+    meta = helpers.load_exif_from_image_file(file)
+    assert meta['acq_time'] == datetime(2019, 5, 4, 20, 0, 2)
+    assert meta['iso'] == 200
+    assert meta['model'] == 'NIKON D610'
+    assert helpers.load_exif_from_image_file(__file__) == {}
+    
+def test_probe_header_invalid(tmpdir):
+    path = tmpdir.join('img.jpg')
+    path.write('no image')
+    with pytest.raises(ValueError):
+        probe.probe_header(str(path))
+
+if __name__ == '__main__':
+    pytest.main(['test_probe.py'])
@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+#
+# This module is part of pylapsy.
+# It is licensed under a GPL-3.0 license, for details see LICENSE file.
+#
+# Author: Jonas Gliß
+# Copyright (C) 2019 Jonas Gliss (jonasgliss@gmail.com)
+# GitHub: jgliss
+# Email: jonasgliss@gmail.com
+
+import io as _io
+import shutil
+
+import pytest
+
+from pylapsy import io, ExecutorConfig, Deshaker
+from pylapsy.progress import (ProgressTracker, ProgressBar, ProgressEvent, 
+                              format_event)
+
+@pytest.fixture
+def files(tmpdir):
+    for file in sorted(io.get_testimg_files_deshake())[:6]:
+        shutil.copy(file, str(tmpdir))
+    return io.find_image_files(str(tmpdir), '*.jpg')
+
+def test_tracker():
+    events = []
+    tracker = ProgressTracker(events.append, 10, 'estimate', min_interval=60)
+    tracker.start()
+    tracker.start()
+    for _ in range(10):
+        tracker.update()
+    # initial and final event (updates are throttled)
+    assert [e.completed for e in events] == [0, 10]
+    assert events[-1].eta == 0 and events[-1].fps > 0
+    assert events[-1].stage == 'estimate'
+    events = []
+    tracker = ProgressTracker(events.append, None, min_interval=0)
+    tracker.update(2)
+    assert [e.completed for e in events] == [0, 2]
+    assert events[-1].total is None and events[-1].eta is None
+    assert ProgressTracker.from_input(tracker) is tracker
+    assert ProgressTracker.from_input(None) is None
+    with pytest.raises(ValueError):
+        ProgressTracker.from_input(42)
+
+def test_format_event():
+    event = ProgressEvent('render', 40, 100, 4.0, 10.0, 6.0)
+    assert format_event(event) == 'render 40/100 (40%) 10.0 frames/s ETA 0:00:06'
+    stream = _io.StringIO()
+    ProgressBar(10, stream)(event)
+    assert '[####......]' in stream.getvalue()
+
+@pytest.mark.parametrize('backend', ['serial', 'thread', 'process'])
+def test_imap_progress(backend):
+    events = []
+    config = ExecutorConfig(backend, 2, chunksize=3)
+    assert config.map(abs, range(10), progress=events.append) == list(range(10))
+    assert events[0].completed == 0 and events[-1].completed == 10
+    assert events[-1].total == 10
+
+@pytest.mark.parametrize('executor,mode', [('serial', None), 
+                                           ('thread', None), 
+                                           ('thread', 'sequential')])
+def test_deshake_progress(files, tmpdir, executor, mode):
+    events = []
+    Deshaker(files).deshake(str(tmpdir.mkdir('out')), executor=executor,
+                            mode=mode, progress=events.append)
+    for stage in ['estimate', 'render']:
+        stage_events = [e for e in events if e.stage == stage]
+        assert stage_events[-1].completed == stage_events[-1].total
+    assert [e for e in events if e.stage == 'render'][-1].total == len(files)
+
+if __name__ == '__main__':
+    pytest.main(['test_progress.py'])
@@ -5,6 +5,7 @@ Created on Sat Feb 22 12:46:21 2020
 @author: Jonas
 """
 import pytest
+import numpy.testing as npt
 from pylapsy import speedup_helpers as sh
 
 def test_apply_concurrent_threadpool():
@@ -13,6 +14,101 @@ def test_apply_concurrent_threadpool():
     res = sh.apply_concurrent_threadpool(square, [1,2])
     assert res == [1,4]
     
+def test_apply_bounded_threadpool():
+    def square(a):
+        return a**2
+    res = sh.apply_bounded_threadpool(square, range(10), numworkers=3, 
+                                      maxinflight=2)
+    assert list(res) == [x**2 for x in range(10)]
+    
+    
+def square(a):
+    return a**2
+
+@pytest.mark.parametrize('backend,numworkers,chunksize,maxinflight', [
+    ('serial', None, None, None),
+    ('thread', 3, None, 2),
+    ('process', 2, 3, 1)])
+def test_executor_config_map(backend, numworkers, chunksize, maxinflight):
+    ex = sh.ExecutorConfig(backend, numworkers, chunksize, maxinflight)
+    assert ex.map(square, range(10)) == [x**2 for x in range(10)]
+    
+_INIT = None
+
+def _set_init(val):
+    global _INIT
+    _INIT = val
+    
+def _get_init(a):
+    return (_INIT, a)
+
+@pytest.mark.parametrize('backend', ['serial', 'thread', 'process'])
+def test_executor_config_map_initializer(backend):
+    ex = sh.ExecutorConfig(backend, 2)
+    res = ex.map(_get_init, range(5), initializer=_set_init, initargs=(7,))
+    assert res == [(7, x) for x in range(5)]
+    _set_init(None)
+    
+def test_executor_config_map_no_initargs(monkeypatch):
+    from concurrent.futures import ThreadPoolExecutor
+    class LegacyThreadPoolExecutor(ThreadPoolExecutor):
+        # signature before Python 3.7
+        def __init__(self, max_workers=None):
+            super().__init__(max_workers)
+    monkeypatch.setattr(sh, 'ThreadPoolExecutor', LegacyThreadPoolExecutor)
+    ex = sh.ExecutorConfig('thread', 2)
+    assert ex.map(square, range(5)) == [x**2 for x in range(5)]
+    
+def test_executor_config_from_input():
+    assert sh.ExecutorConfig.from_input(False).workers == 1
+    assert sh.ExecutorConfig.from_input(True).backend == 'thread'
+    ex = sh.ExecutorConfig.from_input(dict(backend='process', numworkers=8))
+    assert ex.workers == 8
+    assert ex.get_chunksize(100) == 4
+    with pytest.raises(ValueError):
+        sh.ExecutorConfig('gpu')
+    
+def test_find_shifts_procpool():
+    from pylapsy import io, utils
+    files = sorted(io.get_testimg_files_deshake())[:6]
+    ref = utils.to_gray(utils.imread(files[0]))
+    res = sh.find_shifts_procpool(files, ref, numworkers=2, chunksize=2)
+    res_threads = sh.find_shifts_fast(files, ref)
+    assert len(res) == 6
+    for (dx, dy, m), (dx1, dy1, m1) in zip(res, res_threads):
+        npt.assert_allclose((dx, dy), (dx1, dy1))
+        npt.assert_allclose(m, m1)
+    
+def test_apply_shared_ref_without_shared_memory(monkeypatch):
+    from pylapsy import io, utils
+    files = sorted(io.get_testimg_files_deshake())[:4]
+    ref = utils.prepare_shift_reference(utils.to_gray(utils.imread(files[0])))
+    ex = sh.ExecutorConfig('process', numworkers=2)
+    res = sh.apply_shared_ref(sh.find_shift_lowlevel, files, ref, ex)
+    # Python < 3.8: reference is sent with each task, no worker initializer
+    monkeypatch.setattr(sh, 'shared_memory', None)
+    imap = sh.ExecutorConfig.imap
+    def spy(self, func, iterable, initializer=None, *args, **kwargs):
+        assert initializer is None
+        return imap(self, func, iterable, initializer, *args, **kwargs)
+    monkeypatch.setattr(sh.ExecutorConfig, 'imap', spy)
+    res1 = sh.apply_shared_ref(sh.find_shift_lowlevel, files, ref, ex)
+    assert len(res1) == 4
+    for (_, _, m), (_, _, m1) in zip(res, res1):
+        npt.assert_allclose(m, m1)
+    
+@pytest.mark.parametrize('backend', ['serial', 'thread', 'process'])
+def test_find_shifts_sequential(backend):
+    from pylapsy import io
+    files = sorted(io.get_testimg_files_deshake())[:6]
+    ex = sh.ExecutorConfig(backend, numworkers=2)
+    res = sh.find_shifts_sequential(files, executor=ex)
+    assert len(res) == 5
+    res_chain = sh.find_shifts_chain_lowlevel(files)
+    for (_, _, m), (_, _, m1) in zip(res, res_chain):
+        npt.assert_allclose(m, m1)
+    res = sh.find_shifts_sequential(files, executor=ex, pairs=[2, 5])
+    npt.assert_allclose(res[1][2], res_chain[4][2])
     
 @pytest.mark.skip(reason='Coming soon...')
 def test_find_shift_lowlevel(imgfile, ref_gray):
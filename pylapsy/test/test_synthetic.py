@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+#
+# This module is part of pylapsy.
+# It is licensed under a GPL-3.0 license, for details see LICENSE file.
+#
+# Author: Jonas Gliß
+# Copyright (C) 2019 Jonas Gliss (jonasgliss@gmail.com)
+# GitHub: jgliss
+# Email: jonasgliss@gmail.com
+
+import numpy as np
+import numpy.testing as npt
+import pytest
+
+from pylapsy import synthetic, utils, Deshaker
+
+def test_camera_transforms():
+    m = synthetic.camera_transforms(5, (100, 50), jitter=0, drift=(1, -2))
+    assert m.shape == (5, 2, 3)
+    npt.assert_allclose(m[:, :, :2], np.tile(np.eye(2), (5, 1, 1)))
+    npt.assert_allclose(m[:, :, 2], np.arange(5)[:, None] * [1, -2])
+    m1 = synthetic.camera_transforms(5, (100, 50), rotation=1, seed=3)
+    m2 = synthetic.camera_transforms(5, (100, 50), rotation=1, seed=3)
+    npt.assert_array_equal(m1, m2)
+
+@pytest.mark.parametrize('ref_index', [0, 2])
+def test_ground_truth(ref_index):
+    m = synthetic.camera_transforms(4, (100, 50), jitter=3, rotation=1, 
+                                    seed=1)
+    gt = synthetic.ground_truth(m, ref_index)
+    npt.assert_allclose(gt[ref_index], [[1, 0, 0], [0, 1, 0]], atol=1e-12)
+    # maps points of reference frame to points of each frame
+    p = np.array([10., 20., 1.])
+    p_base = np.linalg.solve(utils.to_homogeneous(m[ref_index]), p)
+    for i in range(4):
+        npt.assert_allclose(gt[i] @ p, m[i] @ p_base)
+
+def test_render_frame():
+    base = np.full((20, 30, 3), 100, dtype=np.uint8)
+    m = synthetic.camera_transforms(1, (30, 20), jitter=2, seed=1)[0]
+    assert (synthetic.render_frame(base, m) == 100).all()
+    frame = synthetic.render_frame(base, m, gain=3.0)
+    assert frame.dtype == np.uint8 and (frame == 255).all()
+    noisy = synthetic.render_frame(base, m, noise=5, seed=1)
+    assert noisy.std() > 2
+    npt.assert_array_equal(noisy, synthetic.render_frame(base, m, noise=5, 
+                                                         seed=1))
+
+@pytest.mark.parametrize('executor', ['serial', 'thread', 'process'])
+def test_generate_sequence(tmpdir, executor):
+    files, gt = synthetic.generate_sequence(str(tmpdir), 4, size=(200, 134),
+                                            brightness=(0.5, 1.0), seed=1,
+                                            ext='.png', executor=executor)
+    assert len(files) == 4 and gt.shape == (4, 2, 3)
+    imgs = [utils.imread(f) for f in files]
+    assert imgs[0].shape == (134, 200, 3)
+    assert imgs[0].mean() < imgs[-1].mean()
+
+def test_ground_truth_find_shifts(tmpdir):
+    files, gt = synthetic.generate_sequence(str(tmpdir), 5, jitter=5,
+                                            drift=(1, -0.5), rotation=0.3,
+                                            noise=2, seed=2, ext='.png')
+    shifts = Deshaker(files).find_shifts(executor='serial')
+    h, w = utils.imread(files[0]).shape[:2]
+    err = (utils.transform_corners(shifts['matrices'], w, h) - 
+           utils.transform_corners(gt, w, h))
+    assert np.abs(err).max() < 1.0
+
+@pytest.mark.parametrize('keyframe_every,tol', [(None, 2.0), (4, 1.0)])
+def test_ground_truth_find_shifts_sequential(tmpdir, keyframe_every, tol):
+    # neighbouring frames move by up to ~30 px
+    files, gt = synthetic.generate_sequence(str(tmpdir), 12, jitter=8,
+                                            drift=(1.5, -1), rotation=0.3,
+                                            seed=1, ext='.png')
+    shifts = Deshaker(files).find_shifts(executor='serial', 
+                                         mode='sequential',
+                                         keyframe_every=keyframe_every)
+    err = shifts['matrices'][:, :, 2] - gt[:, :, 2]
+    assert np.abs(err).max() < tol
+
+@pytest.mark.parametrize('executor', ['serial', 'thread', 'process'])
+def test_ground_truth_find_shifts_phase(tmpdir, executor):
+    files, gt = synthetic.generate_sequence(str(tmpdir), 5, size=(800, 534),
+                                            jitter=5, drift=(1, -0.5), 
+                                            noise=2, seed=2, ext='.png')
+    shifts = Deshaker(files).find_shifts(executor=executor, method='phase',
+                                         refine=True)
+    npt.assert_allclose(shifts['matrices'][:, :, :2], gt[:, :, :2])
+    npt.assert_allclose(shifts['matrices'][:, :, 2], gt[:, :, 2], atol=0.1)
+    with pytest.raises(ValueError):
+        Deshaker(files).find_shifts(method='orb')
+
+if __name__ == '__main__':
+    pytest.main(['test_synthetic.py'])
@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+#
+# This module is part of pylapsy.
+# It is licensed under a GPL-3.0 license, for details see LICENSE file.
+#
+# Author: Jonas Gliß
+# Copyright (C) 2019 Jonas Gliss (jonasgliss@gmail.com)
+# GitHub: jgliss
+# Email: jonasgliss@gmail.com
+
+import csv
+import json
+import os
+import shutil
+
+import pytest
+
+from pylapsy import io, timing, utils, ExecutorConfig
+from pylapsy.highlevel_methods import deshake
+from pylapsy.speedup_helpers import find_shifts_fast
+
+@pytest.fixture
+def files(tmpdir):
+    for file in sorted(io.get_testimg_files_deshake())[:4]:
+        shutil.copy(file, str(tmpdir))
+    return io.find_image_files(str(tmpdir), '*.jpg')
+
+def test_disabled():
+    assert timing.get_active() is None
+    assert timing.stage('decode') is timing.frame('a')
+
+def test_stage_timer():
+    with timing.measure() as timer:
+        for key in ['a', 'b']:
+            with timing.frame(key):
+                with timing.stage('decode'):
+                    pass
+                with timing.stage('decode'):
+                    pass
+        with timing.stage('render'):
+            pass
+    assert timing.get_active() is None
+    assert len(timer.records) == 5
+    assert timer.frames == ['a', 'b'] and timer.num_frames == 2
+    assert timer.stages == ['decode', 'render']
+    summary = timer.summary()
+    assert summary['decode']['frames'] == 2
+    assert summary['render']['frames'] == 0 and not 'p50' in summary['render']
+    assert '2 frames' in timer.summary_line()
+
+@pytest.mark.parametrize('backend', ['serial', 'thread', 'process'])
+def test_find_shifts_fast(files, backend):
+    ref = utils.to_gray(utils.imread(files[0]))
+    with timing.measure() as timer:
+        find_shifts_fast(files, ref, executor=ExecutorConfig(backend, 2))
+    summary = timer.summary()
+    for stage in ['decode', 'gray', 'lk', 'ransac']:
+        assert summary[stage]['frames'] == len(files)
+    assert summary['decode']['p95'] >= summary['decode']['p50'] > 0
+
+@pytest.mark.parametrize('ext', ['.json', '.csv'])
+def test_deshake_report(files, tmpdir, ext):
+    path = str(tmpdir.join('timing' + ext))
+    timer = deshake(os.path.dirname(files[0]), '*.jpg', 
+                    str(tmpdir.mkdir('out')), executor='thread', 
+                    timing_report=path)
+    stages = timer.stages
+    for stage in ['decode', 'warp', 'encode', 'estimate', 'render']:
+        assert stage in stages
+    if ext == '.json':
+        with open(path) as f:
+            report = json.load(f)
+        assert report['frames'] == len(files)
+        assert report['stages']['encode']['frames'] == len(files)
+    else:
+        with open(path) as f:
+            rows = list(csv.reader(f))
+        assert rows[0] == ['frame'] + stages
+        assert len(rows) == len(files) + 2 # header and unassigned work
+
+if __name__ == '__main__':
+    pytest.main(['test_timing.py'])
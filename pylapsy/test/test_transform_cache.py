@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+#
+# This module is part of pylapsy.
+# It is licensed under a GPL-3.0 license, for details see LICENSE file.
+#
+# Author: Jonas Gliß
+# Copyright (C) 2019 Jonas Gliss (jonasgliss@gmail.com)
+# GitHub: jgliss
+# Email: jonasgliss@gmail.com
+
+import os
+import shutil
+
+import numpy as np
+import numpy.testing as npt
+import pytest
+
+from pylapsy import io
+from pylapsy.transform_cache import TransformCache, make_param_key
+
+@pytest.fixture
+def imgfiles(tmpdir):
+    files = []
+    for which in [1, 2]:
+        files.append(shutil.copy(io.get_test_img(which), str(tmpdir)))
+    return files
+
+def test_make_param_key():
+    assert make_param_key(pyrlevel=0) == make_param_key(pyrlevel=0)
+    assert make_param_key(pyrlevel=0) != make_param_key(pyrlevel=1)
+
+def test_transform_cache(imgfiles):
+    cache = TransformCache.for_files(imgfiles)
+    assert len(cache) == 0
+    key = make_param_key(pyrlevel=0)
+    m = np.array([[1, 0, 2.], [0, 1, -3.]])
+    cache.update(imgfiles[:1], key, [(-2., 3., m)])
+    assert cache.save()
+
+    cache = TransformCache(os.path.dirname(imgfiles[0]))
+    assert cache.lookup(imgfiles, make_param_key(pyrlevel=1)) == [None, None]
+    res = cache.lookup(imgfiles, key)
+    assert res[1] is None
+    dx, dy, m1 = res[0]
+    assert (dx, dy) == (-2., 3.)
+    npt.assert_array_equal(m, m1)
+
+    # modified files are invalidated
+    os.utime(imgfiles[0], ns=(0, 0))
+    assert cache.get(imgfiles[0], key) is None
+
+if __name__ == '__main__':
+    pytest.main(['test_transform_cache.py'])
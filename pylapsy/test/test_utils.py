@@ -90,6 +90,86 @@ def test_get_crop():
     
     assert roi == (6, 88, 14, 36)
     
+def test_get_crop_matrices():
+    m = np.array([[[1, 0, 12], [0, 1, 24]], [[1, 0, -5], [0, 1, -13]]], 
+                 dtype=float)
+    assert u.get_crop_matrices(m, 100, 60) == (5, 88, 13, 36)
+    
+    rot = np.array([[np.cos(0.01), -np.sin(0.01), 0], 
+                    [np.sin(0.01), np.cos(0.01), 0]])
+    # rotation crops right and top / bottom border (by up to 1.6 pixels)
+    assert u.get_crop_matrices([np.eye(2, 3), rot], 100, 60) == (0, 99, 1, 59)
+    with pytest.raises(ValueError):
+        u.get_crop_matrices([[[1, 0, 120], [0, 1, 0]]], 100, 60)
+    
+def test_transform_stats():
+    m = np.zeros((3, 2, 3))
+    m[:, 0, 0] = m[:, 1, 1] = 1
+    m[:, 0, 2] = [0, -3, 1]
+    m[:, 1, 2] = [0, -4, 0]
+    stats = u.transform_stats(m)
+    assert stats['num'] == 3
+    npt.assert_allclose(stats['max_shift'], 5)
+    npt.assert_allclose(stats['max_rotation'], 0)
+    npt.assert_allclose(stats['jitter_rms'], np.sqrt((25 + 32) / 2))
+    
+@pytest.mark.parametrize('m', [M, np.vstack([M, [0, 0, 1]]), H])
+def test_shift_crop_image(test_img1, m):
+    crop = (5, 180, 8, 120)
+    m0 = m.copy()
+    cropped = u.shift_crop_image(test_img1, m, crop)
+    npt.assert_array_equal(m, m0)
+    x0, x1, y0, y1 = crop
+    expected = u.shift_image(test_img1, m.copy())[y0:y1, x0:x1]
+    assert cropped.shape == expected.shape
+    npt.assert_allclose(cropped, expected, atol=1)
+    
+def test_shift_image(test_img1):
+    m = M.copy()
+    shifted = u.shift_image(test_img1, m)
+    npt.assert_array_equal(m, M)
+    npt.assert_array_equal(u.shift_image(test_img1, m), shifted)
+    
+    dst = np.empty_like(test_img1)
+    out = u.shift_image(test_img1, M, dst=dst)
+    assert out is dst or np.shares_memory(out, dst)
+    npt.assert_array_equal(dst, shifted)
+    with pytest.raises(ValueError):
+        u.shift_image(test_img1, M, dst=dst[1:])
+    
+    import cv2
+    shifted = u.shift_image(test_img1, [[1, 0, 10], [0, 1, 0]], 
+                            border_mode=cv2.BORDER_REPLICATE)
+    assert (shifted[:, -1] != 0).any()
+    
+def test_get_crop_margin():
+    assert u.get_crop_margin(100, 60, 0.1) == (10, 90, 6, 54)
+    assert u.get_crop_margin(100, 60, 5) == (5, 95, 5, 55)
+    with pytest.raises(ValueError):
+        u.get_crop_margin(100, 60, 30)
+    
+def test_load_shift_reference():
+    file = io.get_test_img(1)
+    ref = u.load_shift_reference(file, pyrlevel=1, decode='reduced')
+    assert ref['decode'] == 'reduced'
+    gray, prescaled = u.imread_shift_gray(file, ref)
+    assert prescaled and gray.shape == ref['img'].shape
+    # no systematic offset between reference and image decoding
+    (dx, dy), _, _ = u.find_shift_ref(ref, gray, prescaled)
+    npt.assert_allclose((dx, dy), (0, 0), atol=1e-6)
+    
+    ref = u.load_shift_reference(file, pyrlevel=0, decode='reduced')
+    assert ref['decode'] == 'full'
+    with pytest.raises(ValueError):
+        u.load_shift_reference(file, pyrlevel=1, refine=True, 
+                               decode='reduced')
+    with pytest.raises(ValueError):
+        u.load_shift_reference(file, decode='dct')
+    
+def test_imread_reduced_gray():
+    img = u.imread_reduced_gray(io.get_test_img(1), pyrlevel=1)
+    assert img.shape == (134, 200), img.shape
+    
 def test_to_gray(test_img1):
     gray = u.to_gray(test_img1)
     assert type(gray) == np.ndarray
@@ -122,6 +202,112 @@ def test_find_affine_partial2d():
     npt.assert_allclose(M, u.find_affine_partial2d(PTS_FIRST, 
                                                    PTS_SECOND))
     
+def test_lk_max_level():
+    assert u.lk_max_level((267, 400), 5, win_size=15) == 0
+    assert u.lk_max_level((267, 400), 40, win_size=15) == 3
+    # coarsest level must be larger than search window
+    assert u.lk_max_level((100, 150), 1000, win_size=15) == 2
+    
+def test_pyr_down(test_img1):
+    img = u.pyr_down(u.to_gray(test_img1), 2)
+    assert img.shape == (67, 100), img.shape
+    
+def test_scale_affine():
+    m = u.scale_affine(M, 4)
+    npt.assert_allclose(m[:, :2], M[:, :2])
+    npt.assert_allclose(m[:, 2], M[:, 2] * 4)
+    
+@pytest.mark.parametrize('pyrlevel,refine', [(0, False), (1, False),
+                                             (2, True)])
+def test_find_shift_pyr(test_img1, pyrlevel, refine):
+    import cv2
+    gray = u.to_gray(test_img1)
+    gray = cv2.resize(gray, None, fx=4, fy=4, interpolation=cv2.INTER_CUBIC)
+    m = np.array([[1, 0, 7.3], [0, 1, -4.6]])
+    second = cv2.warpAffine(gray, m, gray.shape[::-1])
+    (dx, dy), da, _ = u.find_shift_pyr(gray, second, pyrlevel, refine)
+    npt.assert_allclose((dx, dy), (-7.3, 4.6), atol=0.1)
+    
+def test_find_shift_ref(test_img1, test_img2):
+    gray1 = u.to_gray(test_img1)
+    gray2 = u.to_gray(test_img2)
+    ref = u.prepare_shift_reference(gray1, pyrlevel=0)
+    npt.assert_array_equal(ref['points'], u.find_good_features_to_track(gray1))
+    
+    shift, da, m = u.find_shift_ref(ref, gray2)
+    shift1, da1, m1 = u.find_shift(gray1, gray2)
+    npt.assert_allclose(m, m1)
+    
+def test_phase_correlate_spectra(test_img1):
+    import cv2
+    gray = u.to_gray(test_img1)
+    m = np.array([[1, 0, 7.3], [0, 1, -4.6]])
+    second = cv2.warpAffine(gray, m, gray.shape[::-1])
+    ref = u.prepare_shift_reference(gray, pyrlevel=0, method='phase')
+    assert ref['points'] is None
+    spectrum = u.phase_spectrum(second, ref['window'], ref['dft_size'])
+    shift, response = u.phase_correlate_spectra(spectrum, ref['spectrum'])
+    # same algorithm as OpenCV, but with precomputed reference spectrum
+    shift1, response1 = cv2.phaseCorrelate(gray.astype(np.float32), 
+                                           second.astype(np.float32), 
+                                           ref['window'])
+    npt.assert_allclose(shift, shift1, atol=1e-3)
+    npt.assert_allclose(response, response1, rtol=1e-3)
+    
+@pytest.mark.parametrize('pyrlevel,refine,atol', [(0, False, 0.3), 
+                                                  (2, False, 1.5),
+                                                  (2, True, 0.3)])
+def test_find_shift_phase(test_img1, pyrlevel, refine, atol):
+    import cv2
+    gray = u.to_gray(test_img1)
+    gray = cv2.resize(gray, None, fx=4, fy=4, interpolation=cv2.INTER_CUBIC)
+    m = np.array([[1, 0, 7.3], [0, 1, -4.6]])
+    second = cv2.warpAffine(gray, m, gray.shape[::-1])
+    (dx, dy), da, m1 = u.find_shift_phase(gray, second, pyrlevel, refine)
+    npt.assert_allclose((dx, dy), (-7.3, 4.6), atol=atol)
+    assert da == 0
+    npt.assert_allclose(m1[:, :2], np.eye(2))
+    with pytest.raises(ValueError):
+        u.prepare_shift_reference(gray, method='orb')
+    
+def test_chain_transforms():
+    pairs = [np.array([[1, 0, 2.], [0, 1, -1.]])] * 4
+    cum = u.chain_transforms(pairs, ref_index=2)
+    assert cum.shape == (5, 2, 3)
+    npt.assert_allclose(cum[:, 0, 2], [-4, -2, 0, 2, 4])
+    npt.assert_allclose(cum[:, 1, 2], [2, 1, 0, -1, -2])
+    
+    anchor = np.array([[1, 0, 5.], [0, 1, 0.]])
+    cum = u.chain_transforms(pairs, ref_index=0, anchors={2 : anchor})
+    npt.assert_allclose(cum[:, 0, 2], [0, 2, 5, 7, 9])
+    
+@pytest.mark.parametrize('method', ['moving_average', 'gaussian', 'savgol'])
+def test_smooth_trajectory(method):
+    rng = np.random.RandomState(42)
+    params = np.zeros((50, 4))
+    params[:, 0] = np.linspace(0, 20, 50) + rng.normal(0, 2, 50)
+    params[:, 2] = rng.normal(0, 0.01, 50)
+    params[:, 3] = 1
+    m = u.compose_affine(params)
+    npt.assert_allclose(u.decompose_affine(m), params)
+    
+    smoothed = u.smooth_trajectory(m, 9, method)
+    assert smoothed.shape == (50, 2, 3)
+    assert (u.transform_stats(smoothed)['jitter_rms'] < 
+            u.transform_stats(m)['jitter_rms'] / 2)
+    corr = u.trajectory_corrections(m, smoothed)
+    # corrections only contain shake, not the drift 
+    assert np.abs(corr[:, :, 2]).max() < np.abs(m[:, :, 2]).max() / 2
+    npt.assert_allclose(u.trajectory_corrections(m, m)[:, :, :2], 
+                        np.tile(np.eye(2), (50, 1, 1)), atol=1e-12)
+    
+def test_smoothing_kernel():
+    npt.assert_allclose(u.smoothing_kernel(5, 'moving_average'), [0.2] * 5)
+    npt.assert_allclose(u.smoothing_kernel(5, 'savgol', 2), 
+                        np.array([-3, 12, 17, 12, -3]) / 35)
+    with pytest.raises(ValueError):
+        u.smoothing_kernel(4)
+    
 def test_find_homography():
     npt.assert_allclose(H, u.find_homography(PTS_FIRST, 
                                              PTS_SECOND))
@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+#
+# This module is part of pylapsy.
+# It is licensed under a GPL-3.0 license, for details see LICENSE file.
+#
+# Author: Jonas Gliß
+# Copyright (C) 2019 Jonas Gliss (jonasgliss@gmail.com)
+# GitHub: jgliss
+# Email: jonasgliss@gmail.com
+
+import os
+import threading
+
+import cv2
+import numpy as np
+import pytest
+
+from pylapsy.writers import EncodeParams, ImageWriter, VideoWriter
+
+def test_encode_params():
+    params = EncodeParams(quality=80, progressive=True, png_compression=1)
+    assert params.get_flags('a.jpg') == [cv2.IMWRITE_JPEG_QUALITY, 80,
+                                         cv2.IMWRITE_JPEG_PROGRESSIVE, 1]
+    assert params.get_flags('a.png') == [cv2.IMWRITE_PNG_COMPRESSION, 1]
+    assert EncodeParams().get_flags('a.jpg') == []
+    
+    fast = EncodeParams.from_input('fast')
+    assert fast.output_path(os.path.join('out', 'a.jpg')) == os.path.join(
+        'out', 'a.png')
+    assert EncodeParams.from_input(dict(quality=50)).quality == 50
+    with pytest.raises(ValueError):
+        EncodeParams(quality=101)
+    with pytest.raises(ValueError):
+        EncodeParams(tiff_compression='zip')
+        
+def test_image_writer(tmpdir):
+    img = np.random.randint(0, 255, (60, 80, 3), dtype=np.uint8)
+    with ImageWriter(2, maxqueue=2, params=dict(quality=50)) as writer:
+        for i in range(5):
+            writer.write(img, str(tmpdir.join('{}.jpg'.format(i))))
+    assert writer.num_written == 5
+    assert len(tmpdir.listdir()) == 5
+    with pytest.raises(ValueError):
+        writer.write(img, str(tmpdir.join('x.jpg')))
+        
+def test_image_writer_error(tmpdir):
+    writer = ImageWriter(1)
+    writer.write(np.zeros((10, 10), dtype=np.uint8), 
+                 str(tmpdir.join('nodir', 'a.png')))
+    with pytest.raises(IOError):
+        writer.close()
+
+def _frame(i):
+    return np.full((60, 80, 3), 10 * i, dtype=np.uint8)
+
+def test_video_writer_reorder(tmpdir):
+    path = str(tmpdir.join('out.avi'))
+    order = [2, 0, 1, 4, 3, 5]
+    with VideoWriter(path, fps=10, backend='opencv', maxbuffer=3) as writer:
+        threads = [threading.Thread(target=writer.write, args=(i, _frame(i)))
+                   for i in order]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    assert writer.num_written == 6
+    cap = cv2.VideoCapture(path)
+    means = []
+    while True:
+        ok, frame = cap.read()
+        if not ok:
+            break
+        assert frame.shape == (60, 80, 3)
+        means.append(frame.mean())
+    assert len(means) == 6
+    np.testing.assert_allclose(means, np.arange(6) * 10, atol=3)
+
+def test_video_writer_encoder_thread(tmpdir):
+    path = str(tmpdir.join('out.avi'))
+    writer = VideoWriter(path, backend='opencv', maxbuffer=4)
+    encode_frame = writer._encode_frame
+    release = threading.Event()
+    def slow_encode(frame):
+        release.wait()
+        encode_frame(frame)
+    writer._encode_frame = slow_encode
+    # frames are handed over while the encoder is busy
+    thread = threading.Thread(target=lambda : [writer.write(i, _frame(i)) 
+                                               for i in range(4)])
+    thread.start()
+    thread.join(5)
+    assert not thread.is_alive()
+    assert writer.num_written == 0
+    release.set()
+    writer.close()
+    assert writer.num_written == 4
+    
+def test_video_writer_error(tmpdir):
+    writer = VideoWriter(str(tmpdir.join('out.avi')), backend='opencv')
+    def fail(frame):
+        raise RuntimeError('encoder failed')
+    writer._encode_frame = fail
+    writer.write(0, _frame(0))
+    with pytest.raises(IOError):
+        writer.close()
+    
+def test_video_writer_resize(tmpdir):
+    path = str(tmpdir.join('out.mp4'))
+    with VideoWriter(path, backend='opencv', size=(40, 30)) as writer:
+        for i in range(3):
+            writer.write(i, _frame(i)[..., 0])
+        with pytest.raises(ValueError):
+            writer.write(1, _frame(1))
+    cap = cv2.VideoCapture(path)
+    assert cap.get(cv2.CAP_PROP_FRAME_COUNT) == 3
+    assert cap.get(cv2.CAP_PROP_FRAME_WIDTH) == 40
+    with pytest.raises(ValueError):
+        writer.write(3, _frame(3))
+    with pytest.raises(ValueError):
+        VideoWriter(path, backend='gstreamer')
+
+if __name__ == '__main__':
+    pytest.main(['test_writers.py'])
@@ -0,0 +1,337 @@
+# -*- coding: utf-8 -*-
+#
+# This module is part of pylapsy.
+# It is licensed under a GPL-3.0 license, for details see LICENSE file.
+#
+# Author: Jonas Gliß
+# Copyright (C) 2019 Jonas Gliss (jonasgliss@gmail.com)
+# GitHub: jgliss
+# Email: jonasgliss@gmail.com
+"""
+Opt-in timing of processing stages (decode, feature detection, tracking,
+warping, encoding, etc.)
+
+The hot paths in :mod:`pylapsy.utils`, :mod:`pylapsy.speedup_helpers`,
+:mod:`pylapsy.writers` and :class:`pylapsy.Deshaker` are instrumented via
+:func:`stage` and :func:`frame`. Durations are only recorded while a
+:class:`StageTimer` is active (cf. :func:`measure`), otherwise the
+instrumentation is a no-op. Durations measured in worker processes of the
+process backend are sent back with the results (cf.
+:func:`pylapsy.ExecutorConfig.imap`).
+
+Example
+-------
+>>> import pylapsy as ply
+>>> with ply.timing.measure() as timer:
+...     ply.deshake('my_sequence', outdir='out')
+>>> print(timer.summary_line())
+>>> timer.save('timing.json')
+"""
+import csv
+import json
+import threading
+from contextlib import contextmanager
+from time import perf_counter
+
+import numpy as np
+
+#: instrumented stages (per frame): order used in reports
+STAGES = ['decode', 'gray', 'pyramid', 'features', 'lk', 'ransac', 'phase',
+          'refine', 'warp', 'encode', 'video']
+#: instrumented phases of a run (not per frame)
+PHASES = ['reference', 'estimate', 'render']
+
+_ACTIVE = None
+_LOCAL = threading.local()
+
+class _Null(object):
+    """No-op context manager (timing disabled)"""
+    __slots__ = ()
+
+    def __enter__(self):
+        pass
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        pass
+
+_NULL = _Null()
+
+class StageTimer(object):
+    """Collects durations of processing stages
+
+    Each record is a tuple (frame, stage, duration), where frame is the
+    key of the frame that was processed (usually the image file path, the
+    frame index for video encoding and None if the work is not related to
+    a single frame, e.g. the preparation of the reference image or a whole
+    processing phase).
+
+    Attributes
+    ----------
+    records : list
+        recorded (frame, stage, duration) tuples, duration in s
+    """
+    def __init__(self):
+        self.records = []
+        self.start = perf_counter()
+        self.stop = None
+
+    def add(self, frame, stage, duration):
+        """Add duration of stage"""
+        self.records.append((frame, stage, duration))
+
+    def extend(self, records):
+        """Add records (e.g. from worker processes)"""
+        self.records.extend(records)
+
+    @property
+    def wall_time(self):
+        """Elapsed time between start and stop of timer (s)"""
+        stop = perf_counter() if self.stop is None else self.stop
+        return stop - self.start
+
+    @property
+    def stages(self):
+        """Names of recorded stages (instrumented stages first)"""
+        names = set(rec[1] for rec in self.records)
+        known = [s for s in STAGES + PHASES if s in names]
+        return known + sorted(names.difference(known))
+
+    @property
+    def frames(self):
+        """Keys of processed frames (in order of first record)"""
+        return list(dict.fromkeys(rec[0] for rec in self.records
+                                  if rec[0] is not None))
+
+    @property
+    def num_frames(self):
+        """Number of processed frames (maximum over all stages)"""
+        counts = {}
+        for frame, stage in set(rec[:2] for rec in list(self.records)):
+            if frame is not None:
+                counts[stage] = counts.get(stage, 0) + 1
+        return max(counts.values()) if counts else 0
+
+    def frame_durations(self):
+        """Total duration of each stage for each frame
+
+        Returns
+        -------
+        dict
+            stage: dict (frame: duration), durations of work not related to
+            a frame are listed under frame None
+        """
+        out = {}
+        for frame, stage, duration in list(self.records):
+            durations = out.setdefault(stage, {})
+            durations[frame] = durations.get(frame, 0.0) + duration
+        return out
+
+    def summary(self):
+        """Aggregated statistics of each stage
+
+        Returns
+        -------
+        dict
+            stage: dict with `total` (s, all calls), `frames` (number of
+            frames), `p50`, `p95`, `max` (s, per frame), and `fps` (frames
+            processed per s of stage time, that is, per worker)
+        """
+        out = {}
+        for stage, durations in self.frame_durations().items():
+            total = float(sum(durations.values()))
+            vals = np.array([v for k, v in durations.items()
+                             if k is not None])
+            info = dict(total=total, frames=len(vals))
+            if len(vals) > 0:
+                info.update(p50=float(np.percentile(vals, 50)),
+                            p95=float(np.percentile(vals, 95)),
+                            max=float(vals.max()),
+                            fps=(float(len(vals) / vals.sum())
+                                 if vals.sum() > 0 else None))
+            out[stage] = info
+        return {stage : out[stage] for stage in self.stages}
+
+    def summary_line(self):
+        """One line summary (e.g. for the end of a CLI run)"""
+        summary = self.summary()
+        num = self.num_frames
+        wall = self.wall_time
+        items = []
+        for stage, info in summary.items():
+            if info['frames'] > 0:
+                items.append('{} {:.1f}/{:.1f} ms'.format(
+                    stage, info['p50'] * 1000, info['p95'] * 1000))
+            else:
+                items.append('{} {:.2f} s'.format(stage, info['total']))
+        return ('{} frames in {:.2f} s ({:.1f} frames/s); per frame p50/p95: '
+                '{}'.format(num, wall, num / wall if wall > 0 else 0,
+                            ', '.join(items)))
+
+    def save(self, path):
+        """Save timing report
+
+        Parameters
+        ----------
+        path : str
+            output file. CSV files (extension .csv) contain one row per
+            frame and one column per stage (duration in s), JSON files the
+            summary (cf. :func:`summary`) and the per frame durations.
+        """
+        if path.lower().endswith('.csv'):
+            self._save_csv(path)
+            return
+        report = dict(wall_time=self.wall_time,
+                      frames=self.num_frames,
+                      stages=self.summary(),
+                      durations={stage : [[k, v] for k, v in d.items()]
+                                 for stage, d in
+                                 self.frame_durations().items()})
+        with open(path, 'w') as f:
+            json.dump(report, f, indent=1)
+
+    def _save_csv(self, path):
+        durations = self.frame_durations()
+        stages = self.stages
+        with open(path, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(['frame'] + stages)
+            for frame in self.frames + [None]:
+                row = [durations[s].get(frame) for s in stages]
+                if frame is None and all(v is None for v in row):
+                    continue
+                writer.writerow(['' if frame is None else frame] +
+                                ['' if v is None else '{:.6f}'.format(v)
+                                 for v in row])
+
+class _Stage(object):
+    __slots__ = ('timer', 'name', 't0')
+
+    def __init__(self, timer, name):
+        self.timer = timer
+        self.name = name
+
+    def __enter__(self):
+        self.t0 = perf_counter()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.timer.add(current_frame(), self.name, perf_counter() - self.t0)
+
+class _Frame(object):
+    __slots__ = ('key', 'prev')
+
+    def __init__(self, key):
+        self.key = key
+
+    def __enter__(self):
+        self.prev = current_frame()
+        _LOCAL.frame = self.key
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        _LOCAL.frame = self.prev
+
+def enable(timer=None):
+    """Activate timer for this process
+
+    Parameters
+    ----------
+    timer : StageTimer, optional
+        timer, a new one is created if None
+
+    Returns
+    -------
+    StageTimer
+        the active timer
+    """
+    global _ACTIVE
+    if timer is None:
+        timer = StageTimer()
+    _ACTIVE = timer
+    return timer
+
+def disable():
+    """Deactivate timer
+
+    Returns
+    -------
+    StageTimer or None
+        previously active timer
+    """
+    global _ACTIVE
+    timer, _ACTIVE = _ACTIVE, None
+    if timer is not None and timer.stop is None:
+        timer.stop = perf_counter()
+    return timer
+
+def get_active():
+    """Currently active timer (None if timing is disabled)"""
+    return _ACTIVE
+
+@contextmanager
+def measure(timer=None):
+    """Context manager that records stage durations
+
+    Parameters
+    ----------
+    timer : StageTimer, optional
+        timer, a new one is created if None
+
+    Yields
+    ------
+    StageTimer
+    """
+    global _ACTIVE
+    prev = _ACTIVE
+    timer = enable(timer)
+    try:
+        yield timer
+    finally:
+        timer.stop = perf_counter()
+        _ACTIVE = prev
+
+def stage(name):
+    """Context manager that records the duration of a processing stage
+
+    Parameters
+    ----------
+    name : str
+        name of stage (cf. :attr:`STAGES`)
+    """
+    timer = _ACTIVE
+    if timer is None:
+        return _NULL
+    return _Stage(timer, name)
+
+def frame(key):
+    """Context manager that assigns recorded stages to a frame
+
+    Parameters
+    ----------
+    key : str or int
+        key of frame, e.g. image file path
+    """
+    if _ACTIVE is None:
+        return _NULL
+    return _Frame(key)
+
+def current_frame():
+    """Key of frame that is processed in current thread (or None)"""
+    return getattr(_LOCAL, 'frame', None)
+
+def run_with_timer(func, *args):
+    """Call function with new active timer (e.g. in a worker process)
+
+    Returns
+    -------
+    object
+        return value of `func`
+    list
+        records of timer
+    """
+    global _ACTIVE
+    prev = _ACTIVE
+    timer = enable()
+    try:
+        result = func(*args)
+    finally:
+        _ACTIVE = prev
+    return result, timer.records
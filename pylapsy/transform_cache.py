@@ -0,0 +1,200 @@
+# -*- coding: utf-8 -*-
+#
+# This module is part of pylapsy.
+# It is licensed under a GPL-3.0 license, for details see LICENSE file.
+#
+# Author: Jonas Gliß
+# Copyright (C) 2019 Jonas Gliss (jonasgliss@gmail.com)
+# GitHub: jgliss
+# Email: jonasgliss@gmail.com
+"""
+Persistent on-disk cache for image shifts / transformation matrices
+"""
+import hashlib
+import json
+import os
+
+import numpy as np
+
+from pylapsy import defaults, print_log
+
+#: default file name of cache (stored in image directory)
+CACHE_FILENAME = '.pylapsy_transforms.npz'
+
+def file_key(file_path):
+    """Identification of image file used in cache
+
+    Parameters
+    ----------
+    file_path : str
+        image file path
+
+    Returns
+    -------
+    tuple
+        absolute file path, size in bytes and modification time (ns)
+    """
+    stat = os.stat(file_path)
+    return (os.path.abspath(file_path), stat.st_size, stat.st_mtime_ns)
+
+def make_param_key(**params):
+    """Create hash from estimator parameters
+
+    The global feature detection and LK parameters in :mod:`defaults` are
+    included automatically.
+
+    Parameters
+    ----------
+    **params
+        parameters that define the estimated transforms (e.g. reference file,
+        pyramid level), need to be JSON serialisable
+
+    Returns
+    -------
+    str
+        hash of input parameters
+    """
+    allparams = dict(feature_params=defaults['feature_params'],
+                     lk_params=defaults['lk_params'])
+    allparams.update(params)
+    s = json.dumps(allparams, sort_keys=True, default=str)
+    return hashlib.sha1(s.encode()).hexdigest()[:16]
+
+class TransformCache(object):
+    """Cache of image shifts and transformation matrices
+
+    Entries are keyed by file path, file size, modification time and a
+    hash of the estimator parameters (cf. :func:`make_param_key`) and are
+    stored in a compressed `.npz` file.
+
+    Parameters
+    ----------
+    path : str
+        location of cache file. If it is a directory, the default file name
+        (:attr:`CACHE_FILENAME`) is used.
+    """
+    def __init__(self, path):
+        if os.path.isdir(path):
+            path = os.path.join(path, CACHE_FILENAME)
+        self.path = path
+        self._entries = {}
+        if os.path.exists(path):
+            self.load()
+
+    @staticmethod
+    def for_files(files):
+        """Create cache located in the directory of the input files
+
+        Parameters
+        ----------
+        files : list
+            image files
+
+        Returns
+        -------
+        TransformCache
+        """
+        return TransformCache(os.path.dirname(os.path.abspath(files[0])))
+
+    def __len__(self):
+        return len(self._entries)
+
+    def load(self):
+        """Load cache file"""
+        with np.load(self.path, allow_pickle=False) as data:
+            for i, file in enumerate(data['files']):
+                key = (str(file), str(data['params'][i]))
+                self._entries[key] = (int(data['sizes'][i]),
+                                      int(data['mtimes'][i]),
+                                      float(data['dx'][i]),
+                                      float(data['dy'][i]),
+                                      data['matrices'][i])
+
+    def save(self):
+        """Save cache file
+
+        Returns
+        -------
+        bool
+            True if cache could be saved, else False
+        """
+        if len(self._entries) == 0:
+            return False
+        keys = list(self._entries)
+        vals = [self._entries[k] for k in keys]
+        files, params = zip(*keys)
+        sizes, mtimes, dx, dy, matrices = zip(*vals)
+        try:
+            with open(self.path, 'wb') as f:
+                np.savez_compressed(f,
+                                    files=np.asarray(files),
+                                    params=np.asarray(params),
+                                    sizes=np.asarray(sizes, dtype=np.int64),
+                                    mtimes=np.asarray(mtimes, dtype=np.int64),
+                                    dx=np.asarray(dx, dtype=np.float64),
+                                    dy=np.asarray(dy, dtype=np.float64),
+                                    matrices=np.asarray(matrices,
+                                                        dtype=np.float64))
+        except OSError as e:
+            print_log.warning('Failed to save transform cache at {}. '
+                              'Reason: {}'.format(self.path, repr(e)))
+            return False
+        return True
+
+    def get(self, file_path, param_key):
+        """Get cached result for image file
+
+        Parameters
+        ----------
+        file_path : str
+            image file
+        param_key : str
+            estimator parameter hash (cf. :func:`make_param_key`)
+
+        Returns
+        -------
+        tuple or None
+            (dx, dy, M) or None, if file is not in cache (or was modified)
+        """
+        path, size, mtime = file_key(file_path)
+        entry = self._entries.get((path, param_key))
+        if entry is None or entry[0] != size or entry[1] != mtime:
+            return None
+        return (entry[2], entry[3], entry[4].copy())
+
+    def lookup(self, files, param_key):
+        """Get cached results for list of image files
+
+        Parameters
+        ----------
+        files : list
+            image files
+        param_key : str
+            estimator parameter hash (cf. :func:`make_param_key`)
+
+        Returns
+        -------
+        list
+            cached (dx, dy, M) for each file, None for files that are not
+            cached
+        """
+        return [self.get(f, param_key) for f in files]
+
+    def update(self, files, param_key, results):
+        """Add results to cache
+
+        Parameters
+        ----------
+        files : list
+            image files
+        param_key : str
+            estimator parameter hash (cf. :func:`make_param_key`)
+        results : list
+            (dx, dy, M) for each file
+        """
+        for file, (dx, dy, m) in zip(files, results):
+            path, size, mtime = file_key(file)
+            self._entries[(path, param_key)] = (size, mtime, float(dx),
+                                                float(dy),
+                                                np.asarray(m,
+                                                           dtype=np.float64))
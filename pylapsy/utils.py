@@ -11,7 +11,7 @@ import cv2
 import numpy as np
 
 from pylapsy.helpers import isnumeric
-from pylapsy import defaults
+from pylapsy import defaults, timing
 
 def imread(file_path):
     """Read image file using :func:`cv2.imread`
@@ -30,9 +30,44 @@ def imread(file_path):
     ndarray
         image data
     """
-    return cv2.imread(file_path)#opencv loads BGR as default
+    with timing.stage('decode'):
+        return cv2.imread(file_path)#opencv loads BGR as default
 
-def imsave(img_arr, path):
+def imread_reduced_gray(file_path, pyrlevel=1):
+    """Read image file as downscaled gray image
+    
+    Uses the reduced decoding flags of :func:`cv2.imread` (e.g. 
+    :attr:`cv2.IMREAD_REDUCED_GRAYSCALE_4`), which, for JPEG files, scale 
+    the image already in the DCT domain and are thus much faster than 
+    decoding the full image and downscaling it afterwards.
+    
+    Parameters
+    ----------
+    file_path : str
+        image file path
+    pyrlevel : int
+        pyramid level of output image (e.g. 1, 2 or 3, corresponding to a 
+        downscaling of 2, 4 or 8). Levels above 3 are decoded at level 3 
+        and further downscaled using :func:`pyr_down`.
+        
+    Returns
+    -------
+    ndarray
+        downscaled gray image data
+    """
+    flags = {1 : cv2.IMREAD_REDUCED_GRAYSCALE_2,
+             2 : cv2.IMREAD_REDUCED_GRAYSCALE_4,
+             3 : cv2.IMREAD_REDUCED_GRAYSCALE_8}
+    if not isinstance(pyrlevel, int) or pyrlevel < 1:
+        raise ValueError('Invalid input for pyrlevel: {}. Need int > 0'
+                         .format(pyrlevel))
+    with timing.stage('decode'):
+        img = cv2.imread(file_path, flags[min(pyrlevel, 3)])
+    if img is None:
+        raise IOError('Failed to read image file {}'.format(file_path))
+    return pyr_down(img, pyrlevel - 3) if pyrlevel > 3 else img
+
+def imsave(img_arr, path, params=None):
     """Save image files using :func:`cv2.imwrite`
     
     Parameters
@@ -41,13 +76,21 @@ def imsave(img_arr, path):
         image data
     path : str
         destination of image
+    params : EncodeParams or list, optional
+        encoding settings (cf. :class:`pylapsy.writers.EncodeParams`) or 
+        list of :func:`cv2.imwrite` flags
     
     Returns
     -------
     bool
         success or not
     """
-    return cv2.imwrite(path, img_arr)
+    if params is None:
+        params = []
+    elif not isinstance(params, (list, tuple)):
+        params = params.get_flags(path)
+    with timing.stage('encode'):
+        return cv2.imwrite(path, img_arr, list(params))
 
 def imshow(img_arr, add_cbar=False, cbar_label=None,cmap=None, ax=None, 
            **kwargs):
@@ -118,7 +161,31 @@ def to_gray(img_arr):
         gray image data (cf. :func:`imread`).
         Shape: `(N, M, 1)`
     """
-    return cv2.cvtColor(img_arr, cv2.COLOR_BGR2GRAY)
+    with timing.stage('gray'):
+        return cv2.cvtColor(img_arr, cv2.COLOR_BGR2GRAY)
+
+def pyr_down(img_arr, steps=1):
+    """Downscale image using Gaussian pyramid (:func:`cv2.pyrDown`)
+    
+    Parameters
+    ----------
+    img_arr : ndarray
+        image data
+    steps : int
+        number of pyramid steps (each step reduces the image size by a 
+        factor of 2)
+        
+    Returns
+    -------
+    ndarray
+        downscaled image data
+    """
+    if steps < 1:
+        return img_arr
+    with timing.stage('pyramid'):
+        for _ in range(steps):
+            img_arr = cv2.pyrDown(img_arr)
+    return img_arr
 
 # Detect edges (Sobel filter)
 def apply_sobel_hor(img_arr, **kwargs):
@@ -205,8 +272,8 @@ def find_good_features_to_track(img_arr, plot=False, **params):
         from pylapsy import print_log
         print_log.warning('Input should be gray-scale...')
         
-    # default params
-    ft_params = defaults['feature_params']
+    # default params (copy, to not overwrite global defaults)
+    ft_params = dict(defaults['feature_params'])
 # =============================================================================
 #     dict(maxCorners = 100,
 #                   qualityLevel = 0.3,
@@ -214,7 +281,8 @@ def find_good_features_to_track(img_arr, plot=False, **params):
 #                   blockSize = 7)
 # =============================================================================
     ft_params.update(**params)
-    p0 = cv2.goodFeaturesToTrack(img_arr, **ft_params)
+    with timing.stage('features'):
+        p0 = cv2.goodFeaturesToTrack(img_arr, **ft_params)
     if plot:
         ax = imshow(img_arr)
         plot_feature_points(p0, ax=ax)
@@ -285,13 +353,14 @@ def compute_flow_lk(img1, img2, points_to_track=None, **params):
         p0 = points_to_track
     
     # Parameters for lucas kanade optical flow
-    lk_params = defaults['lk_params']
+    lk_params = dict(defaults['lk_params'])
     
     lk_params.update(params)
      
     # calculate optical flow
-    p1, st, err = cv2.calcOpticalFlowPyrLK(img1, img2, p0, None, 
-                                           **lk_params)
+    with timing.stage('lk'):
+        p1, st, err = cv2.calcOpticalFlowPyrLK(img1, img2, p0, None, 
+                                               **lk_params)
     
     # Sanity check
     assert p0.shape == p1.shape 
@@ -299,6 +368,35 @@ def compute_flow_lk(img1, img2, points_to_track=None, **params):
     # Filter only valid point
     # Select good points
     return (p0[st==1], p1[st==1])
+
+def lk_max_level(shape, max_shift, win_size=None):
+    """Number of LK pyramid levels needed to track a shift
+    
+    Each pyramid level doubles the displacement that can be tracked with 
+    the LK search window (about half the window size on the finest level).
+    The number of levels is limited such that the coarsest level is still 
+    larger than the search window.
+    
+    Parameters
+    ----------
+    shape : tuple
+        image shape (rows, cols) on which features are tracked
+    max_shift : float
+        maximum expected shift (pixels)
+    win_size : int, optional
+        LK search window size, defaults to `winSize` in `lk_params` in 
+        :mod:`defaults`
+        
+    Returns
+    -------
+    int
+        maxLevel for :func:`compute_flow_lk`
+    """
+    if win_size is None:
+        win_size = defaults['lk_params']['winSize'][0]
+    level = int(np.ceil(np.log2(max(max_shift / (win_size / 2), 1))))
+    limit = int(np.floor(np.log2(max(min(shape[:2]) / win_size, 1))))
+    return min(level, limit)
     
 def find_affine_partial2d(p0=None, p1=None, **kwargs):
     """Find 2D affine transformation matrix
@@ -325,7 +423,8 @@ def find_affine_partial2d(p0=None, p1=None, **kwargs):
     ndarray
         transformation matrix
     """
-    return cv2.estimateAffinePartial2D(p0, p1, **kwargs)[0]
+    with timing.stage('ransac'):
+        return cv2.estimateAffinePartial2D(p0, p1, **kwargs)[0]
     
 def find_homography(p0=None, p1=None):
     """Find homography matrix
@@ -393,22 +492,878 @@ def find_shift(first_gray, second_gray, **feature_lk_params):
     da = np.arctan2(m[1,0], m[0,0])
     return ((-dx, -dy), da, m)
 
-def shift_image(img_arr, m=None):
+def scale_affine(m, fac):
+    """Scale affine transformation matrix to a different image resolution
+    
+    E.g. to convert a matrix retrieved on pyramid level 2 to full 
+    resolution, use `fac=4`.
+    
+    Parameters
+    ----------
+    m : ndarray
+        2x3 affine transformation matrix
+    fac : float
+        scaling factor
+        
+    Returns
+    -------
+    ndarray
+        scaled copy of input matrix
+    """
+    m = np.array(m, dtype=np.float64)
+    m[:, 2] *= fac
+    return m
+
+def get_refine_roi(w0, h0, roi_size=None):
+    """Get central ROI used for full resolution shift refinement
+    
+    Parameters
+    ----------
+    w0 : int
+        image width
+    h0 : int
+        image height
+    roi_size : int, optional
+        size of quadratic ROI. Defaults to `refine_roi_size` in 
+        :attr:`defaults`
+        
+    Returns
+    -------
+    tuple
+        4-element tuple containing ROI: (x0, x1, y0, y1)
+    """
+    if roi_size is None:
+        roi_size = defaults['shift_params']['refine_roi_size']
+    x0, y0 = max((w0 - roi_size) // 2, 0), max((h0 - roi_size) // 2, 0)
+    return (x0, min(x0 + roi_size, w0), y0, min(y0 + roi_size, h0))
+
+def find_refine_points(first_gray, roi_size=None):
+    """Find feature points for full resolution shift refinement
+    
+    Parameters
+    ----------
+    first_gray : ndarray
+        gray image (full resolution)
+    roi_size : int, optional
+        size of ROI (cf. :func:`get_refine_roi`)
+        
+    Returns
+    -------
+    ndarray or None
+        feature points in full resolution coordinates (None if no suitable
+        points could be found in ROI)
+    """
+    h, w = first_gray.shape[:2]
+    x0, x1, y0, y1 = get_refine_roi(w, h, roi_size)
+    p0 = find_good_features_to_track(first_gray[y0:y1, x0:x1])
+    if p0 is None:
+        return None
+    return p0 + np.asarray((x0, y0), dtype=p0.dtype)
+
+def refine_shift_roi(first_gray, second_gray, m, roi_size=None, 
+                     points_to_track=None, **feature_lk_params):
+    """Refine translation of affine matrix in a full resolution ROI
+    
+    Feature points are detected in a central ROI of the first image and 
+    tracked in the second image using :func:`compute_flow_lk`, starting from
+    the positions predicted by the input matrix (e.g. a matrix that was 
+    retrieved on a higher pyramid level, cf. :func:`find_shift_pyr`). The 
+    median residual is added to the translation of the matrix.
+    
+    Parameters
+    ----------
+    first_gray : ndarray
+        first image (gray scale, full resolution)
+    second_gray : ndarray
+        second image
+    m : ndarray
+        initial 2x3 affine transformation matrix (first -> second)
+    roi_size : int, optional
+        size of quadratic ROI. Defaults to `refine_roi_size` in 
+        :attr:`defaults`
+    points_to_track : ndarray, optional
+        feature points in first image (full resolution coordinates, within 
+        ROI, cf. :func:`get_refine_roi`). Detected if unspecified.
+    **feature_lk_params
+        additional keyword args passed to :func:`compute_flow_lk`
+        
+    Returns
+    -------
+    ndarray
+        refined copy of input matrix
+    """
+    m = np.array(m, dtype=np.float64)
+    h, w = first_gray.shape[:2]
+    x0, x1, y0, y1 = get_refine_roi(w, h, roi_size)
+    
+    if points_to_track is None:
+        points_to_track = find_refine_points(first_gray, roi_size)
+    if points_to_track is None:
+        return m
+    p0 = points_to_track.reshape(-1, 2)
+    p1_pred = p0 @ m[:, :2].T + m[:, 2]
+    
+    # extend ROI such that predicted positions are included
+    lk_params = dict(defaults['lk_params'])
+    pad = int(np.ceil(np.abs(p1_pred - p0).max())) + lk_params['winSize'][0]
+    ex0, ey0 = max(x0 - pad, 0), max(y0 - pad, 0)
+    ex1, ey1 = min(x1 + pad, w), min(y1 + pad, h)
+    
+    off = np.asarray((ex0, ey0), dtype=np.float32)
+    p0 = (p0 - off).astype(np.float32).reshape(-1, 1, 2)
+    p1_init = (p1_pred - off).astype(np.float32).reshape(-1, 1, 2)
+    
+    lk_params.update(maxLevel=1, flags=cv2.OPTFLOW_USE_INITIAL_FLOW)
+    lk_params.update(feature_lk_params)
+    with timing.stage('refine'):
+        p1, st, err = cv2.calcOpticalFlowPyrLK(
+            first_gray[ey0:ey1, ex0:ex1], second_gray[ey0:ey1, ex0:ex1], 
+            p0, p1_init.copy(), # in/out
+            **lk_params)
+    ok = st.ravel() == 1
+    if not ok.any():
+        return m
+    residual = np.median((p1 - p1_init).reshape(-1, 2)[ok], axis=0)
+    m[:, 2] += residual
+    return m
+
+#: available decode modes for shift estimation (cf. 
+#: :func:`load_shift_reference`)
+DECODE_MODES = ['full', 'reduced']
+#: available shift estimation methods (cf. :func:`prepare_shift_reference`)
+SHIFT_METHODS = ['lk', 'phase']
+
+def default_pyrlevel(method=None):
+    """Default pyramid level for shift estimation
+    
+    Parameters
+    ----------
+    method : str, optional
+        shift estimation method (cf. :attr:`SHIFT_METHODS`), defaults to 
+        `method` in `shift_params` in :mod:`defaults`
+        
+    Returns
+    -------
+    int
+        `phase_pyrlevel` for phase correlation, else `pyrlevel` (cf. 
+        `shift_params` in :mod:`defaults`)
+    """
+    params = defaults['shift_params']
+    if method is None:
+        method = params['method']
+    if method == 'phase':
+        return params['phase_pyrlevel']
+    return params['pyrlevel']
+
+def phase_spectrum(img_arr, window, dft_size):
+    """Spectrum of windowed gray image for phase correlation
+    
+    Parameters
+    ----------
+    img_arr : ndarray
+        gray image, cropped to the size of the window if it is larger
+    window : ndarray
+        window function (e.g. :func:`cv2.createHanningWindow`), float32
+    dft_size : tuple
+        size (rows, cols) of the zero padded DFT (cf. 
+        :func:`cv2.getOptimalDFTSize`)
+        
+    Returns
+    -------
+    ndarray
+        spectrum in CCS packed format (cf. :func:`cv2.dft`), shape 
+        `dft_size`
+    """
+    h = min(window.shape[0], img_arr.shape[0])
+    w = min(window.shape[1], img_arr.shape[1])
+    padded = np.zeros(dft_size, dtype=np.float32)
+    cv2.multiply(img_arr[:h, :w], window[:h, :w], dst=padded[:h, :w], 
+                 dtype=cv2.CV_32F)
+    return cv2.dft(padded)
+
+def phase_correlate_spectra(spectrum, ref_spectrum):
+    """Translation between two images via phase correlation of spectra
+    
+    Same algorithm as :func:`cv2.phaseCorrelate` (normalised cross power 
+    spectrum, peak location refined by weighted centroid of 5x5 
+    neighbourhood), but with precomputed spectra (cf. 
+    :func:`phase_spectrum`), such that the reference spectrum can be reused
+    for many images.
+    
+    Parameters
+    ----------
+    spectrum : ndarray
+        spectrum of image
+    ref_spectrum : ndarray
+        spectrum of reference image
+        
+    Returns
+    -------
+    tuple
+        (tx, ty) translation of image content wrt. reference image
+    float
+        response, sum of phase correlation around peak (close to 1 for a 
+        pure translation of identical images, close to 0 if there is no 
+        correlation)
+    """
+    cross = cv2.mulSpectrums(spectrum, ref_spectrum, 0, conjB=True)
+    corr = cv2.idft(_normalise_ccs(cross), 
+                    flags=cv2.DFT_REAL_OUTPUT | cv2.DFT_SCALE)
+    _, _, _, (x, y) = cv2.minMaxLoc(corr)
+    rows, cols = corr.shape
+    ys, xs = np.arange(y - 2, y + 3), np.arange(x - 2, x + 3)
+    patch = corr.take(ys, axis=0, mode='wrap').take(xs, axis=1, mode='wrap')
+    total = patch.sum()
+    if total > 0:
+        tx = patch.sum(axis=0) @ xs / total
+        ty = patch.sum(axis=1) @ ys / total
+    else:
+        tx, ty = float(x), float(y)
+    # peak positions beyond half the size correspond to negative shifts
+    if tx > cols / 2:
+        tx -= cols
+    if ty > rows / 2:
+        ty -= rows
+    return (float(tx), float(ty)), float(total)
+
+def _normalise_ccs(spectrum):
+    """Divide CCS packed spectrum by its magnitude (inplace)"""
+    eps = np.finfo(np.float32).eps
+    rows, cols = spectrum.shape
+    # complex values of columns 1 ... (cols - 1) // 2 are stored as 
+    # adjacent (re, im) columns, those of the first (and, for an even number
+    # of columns, the last) column as adjacent (re, im) rows
+    num = (cols - 1) // 2
+    pairs = [(spectrum[:, 1:2*num:2], spectrum[:, 2:2*num+1:2])]
+    real_cols = [0, cols - 1] if cols % 2 == 0 else [0]
+    real_rows = [0, rows - 1] if rows % 2 == 0 else [0]
+    num = (rows - 1) // 2
+    for c in real_cols:
+        pairs.append((spectrum[1:2*num:2, c], spectrum[2:2*num+1:2, c]))
+    for re, im in pairs:
+        mag = np.sqrt(re * re + im * im)
+        np.maximum(mag, eps, out=mag)
+        re /= mag
+        im /= mag
+    # remaining entries are real (e.g. DC component)
+    for r in real_rows:
+        for c in real_cols:
+            spectrum[r, c] = 1.0 if spectrum[r, c] >= 0 else -1.0
+    return spectrum
+
+def find_shift_phase(first_gray, second_gray, pyrlevel=None, refine=None, 
+                     refine_roi_size=None):
+    """Find translation between two input images using phase correlation
+    
+    Translation-only alternative to :func:`find_shift_pyr`, which does not
+    rely on trackable feature points (e.g. low texture scenes), but does 
+    not account for rotation.
+    
+    Note
+    ----
+    If shifts of many images are computed wrt. the same reference image, 
+    use :func:`prepare_shift_reference` (with `method="phase"`) and 
+    :func:`find_shift_ref`, which computes the reference spectrum only once.
+    
+    Parameters
+    ----------
+    first_gray : ndarray
+        first image (gray scale, full resolution)
+    second_gray : ndarray
+        second image
+    pyrlevel : int, optional
+        pyramid level on which shift is estimated, defaults to 
+        `phase_pyrlevel` in `shift_params` in :mod:`defaults`
+    refine : bool, optional
+        if True, the shift is refined in a full resolution ROI
+    refine_roi_size : int, optional
+        size of ROI used for refinement
+    
+    Returns
+    -------
+    tuple
+        (dx, dy) shift
+    float
+        rotation angle (always 0)
+    ndarray
+        affine transformation matrix
+    """
+    ref = prepare_shift_reference(first_gray, pyrlevel, refine, 
+                                  refine_roi_size, method='phase')
+    return find_shift_ref(ref, second_gray)
+
+def prepare_shift_reference(ref_gray, pyrlevel=None, refine=None, 
+                            refine_roi_size=None, prescaled=False, 
+                            method=None):
+    """Precompute everything needed from a reference image to find shifts
+    
+    The output can be passed as reference to :func:`find_shift_ref` in 
+    order to find the shifts of many images wrt. the same reference image,
+    without downscaling the reference image and re-detecting the reference
+    feature points for every image. Default settings
+    can be found in `shift_params` in :mod:`defaults`.
+    
+    Parameters
+    ----------
+    ref_gray : ndarray
+        reference image (gray scale, full resolution)
+    pyrlevel : int, optional
+        pyramid level on which shifts are estimated
+    refine : bool, optional
+        if True, shifts are refined in a full resolution ROI
+    refine_roi_size : int, optional
+        size of ROI used for refinement
+    prescaled : bool
+        if True, `ref_gray` was decoded as downscaled image on `pyrlevel` 
+        via :func:`imread_reduced_gray` (cf. :func:`load_shift_reference`).
+        Then, images are decoded in the same way for shift estimation (cf. 
+        :func:`imread_shift_gray`) and refinement is not possible.
+    method : str, optional
+        "lk": feature points are tracked using Lucas-Kanade optical flow 
+        and an affine transformation (translation and rotation) is fitted 
+        (cf. :func:`find_shift`). "phase": translation is retrieved via 
+        phase correlation (cf. :func:`phase_correlate_spectra`), the 
+        windowed reference spectrum is precomputed. Defaults to `method` 
+        in `shift_params` in :mod:`defaults`.
+        
+    Returns
+    -------
+    dict
+        reference information 
+    """
+    params = defaults['shift_params']
+    if method is None:
+        method = params['method']
+    if not method in SHIFT_METHODS:
+        raise ValueError('Invalid shift method {}. Choose from {}'
+                         .format(method, SHIFT_METHODS))
+    if pyrlevel is None:
+        pyrlevel = default_pyrlevel(method)
+    if refine is None:
+        refine = params['refine']
+    prescaled = bool(prescaled and pyrlevel > 0)
+    if prescaled and refine:
+        raise ValueError('Refinement requires full resolution reference')
+    
+    decode = 'reduced' if prescaled else 'full'
+    img = ref_gray if prescaled else pyr_down(ref_gray, pyrlevel)
+    ref = dict(gray=ref_gray,
+               pyrlevel=pyrlevel,
+               decode=decode,
+               img=img,
+               method=method,
+               points=None,
+               refine=bool(refine and pyrlevel > 0),
+               refine_roi_size=refine_roi_size,
+               refine_points=None)
+    if method == 'phase':
+        h, w = img.shape[:2]
+        window = cv2.createHanningWindow((w, h), cv2.CV_32F)
+        dft_size = (cv2.getOptimalDFTSize(h), cv2.getOptimalDFTSize(w))
+        with timing.stage('phase'):
+            ref['spectrum'] = phase_spectrum(img, window, dft_size)
+        ref.update(window=window, dft_size=dft_size)
+    else:
+        ref['points'] = find_good_features_to_track(img)
+    if ref['refine']:
+        ref['refine_points'] = find_refine_points(ref_gray, refine_roi_size)
+    return ref
+
+def load_shift_reference(file_path, pyrlevel=None, refine=None, 
+                         refine_roi_size=None, decode=None, method=None):
+    """Read reference image file and prepare it for shift estimation
+    
+    In decode mode "reduced", the reference image is decoded in the same 
+    way as the images that are aligned to it, since the DCT domain scaling 
+    of the decoder and :func:`pyr_down` use differently centred pixel grids
+    (which would result in a systematic shift of up to 2**pyrlevel/2 
+    pixels).
+    
+    Parameters
+    ----------
+    file_path : str
+        reference image file
+    pyrlevel : int, optional
+        pyramid level on which shifts are estimated
+    refine : bool, optional
+        if True, shifts are refined in a full resolution ROI
+    refine_roi_size : int, optional
+        size of ROI used for refinement
+    decode : str, optional
+        how images are decoded for shift estimation: "full" (full 
+        resolution, then downscaled) or "reduced" (decoded as downscaled 
+        gray image, cf. :func:`imread_reduced_gray`). The latter is much 
+        faster for JPEG files, but not combinable with `refine`. Only 
+        relevant if pyrlevel > 0.
+    method : str, optional
+        shift estimation method (cf. :func:`prepare_shift_reference`)
+        
+    Returns
+    -------
+    dict
+        reference information (cf. :func:`prepare_shift_reference`)
+    """
+    params = defaults['shift_params']
+    if pyrlevel is None:
+        pyrlevel = default_pyrlevel(method)
+    if decode is None:
+        decode = params['decode']
+    if not decode in DECODE_MODES:
+        raise ValueError('Invalid decode mode {}. Choose from {}'
+                         .format(decode, DECODE_MODES))
+    if decode == 'reduced' and pyrlevel > 0:
+        gray = imread_reduced_gray(file_path, pyrlevel)
+        return prepare_shift_reference(gray, pyrlevel, refine, 
+                                       refine_roi_size, prescaled=True,
+                                       method=method)
+    return prepare_shift_reference(to_gray(imread(file_path)), pyrlevel, 
+                                   refine, refine_roi_size, method=method)
+
+def imread_shift_gray(file_path, ref):
+    """Read image file as gray image for shift estimation
+    
+    Parameters
+    ----------
+    file_path : str
+        image file path
+    ref : dict
+        reference (cf. :func:`load_shift_reference`). If its decode mode 
+        is "reduced", the image is decoded directly on the pyramid level of 
+        the reference (cf. :func:`imread_reduced_gray`), else in full 
+        resolution.
+        
+    Returns
+    -------
+    ndarray
+        gray image
+    bool
+        True if image is downscaled (cf. `prescaled` in 
+        :func:`find_shift_ref`)
+    """
+    if ref['decode'] == 'reduced':
+        return imread_reduced_gray(file_path, ref['pyrlevel']), True
+    return to_gray(imread(file_path)), False
+
+def find_shift_ref(ref, second_gray, prescaled=False, **feature_lk_params):
+    """Find shift of input image wrt. precomputed reference 
+    
+    Parameters
+    ----------
+    ref : dict or ndarray
+        output of :func:`prepare_shift_reference` or reference gray image 
+        (then, it is prepared using default settings)
+    second_gray : ndarray
+        second image (gray scale, full resolution)
+    prescaled : bool
+        if True, `second_gray` is already downscaled to the pyramid level 
+        of the reference (e.g. via :func:`imread_shift_gray`)
+    **feature_lk_params
+        additional, optional input keyword args passed to 
+        :func:`compute_flow_lk` (ignored for phase correlation)
+    
+    Returns
+    -------
+    tuple
+        (dx, dy) shift
+    float
+        rotation angle
+    ndarray
+        affine transformation matrix
+    """
+    if not isinstance(ref, dict):
+        ref = prepare_shift_reference(ref)
+    pyrlevel = ref['pyrlevel']
+    
+    img = second_gray if prescaled else pyr_down(second_gray, pyrlevel)
+    if ref.get('method') == 'phase':
+        with timing.stage('phase'):
+            spectrum = phase_spectrum(img, ref['window'], ref['dft_size'])
+            (tx, ty), _ = phase_correlate_spectra(spectrum, ref['spectrum'])
+        m = np.array([[1, 0, tx], [0, 1, ty]], dtype=np.float64)
+    else:
+        _, _, m = find_shift(ref['img'], img,
+                             points_to_track=ref['points'], 
+                             **feature_lk_params)
+    if pyrlevel > 0:
+        m = scale_affine(m, 2**pyrlevel)
+    if ref['refine'] and prescaled:
+        raise ValueError('Refinement requires full resolution image')
+    elif ref['refine']:
+        m = refine_shift_roi(ref['gray'], second_gray, m, 
+                             ref['refine_roi_size'], ref['refine_points'])
+    dx, dy = m[0,2], m[1,2]
+    da = np.arctan2(m[1,0], m[0,0])
+    return ((-dx, -dy), da, m)
+
+def find_shift_pyr(first_gray, second_gray, pyrlevel=None, refine=None, 
+                   refine_roi_size=None, **feature_lk_params):
+    """Find shift between two input images on a downscaled pyramid level
+    
+    Coarse-to-fine version of :func:`find_shift`: the affine transformation
+    is retrieved on the input pyramid level (cf. :func:`pyr_down`), scaled to
+    full resolution and, optionally, refined in a full resolution ROI 
+    (cf. :func:`refine_shift_roi`). Default settings can be found in 
+    `shift_params` in :mod:`defaults`.
+    
+    Note
+    ----
+    If shifts of many images are computed wrt. the same reference image, 
+    use :func:`prepare_shift_reference` and :func:`find_shift_ref`.
+    
+    Parameters
+    ----------
+    first_gray : ndarray
+        first image (gray scale, full resolution)
+    second_gray : ndarray
+        second image
+    pyrlevel : int, optional
+        pyramid level on which shift is estimated
+    refine : bool, optional
+        if True, the shift is refined in a full resolution ROI
+    refine_roi_size : int, optional
+        size of ROI used for refinement
+    **feature_lk_params
+        additional, optional input keyword args passed to 
+        :func:`compute_flow_lk`.
+    
+    Returns
+    -------
+    tuple
+        (dx, dy) shift
+    float
+        rotation angle
+    ndarray
+        affine transformation matrix
+    """
+    ref = prepare_shift_reference(first_gray, pyrlevel, refine, 
+                                  refine_roi_size)
+    return find_shift_ref(ref, second_gray, **feature_lk_params)
+
+def to_homogeneous(m):
+    """Convert 2x3 affine matrix (or stack of matrices) to 3x3
+    
+    Parameters
+    ----------
+    m : ndarray
+        affine matrix of shape `(2, 3)` or stack of shape `(N, 2, 3)`
+        
+    Returns
+    -------
+    ndarray
+        matrix of shape `(3, 3)` or `(N, 3, 3)`
+    """
+    m = np.asarray(m, dtype=np.float64)
+    out = np.zeros(m.shape[:-2] + (3, 3))
+    out[..., :2, :] = m
+    out[..., 2, 2] = 1
+    return out
+
+def chain_transforms(matrices, ref_index=0, anchors=None):
+    """Chain transformations between consecutive images
+    
+    Computes cumulative transformation matrices wrt. a reference image from
+    the transformation matrices between neighbouring images (e.g. 
+    retrieved using :func:`find_shift` for each consecutive image pair). 
+    
+    Parameters
+    ----------
+    matrices : list or ndarray
+        N-1 affine matrices (2x3), where element k transforms image k into 
+        image k+1
+    ref_index : int
+        index of reference image (its cumulative matrix is identity)
+    anchors : dict, optional
+        directly estimated matrices wrt. reference image for some image 
+        indices (keyframes), which replace the chained ones and thus bound
+        the drift of the chain
+        
+    Returns
+    -------
+    ndarray
+        cumulative matrices, shape `(N, 2, 3)`
+    """
+    pairs = to_homogeneous(np.reshape(matrices, (-1, 2, 3)))
+    num = len(pairs) + 1
+    if not -1 < ref_index < num:
+        raise ValueError('Invalid ref_index {} for {} images'
+                         .format(ref_index, num))
+    if anchors is None:
+        anchors = {}
+    cum = np.empty((num, 3, 3))
+    cum[ref_index] = np.eye(3)
+    for k in range(ref_index + 1, num):
+        if k in anchors:
+            cum[k] = to_homogeneous(anchors[k])
+        else:
+            cum[k] = pairs[k - 1] @ cum[k - 1]
+    for k in range(ref_index - 1, -1, -1):
+        if k in anchors:
+            cum[k] = to_homogeneous(anchors[k])
+        else:
+            cum[k] = np.linalg.inv(pairs[k]) @ cum[k + 1]
+    return cum[:, :2, :]
+
+#: available methods for trajectory smoothing (cf. :func:`smooth_trajectory`)
+SMOOTH_METHODS = ['moving_average', 'gaussian', 'savgol']
+
+def smoothing_kernel(window, method='gaussian', polyorder=2):
+    """Get normalised 1D smoothing kernel
+    
+    Parameters
+    ----------
+    window : int
+        kernel length (odd)
+    method : str
+        smoothing method, choose from :attr:`SMOOTH_METHODS`. The standard 
+        deviation of the gaussian kernel is 1/6 of the window length, 
+        Savitzky-Golay coefficients are computed via least squares fit of
+        a polynomial of order `polyorder`.
+    polyorder : int
+        polynomial order (only relevant for method savgol)
+        
+    Returns
+    -------
+    ndarray
+        kernel, sums up to 1
+    """
+    if window < 1 or window % 2 == 0:
+        raise ValueError('Smoothing window needs to be a positive odd '
+                         'integer, got {}'.format(window))
+    x = np.arange(window) - window // 2
+    if method == 'moving_average':
+        kernel = np.ones(window)
+    elif method == 'gaussian':
+        sigma = max(window / 6, 1e-3)
+        kernel = np.exp(-0.5 * (x / sigma)**2)
+    elif method == 'savgol':
+        if not polyorder < window:
+            raise ValueError('polyorder needs to be smaller than window')
+        vander = x[:, None]**np.arange(polyorder + 1)
+        # value of fitted polynomial at window center
+        kernel = np.linalg.pinv(vander)[0]
+    else:
+        raise ValueError('Invalid smoothing method {}. Choose from {}'
+                         .format(method, SMOOTH_METHODS))
+    return kernel / kernel.sum()
+
+def decompose_affine(matrices):
+    """Decompose partial affine matrices into shift, rotation and scale
+    
+    Parameters
+    ----------
+    matrices : list or ndarray
+        partial affine matrices (rotation, uniform scale and translation, cf.
+        :func:`find_affine_partial2d`), shape `(N, 2, 3)`
+        
+    Returns
+    -------
+    ndarray
+        parameters of shape `(N, 4)`: x and y translation, rotation angle 
+        (rad) and scale
+    """
+    m = np.reshape(np.asarray(matrices, dtype=np.float64), (-1, 2, 3))
+    return np.stack([m[:, 0, 2], m[:, 1, 2], 
+                     np.arctan2(m[:, 1, 0], m[:, 0, 0]),
+                     np.hypot(m[:, 0, 0], m[:, 1, 0])], axis=1)
+
+def compose_affine(params):
+    """Compose partial affine matrices (inverse of :func:`decompose_affine`)
+    
+    Parameters
+    ----------
+    params : ndarray
+        parameters of shape `(N, 4)`: x and y translation, rotation angle 
+        (rad) and scale
+        
+    Returns
+    -------
+    ndarray
+        partial affine matrices of shape `(N, 2, 3)`
+    """
+    tx, ty, angle, scale = np.asarray(params, dtype=np.float64).T
+    a, b = scale * np.cos(angle), scale * np.sin(angle)
+    return np.stack([np.stack([a, -b, tx], axis=1),
+                     np.stack([b, a, ty], axis=1)], axis=1)
+
+def smooth_trajectory(matrices, window=None, method=None, polyorder=None):
+    """Smooth camera trajectory
+    
+    The transformation matrices of an image sequence (e.g. computed wrt. a
+    reference image) describe the camera trajectory. This method applies a 
+    low pass filter to the trajectory parameters (cf. 
+    :func:`decompose_affine`), such that only the high frequency shake is 
+    removed when correcting the images (cf. :func:`trajectory_corrections`).
+    The filter is applied to the whole sequence at once, the sequence is 
+    padded with the first and last values at its ends.
+    
+    Parameters
+    ----------
+    matrices : list or ndarray
+        partial affine matrices, shape `(N, 2, 3)`
+    window : int, optional
+        length of smoothing window in number of images (odd). Defaults to 
+        `window` in `smooth_params` in :mod:`defaults`.
+    method : str, optional
+        smoothing method (cf. :func:`smoothing_kernel`), defaults to `method`
+        in `smooth_params` in :mod:`defaults`.
+    polyorder : int, optional
+        polynomial order for method savgol, defaults to `polyorder` in 
+        `smooth_params` in :mod:`defaults`.
+        
+    Returns
+    -------
+    ndarray
+        smoothed matrices, shape `(N, 2, 3)`
+    """
+    params = defaults['smooth_params']
+    if window is None:
+        window = params['window']
+    if method is None:
+        method = params['method']
+    if polyorder is None:
+        polyorder = params['polyorder']
+    kernel = smoothing_kernel(window, method, polyorder)
+    
+    traj = decompose_affine(matrices)
+    num, half = len(traj), window // 2
+    padded = np.pad(traj, ((half, half), (0, 0)), mode='edge')
+    smoothed = np.zeros_like(traj)
+    for i, weight in enumerate(kernel):
+        smoothed += weight * padded[i:i + num]
+    return compose_affine(smoothed)
+
+def trajectory_corrections(matrices, smoothed):
+    """Get correction matrices that move images onto smoothed trajectory
     
+    The corrections are ``C_i = M_i S_i^-1`` (using 3x3 representations, 
+    cf. :func:`to_homogeneous`), where M_i are the estimated and S_i the 
+    smoothed matrices. They follow the same convention as the estimated 
+    matrices and can thus be used in place of them (e.g. in 
+    :func:`shift_image` or :func:`get_crop_matrices`).
+    
+    Parameters
+    ----------
+    matrices : list or ndarray
+        estimated affine matrices, shape `(N, 2, 3)`
+    smoothed : list or ndarray
+        smoothed matrices, shape `(N, 2, 3)` (cf. :func:`smooth_trajectory`)
+        
+    Returns
+    -------
+    ndarray
+        correction matrices, shape `(N, 2, 3)`
+    """
+    m = to_homogeneous(np.reshape(matrices, (-1, 2, 3)))
+    s = to_homogeneous(np.reshape(smoothed, (-1, 2, 3)))
+    return (m @ np.linalg.inv(s))[:, :2, :]
+
+def _get_render_params(interpolation, border_mode):
+    params = defaults['render_params']
+    if interpolation is None:
+        interpolation = params['interpolation']
+    if border_mode is None:
+        border_mode = params['border_mode']
+    return interpolation, border_mode
+
+def _warp(img_arr, m, size, dst, interpolation, border_mode):
+    """Apply transformation matrix (convention of :func:`shift_image`)"""
+    interpolation, border_mode = _get_render_params(interpolation, 
+                                                    border_mode)
+    if dst is not None and (dst.shape[:2] != size[::-1] or 
+                            dst.shape[2:] != img_arr.shape[2:] or 
+                            dst.dtype != img_arr.dtype):
+        raise ValueError('Output buffer dst has invalid shape or dtype')
+    if m.shape == (2, 3):
+        # shifts are corrected, i.e. translation is applied inversely
+        m = np.array(m, dtype=np.float64)
+        m[:, 2] = -m[:, 2]
+        with timing.stage('warp'):
+            return cv2.warpAffine(img_arr, m, size, dst=dst, 
+                                  flags=interpolation, 
+                                  borderMode=border_mode)
+    elif m.shape == (3, 3):
+        with timing.stage('warp'):
+            return cv2.warpPerspective(img_arr, m, size, dst=dst, 
+                                       flags=interpolation, 
+                                       borderMode=border_mode)
+    raise ValueError('Invalid input for transormation matrix m')
+
+def shift_image(img_arr, m=None, dst=None, interpolation=None, 
+                border_mode=None):
+    """Shift image based on transformation matrix
+    
+    The input matrix is not modified.
+    
+    Parameters
+    ----------
+    img_arr : ndarray
+        input image
+    m : ndarray, optional
+        transformation matrix (2x3 affine, e.g. from :func:`find_shift`, or
+        3x3 homography). If None, the image is not shifted.
+    dst : ndarray, optional
+        preallocated output buffer (same shape and dtype as input image), 
+        can be used to avoid allocations when shifting many images
+    interpolation : int, optional
+        OpenCV interpolation flag (e.g. `cv2.INTER_LINEAR`), defaults to 
+        `interpolation` in `render_params` in :mod:`defaults`
+    border_mode : int, optional
+        OpenCV border mode (e.g. `cv2.BORDER_CONSTANT`), defaults to 
+        `border_mode` in `render_params` in :mod:`defaults`
+        
+    Returns
+    -------
+    ndarray
+        shifted image (`dst` if provided)
+    """
     if m is None: # no shift
-        m = np.zeros((2,3))
-        m[0,0] = 1
-        m[1,1] = 1
-    sh =  img_arr.shape   
-    sh = (sh[1], sh[0])
+        m = np.eye(2, 3)
+    sh = img_arr.shape
+    return _warp(img_arr, np.asarray(m), (sh[1], sh[0]), dst, 
+                 interpolation, border_mode)
+
+def shift_crop_image(img_arr, m, crop, dst=None, interpolation=None, 
+                     border_mode=None):
+    """Shift image and crop result in one step
+    
+    Equivalent to ``shift_image(img_arr, m)[y0:y1, x0:x1]``, but the crop 
+    offset is folded into the transformation matrix, such that only the 
+    output crop is interpolated and the full size shifted image is never 
+    created. The input matrix is not modified.
+    
+    Parameters
+    ----------
+    img_arr : ndarray
+        input image
+    m : ndarray
+        transformation matrix (2x3 affine or 3x3 homography, same 
+        convention as in :func:`shift_image`)
+    crop : tuple
+        output ROI (x0, x1, y0, y1), e.g. from :func:`get_crop_matrices`
+    dst : ndarray, optional
+        preallocated output buffer of crop size (and same number of 
+        channels and dtype as input image)
+    interpolation : int, optional
+        OpenCV interpolation flag (cf. :func:`shift_image`)
+    border_mode : int, optional
+        OpenCV border mode (cf. :func:`shift_image`)
+        
+    Returns
+    -------
+    ndarray
+        shifted and cropped image (`dst` if provided)
+    """
+    x0, x1, y0, y1 = crop
+    size = (x1 - x0, y1 - y0)
+    m = np.asarray(m, dtype=np.float64)
     if m.shape == (2, 3):
-        m[0,2] = -m[0,2] 
-        m[1,2] = -m[1,2]
-        return cv2.warpAffine(img_arr, m, sh)
-    elif m.shape == (3,3):
-        return cv2.warpPerspective(img_arr, m, sh)
-    else:
-        raise ValueError('Invalid input for transormation matrix m')
+        # crop offset, translation is negated in _warp
+        m = m + [[0, 0, x0], [0, 0, y0]]
+    elif m.shape == (3, 3):
+        offs = np.array([[1, 0, -x0], [0, 1, -y0], [0, 0, 1]], 
+                        dtype=np.float64)
+        m = offs @ m
+    return _warp(img_arr, m, size, dst, interpolation, border_mode)
 
 def crop_shift(img, shift, cv=True):
     raise NotImplementedError('This method needs review')
@@ -494,6 +1449,137 @@ def get_crop(dx, dy, w0, h0):
         
     return (x0, x1, y0, y1)
 
+def transform_corners(matrices, w0, h0):
+    """Get location of image corners in transformed images
+    
+    The transformation is applied as in :func:`shift_image`, that is, a 
+    point p in the original image is located at ``A p - t`` in the 
+    transformed image, where A and t are the linear and translational part 
+    of the affine matrix.
+    
+    Parameters
+    ----------
+    matrices : list or ndarray
+        affine transformation matrices, shape `(N, 2, 3)` (or `(2, 3)`)
+    w0 : int
+        original image width
+    h0 : int
+        original image height
+        
+    Returns
+    -------
+    ndarray
+        corner coordinates (x, y) of shape `(N, 4, 2)`, corners are sorted 
+        top left, top right, bottom right, bottom left
+    """
+    m = np.reshape(np.asarray(matrices, dtype=np.float64), (-1, 2, 3))
+    corners = np.array([[0, 0], [w0 - 1, 0], [w0 - 1, h0 - 1], [0, h0 - 1]], 
+                       dtype=np.float64)
+    return np.einsum('nij,kj->nki', m[:, :, :2], corners) - m[:, None, :, 2]
+
+def get_crop_matrices(matrices, w0, h0):
+    """Get crop ROI that is valid for all transformed images
+    
+    Vectorised version of :func:`get_crop` that also accounts for rotation
+    and scaling. The four corners of all images are transformed at once
+    (cf. :func:`transform_corners`) and the crop is bounded by the innermost
+    transformed image edges, such that it contains no black borders in any 
+    of the images.
+    
+    Parameters
+    ----------
+    matrices : list or ndarray
+        affine transformation matrices, shape `(N, 2, 3)`
+    w0 : int
+        original image width
+    h0 : int
+        original image height
+        
+    Raises
+    ------
+    ValueError
+        if no valid crop exists (i.e. transforms are too large)
+        
+    Returns
+    -------
+    tuple
+        4-element tuple containing ROI: (x0, x1, y0, y1), where x1 and y1 are
+        exclusive (i.e. the crop is ``img[y0:y1, x0:x1]``)
+    """
+    c = transform_corners(matrices, w0, h0)
+    # small tolerance such that numerical noise does not cost a pixel
+    tol = 1e-6
+    left = max(c[:, [0, 3], 0].max(), 0)
+    right = min(c[:, [1, 2], 0].min(), w0 - 1)
+    top = max(c[:, [0, 1], 1].max(), 0)
+    bottom = min(c[:, [2, 3], 1].min(), h0 - 1)
+    x0, x1 = int(np.ceil(left - tol)), int(np.floor(right + tol)) + 1
+    y0, y1 = int(np.ceil(top - tol)), int(np.floor(bottom + tol)) + 1
+    if x1 <= x0 or y1 <= y0:
+        raise ValueError('No valid crop exists for input transformations')
+    return (x0, x1, y0, y1)
+
+def transform_stats(matrices):
+    """Compute summary statistics of transformation matrices
+    
+    Parameters
+    ----------
+    matrices : list or ndarray
+        affine transformation matrices, shape `(N, 2, 3)`
+        
+    Returns
+    -------
+    dict
+        number of images (`num`), maximum absolute shift (`max_shift`, 
+        `max_dx`, `max_dy`) in pixels, maximum absolute rotation in degrees 
+        (`max_rotation`) and RMS of the shift differences between 
+        neighbouring images (`jitter_rms`) in pixels
+    """
+    m = np.reshape(np.asarray(matrices, dtype=np.float64), (-1, 2, 3))
+    shifts = -m[:, :, 2]
+    angles = np.degrees(np.arctan2(m[:, 1, 0], m[:, 0, 0]))
+    jitter = np.diff(shifts, axis=0)
+    jitter_rms = np.sqrt((jitter**2).sum(axis=1).mean()) if len(m) > 1 else 0
+    return dict(num=len(m),
+                max_shift=float(np.hypot(*shifts.T).max()),
+                max_dx=float(np.abs(shifts[:, 0]).max()),
+                max_dy=float(np.abs(shifts[:, 1]).max()),
+                max_rotation=float(np.abs(angles).max()),
+                jitter_rms=float(jitter_rms))
+    
+def get_crop_margin(w0, h0, margin):
+    """Get crop ROI based on a fixed margin at each image border
+    
+    Can be used to define the output crop before any shifts are known (e.g.
+    when images are deshaked in a single pass).
+    
+    Parameters
+    ----------
+    w0 : int
+        original image width
+    h0 : int
+        original image height
+    margin : float
+        margin that is cropped at each border, either as fraction of the 
+        image width / height (if < 1) or in pixels.
+        
+    Returns
+    -------
+    tuple
+        4-element tuple containing ROI: (x0, x1, y0, y1), x1 and y1 are 
+        exclusive (cf. :func:`get_crop_matrices`)
+    """
+    if margin < 0:
+        raise ValueError('Invalid input for margin: {}'.format(margin))
+    if margin < 1:
+        mx, my = int(np.ceil(margin * w0)), int(np.ceil(margin * h0))
+    else:
+        mx = my = int(np.ceil(margin))
+    if not (2 * mx < w0 and 2 * my < h0):
+        raise ValueError('Margin {} exceeds image size ({}x{})'
+                         .format(margin, w0, h0))
+    return (mx, w0 - mx, my, h0 - my)
+
 # Sum it up: methods that do everything from reading of both images to deshaking them
 def deshake(img1, img2, crop=False):
     
@@ -0,0 +1,504 @@
+# -*- coding: utf-8 -*-
+#
+# This module is part of pylapsy.
+# It is licensed under a GPL-3.0 license, for details see LICENSE file.
+#
+# Author: Jonas Gliß
+# Copyright (C) 2019 Jonas Gliss (jonasgliss@gmail.com)
+# GitHub: jgliss
+# Email: jonasgliss@gmail.com
+"""
+Output writers for processed images
+"""
+import os
+import queue
+import shutil
+import subprocess
+import threading
+from collections import deque
+
+import cv2
+
+from pylapsy import utils, print_log, timing
+
+class EncodeParams(object):
+    """Encoding settings for output images
+
+    Settings that are None are not passed to :func:`cv2.imwrite`, that is,
+    the OpenCV defaults are used. Only the settings relevant for the output
+    file format (derived from the file extension) are applied.
+
+    Parameters
+    ----------
+    quality : int, optional
+        JPEG quality (0 - 100)
+    progressive : bool, optional
+        if True, progressive JPEG files are written
+    optimize : bool, optional
+        if True, JPEG Huffman tables are optimised (smaller files, slower)
+    chroma_subsampling : str, optional
+        JPEG chroma subsampling, choose from :attr:`CHROMA_SUBSAMPLING`
+        (requires OpenCV >= 4.5.5, ignored otherwise)
+    png_compression : int, optional
+        PNG compression level (0 - 9), low values are faster
+    tiff_compression : str, optional
+        TIFF compression, choose from keys of :attr:`TIFF_COMPRESSION`
+    ext : str, optional
+        output file format (e.g. ".png"). If None, the format of the input
+        file is used.
+    """
+    #: available chroma subsampling settings for JPEG
+    CHROMA_SUBSAMPLING = ['444', '422', '420', '411', '440']
+    #: available TIFF compressions (libtiff compression codes)
+    TIFF_COMPRESSION = dict(none=1, lzw=5, deflate=8)
+
+    def __init__(self, quality=None, progressive=None, optimize=None,
+                 chroma_subsampling=None, png_compression=None,
+                 tiff_compression=None, ext=None):
+        if quality is not None and not 0 <= quality <= 100:
+            raise ValueError('JPEG quality needs to be between 0 and 100')
+        if png_compression is not None and not 0 <= png_compression <= 9:
+            raise ValueError('PNG compression needs to be between 0 and 9')
+        if (chroma_subsampling is not None and
+            not chroma_subsampling in self.CHROMA_SUBSAMPLING):
+            raise ValueError('Invalid chroma subsampling {}. Choose from {}'
+                             .format(chroma_subsampling,
+                                     self.CHROMA_SUBSAMPLING))
+        if (tiff_compression is not None and
+            not tiff_compression in self.TIFF_COMPRESSION):
+            raise ValueError('Invalid TIFF compression {}. Choose from {}'
+                             .format(tiff_compression,
+                                     list(self.TIFF_COMPRESSION)))
+        if ext is not None and not ext.startswith('.'):
+            ext = '.{}'.format(ext)
+        self.quality = quality
+        self.progressive = progressive
+        self.optimize = optimize
+        self.chroma_subsampling = chroma_subsampling
+        self.png_compression = png_compression
+        self.tiff_compression = tiff_compression
+        self.ext = ext
+
+    @classmethod
+    def fast(cls, ext='.png'):
+        """Settings for fast, low compression intermediate files
+
+        Suitable if output images are only consumed by another tool (e.g. a
+        video encoder).
+
+        Parameters
+        ----------
+        ext : str
+            output file format (.png or .tif)
+
+        Returns
+        -------
+        EncodeParams
+        """
+        return cls(png_compression=1, tiff_compression='none', ext=ext)
+
+    @classmethod
+    def from_input(cls, val):
+        """Create instance from flexible input
+
+        Parameters
+        ----------
+        val : EncodeParams or dict or str, optional
+            None (OpenCV defaults), keyword args (dict), "fast" (cf.
+            :func:`fast`) or an instance of this class (returned as is)
+
+        Returns
+        -------
+        EncodeParams
+        """
+        if val is None:
+            return cls()
+        elif isinstance(val, EncodeParams):
+            return val
+        elif isinstance(val, dict):
+            return cls(**val)
+        elif val == 'fast':
+            return cls.fast()
+        raise ValueError('Invalid input for EncodeParams: {}'.format(val))
+
+    def output_path(self, path):
+        """Get output file path (with output file extension)
+
+        Parameters
+        ----------
+        path : str
+            file path
+
+        Returns
+        -------
+        str
+            file path with extension :attr:`ext` (if specified)
+        """
+        if self.ext is None:
+            return path
+        return os.path.splitext(path)[0] + self.ext
+
+    def get_flags(self, path):
+        """Get encoding flags for :func:`cv2.imwrite`
+
+        Parameters
+        ----------
+        path : str
+            output file path (the file extension defines which settings are
+            relevant)
+
+        Returns
+        -------
+        list
+            flags and values, e.g. `[cv2.IMWRITE_JPEG_QUALITY, 90]`
+        """
+        ext = os.path.splitext(path)[1].lower()
+        flags = []
+        if ext in ('.jpg', '.jpeg'):
+            if self.quality is not None:
+                flags.extend([cv2.IMWRITE_JPEG_QUALITY, int(self.quality)])
+            if self.progressive is not None:
+                flags.extend([cv2.IMWRITE_JPEG_PROGRESSIVE,
+                              int(self.progressive)])
+            if self.optimize is not None:
+                flags.extend([cv2.IMWRITE_JPEG_OPTIMIZE, int(self.optimize)])
+            if self.chroma_subsampling is not None:
+                flag = getattr(cv2, 'IMWRITE_JPEG_SAMPLING_FACTOR', None)
+                if flag is None:
+                    print_log.warning('Chroma subsampling is not supported '
+                                      'by this OpenCV version, ignoring it')
+                else:
+                    val = getattr(cv2, 'IMWRITE_JPEG_SAMPLING_FACTOR_{}'
+                                  .format(self.chroma_subsampling))
+                    flags.extend([flag, val])
+        elif ext == '.png':
+            if self.png_compression is not None:
+                flags.extend([cv2.IMWRITE_PNG_COMPRESSION,
+                              int(self.png_compression)])
+        elif ext in ('.tif', '.tiff'):
+            if self.tiff_compression is not None:
+                flags.extend([cv2.IMWRITE_TIFF_COMPRESSION,
+                              self.TIFF_COMPRESSION[self.tiff_compression]])
+        return flags
+
+    def __repr__(self):
+        vals = ', '.join('{}={}'.format(k, v) for k, v in
+                         self.__dict__.items() if v is not None)
+        return 'EncodeParams({})'.format(vals)
+
+class ImageWriter(object):
+    """Write images in background threads
+
+    Images are passed to a pool of writer threads via a bounded queue, such
+    that encoding and writing of output images runs concurrently with the
+    processing of the next images, while the number of images held in
+    memory is limited. Can be used as context manager (:func:`close` is
+    called on exit).
+
+    Parameters
+    ----------
+    numworkers : int
+        number of writer threads
+    maxqueue : int, optional
+        maximum number of queued images, :func:`write` blocks if the queue is
+        full. Defaults to twice the number of writer threads.
+    params : EncodeParams or dict or str, optional
+        encoding settings (cf. :func:`EncodeParams.from_input`)
+    """
+    def __init__(self, numworkers=2, maxqueue=None, params=None):
+        if numworkers < 1:
+            raise ValueError('Need at least one writer thread')
+        if maxqueue is None:
+            maxqueue = 2 * numworkers
+        self.params = EncodeParams.from_input(params)
+        self.num_written = 0
+        self._queue = queue.Queue(maxsize=maxqueue)
+        self._errors = []
+        self._lock = threading.Lock()
+        self._closed = False
+        self._threads = [threading.Thread(target=self._run, daemon=True)
+                         for _ in range(numworkers)]
+        for thread in self._threads:
+            thread.start()
+
+    def write(self, img_arr, path):
+        """Queue image for writing
+
+        The image array is written asynchronously and must thus not be
+        modified after calling this method.
+
+        Parameters
+        ----------
+        img_arr : ndarray
+            image data
+        path : str
+            output file path
+
+        Raises
+        ------
+        ValueError
+            if writer is already closed
+        """
+        if self._closed:
+            raise ValueError('ImageWriter is closed')
+        # stage durations are assigned to the frame of the calling thread
+        self._queue.put((img_arr, path, timing.current_frame()))
+
+    def close(self):
+        """Wait until all queued images are written and stop threads
+
+        Raises
+        ------
+        IOError
+            if any of the images could not be written
+        """
+        if self._closed:
+            return
+        self._closed = True
+        for _ in self._threads:
+            self._queue.put(None)
+        for thread in self._threads:
+            thread.join()
+        if len(self._errors) > 0:
+            raise IOError('Failed to write {} images. First error: {}'
+                          .format(len(self._errors), repr(self._errors[0])))
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            img_arr, path, frame = item
+            try:
+                with timing.frame(frame):
+                    ok = utils.imsave(img_arr, path, self.params)
+                if not ok:
+                    raise IOError('cv2.imwrite failed for {}'.format(path))
+                with self._lock:
+                    self.num_written += 1
+            except Exception as e:
+                self._errors.append(e)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+class VideoWriter(object):
+    """Encode frames into a video file
+
+    Frames can be passed in arbitrary order (e.g. from parallel workers)
+    and are fed in order to a single encoder, either
+    :class:`cv2.VideoWriter` or an ffmpeg subprocess (raw frames are piped
+    to its stdin), which runs in a dedicated thread. Frames that arrive 
+    ahead of the next frame to be encoded are held in a bounded reorder 
+    buffer: :func:`write` blocks if a frame is more than `maxbuffer` frames
+    ahead of the last encoded frame. Can be used as context manager 
+    (:func:`close` is called on exit).
+
+    Parameters
+    ----------
+    path : str
+        output video file
+    fps : float
+        frame rate
+    codec : str, optional
+        FourCC code (OpenCV backend, defaults to "MJPG" for .avi files and
+        "mp4v" else) or ffmpeg encoder name (ffmpeg backend, defaults to
+        "libx264")
+    size : tuple, optional
+        output frame size (width, height). If None, the size of the first
+        frame is used. Frames of different size are resized.
+    backend : str
+        "opencv", "ffmpeg" or "auto" (ffmpeg if available, else OpenCV)
+    maxbuffer : int
+        maximum number of frames held in the reorder buffer
+    """
+    #: available encoder backends
+    BACKENDS = ['auto', 'opencv', 'ffmpeg']
+
+    def __init__(self, path, fps=24, codec=None, size=None, backend='auto',
+                 maxbuffer=32):
+        if not backend in self.BACKENDS:
+            raise ValueError('Invalid backend {}. Choose from {}'
+                             .format(backend, self.BACKENDS))
+        if maxbuffer < 1:
+            raise ValueError('Reorder buffer needs to hold at least one frame')
+        if backend == 'auto':
+            backend = 'ffmpeg' if shutil.which('ffmpeg') else 'opencv'
+        elif backend == 'ffmpeg' and not shutil.which('ffmpeg'):
+            raise IOError('ffmpeg executable not found')
+        if size is not None and backend == 'ffmpeg':
+            size = (size[0] // 2 * 2, size[1] // 2 * 2)
+        self.path = path
+        self.fps = fps
+        self.codec = codec
+        self.size = size
+        self.backend = backend
+        self.maxbuffer = maxbuffer
+        self.num_written = 0
+        self._next = 0 # next frame index that is passed to the encoder
+        self._done = 0 # number of frames processed by the encoder
+        self._buffer = {}
+        self._ready = deque()
+        self._errors = []
+        self._cond = threading.Condition()
+        self._encoder = None
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def write(self, index, frame):
+        """Add frame to video
+
+        Parameters
+        ----------
+        index : int
+            frame index (0 for first frame). Each index needs to be written
+            exactly once.
+        frame : ndarray
+            BGR or gray image (uint8). Must not be modified after calling
+            this method.
+
+        Raises
+        ------
+        ValueError
+            if writer is already closed or frame index was already written
+        """
+        with self._cond:
+            if self._closed:
+                raise ValueError('VideoWriter is closed')
+            if index < self._next or index in self._buffer:
+                raise ValueError('Frame {} was already written'.format(index))
+            # the encoder thread progresses independently, so this cannot 
+            # block forever as long as all frames are eventually written
+            while (index - self._done >= self.maxbuffer and
+                   not self._closed):
+                self._cond.wait()
+            if self._closed:
+                raise ValueError('VideoWriter was closed while waiting for '
+                                 'frame {}'.format(self._next))
+            # only reordering happens here, encoding in the encoder thread
+            self._buffer[index] = frame
+            while self._next in self._buffer:
+                self._ready.append((self._next, 
+                                    self._buffer.pop(self._next)))
+                self._next += 1
+            self._cond.notify_all()
+
+    def close(self):
+        """Encode remaining buffered frames and finalise video file
+
+        Frames that are missing in the sequence are skipped (with a warning).
+
+        Raises
+        ------
+        IOError
+            if the encoder fails
+        """
+        with self._cond:
+            if self._closed:
+                return
+            self._closed = True
+            if len(self._buffer) > 0:
+                print_log.warning('Missing frames in video {}, encoding {} '
+                                  'remaining frames'
+                                  .format(self.path, len(self._buffer)))
+                for index in sorted(self._buffer):
+                    self._ready.append((index, self._buffer.pop(index)))
+            self._cond.notify_all()
+        self._thread.join()
+        if len(self._errors) > 0:
+            if self._encoder is not None and self.backend == 'ffmpeg':
+                self._encoder.kill()
+            raise IOError('Failed to encode {} frames. First error: {}'
+                          .format(len(self._errors), repr(self._errors[0])))
+        if self._encoder is None:
+            print_log.warning('No frames written, {} was not created'
+                              .format(self.path))
+        elif self.backend == 'opencv':
+            self._encoder.release()
+        else:
+            self._encoder.stdin.close()
+            if self._encoder.wait() != 0:
+                raise IOError('ffmpeg failed to encode {} (exit code {})'
+                              .format(self.path, self._encoder.returncode))
+        print_log.info('Saved video {} ({} frames)'
+                       .format(self.path, self.num_written))
+
+    def _open(self, frame):
+        if self.size is None:
+            h, w = frame.shape[:2]
+            if self.backend == 'ffmpeg':
+                # yuv420p requires even frame dimensions
+                w, h = w // 2 * 2, h // 2 * 2
+            self.size = (w, h)
+        w, h = self.size
+        if self.backend == 'opencv':
+            codec = self.codec
+            if codec is None:
+                ext = os.path.splitext(self.path)[1].lower()
+                codec = 'MJPG' if ext == '.avi' else 'mp4v'
+            encoder = cv2.VideoWriter(self.path,
+                                      cv2.VideoWriter_fourcc(*codec),
+                                      self.fps, (w, h))
+            if not encoder.isOpened():
+                raise IOError('Failed to open video file {} with codec {}'
+                              .format(self.path, codec))
+        else:
+            codec = 'libx264' if self.codec is None else self.codec
+            cmd = [shutil.which('ffmpeg'), '-y', '-loglevel', 'error',
+                   '-f', 'rawvideo', '-pix_fmt', 'bgr24',
+                   '-s', '{}x{}'.format(w, h), '-r', str(self.fps),
+                   '-i', '-', '-c:v', codec, '-pix_fmt', 'yuv420p',
+                   self.path]
+            encoder = subprocess.Popen(cmd, stdin=subprocess.PIPE)
+        self._encoder = encoder
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._ready and not self._closed:
+                    self._cond.wait()
+                if not self._ready:
+                    return
+                index, frame = self._ready.popleft()
+            try:
+                self._encode(index, frame)
+                ok = True
+            except Exception as e:
+                self._errors.append(e)
+                ok = False
+            with self._cond:
+                self._done += 1
+                if ok:
+                    self.num_written += 1
+                self._cond.notify_all()
+
+    def _encode(self, index, frame):
+        # frames are keyed by index, since the file name is not known
+        with timing.frame(index), timing.stage('video'):
+            self._encode_frame(frame)
+
+    def _encode_frame(self, frame):
+        if self._encoder is None:
+            self._open(frame)
+        if frame.ndim == 2:
+            frame = cv2.cvtColor(frame, cv2.COLOR_GRAY2BGR)
+        if frame.shape[1::-1] != self.size:
+            frame = cv2.resize(frame, self.size, interpolation=cv2.INTER_AREA)
+        if self.backend == 'opencv':
+            self._encoder.write(frame)
+        else:
+            try:
+                self._encoder.stdin.write(frame.tobytes())
+            except BrokenPipeError:
+                raise IOError('ffmpeg terminated while encoding {}'
+                              .format(self.path))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()